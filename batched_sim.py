@@ -0,0 +1,155 @@
+import unittest
+import random
+
+import numpy as np
+
+from compiled_net import Population
+from track import SENSOR_ANGLES, SENSOR_LENGTHS, Track
+
+
+class BatchedSimulation:
+
+    def __init__(self, track, networks, position, mass=10, acceleration_force_max=20,
+                 agility_degrees_max=200, max_steps=3000, sensor_table=None, time_delta_seconds=0.01,
+                 substeps=1, control_interval=1):
+        if isinstance(networks, Population):
+            self.population = networks
+        else:
+            self.population = Population.from_networks(networks)
+
+        self.track = Track.from_track_data(track)
+        self.track_granularity_m = self.track.track_granularity_m
+        self.time_delta_seconds = time_delta_seconds
+        self.substeps = substeps
+        self.control_interval = control_interval
+        self.mass = mass
+        self.acceleration_force_max = acceleration_force_max
+        self.agility_degrees_max = agility_degrees_max
+        self.max_steps = max_steps
+        self.sensor_table = sensor_table
+
+        count = len(self.population)
+        self.positions = np.tile(np.array([position.x, position.y], dtype=np.float64), (count, 1))
+        self.velocities = np.zeros((count, 2))
+        self.force_angles = np.zeros(count)
+        self.force_lengths = np.zeros(count)
+
+        self.collisions = np.zeros(count, dtype=bool)
+        self.steps = np.zeros(count, dtype=np.int64)
+
+    def calculate_time_derivatives(self, active):
+        # semi implicit Euler like the default plane integrator
+        radians = np.radians(self.force_angles[active])
+        lengths = self.force_lengths[active]
+        forces = np.stack([np.sin(radians) * lengths, np.cos(radians) * lengths], axis=1)
+
+        time_delta_seconds = self.time_delta_seconds / self.substeps
+        velocities = self.velocities[active]
+        positions = self.positions[active]
+        for _ in range(0, self.substeps):
+            velocities = np.where(forces != 0, velocities + ((forces / self.mass) * time_delta_seconds), velocities)
+            positions = positions + (velocities * time_delta_seconds)
+        self.velocities[active] = velocities
+        self.positions[active] = positions
+
+    def calculate_sensor_data(self, active):
+        if self.sensor_table is not None:
+            return self.sensor_table.lookup(self.positions[active], self.force_angles[active])
+
+        # every ray of every car marched at once, the reading is the first
+        # length that hits a wall or 20 when nothing is hit
+        radians = np.radians(self.force_angles[active][:, np.newaxis] + SENSOR_ANGLES)
+        offsets_x = np.sin(radians)[:, :, np.newaxis] * SENSOR_LENGTHS
+        offsets_y = np.cos(radians)[:, :, np.newaxis] * SENSOR_LENGTHS
+
+        positions = self.positions[active]
+        cells_x = np.floor((offsets_x + positions[:, 0, np.newaxis, np.newaxis]) / self.track_granularity_m)
+        cells_y = np.floor((offsets_y + positions[:, 1, np.newaxis, np.newaxis]) / self.track_granularity_m)
+        walls = self.track.walls(cells_x, cells_y)
+
+        first_wall = np.where(walls.any(axis=2), walls.argmax(axis=2), len(SENSOR_LENGTHS) - 1)
+        return SENSOR_LENGTHS[first_wall]
+
+    def apply_object_actions(self, active, population):
+        sensor_data = self.calculate_sensor_data(active)
+        turns, accelerations = population.decide_actions(sensor_data)
+        self.force_lengths[active] = self.acceleration_force_max * accelerations
+        self.force_angles[active] = self.force_angles[active] + (self.agility_degrees_max * turns)
+
+    def detect_collisions(self, active):
+        return self.track.walls_at(self.positions[active])
+
+    def simulate(self):
+        active = np.flatnonzero(~self.collisions)
+        population = self.population.subset(active)
+
+        for step_number in range(0, self.max_steps):
+            if len(active) == 0:
+                break
+
+            self.calculate_time_derivatives(active)
+            if step_number % self.control_interval == 0:
+                self.apply_object_actions(active, population)
+            is_collision = self.detect_collisions(active)
+
+            self.collisions[active[is_collision]] = True
+            self.steps[active[~is_collision]] += 1
+
+            if is_collision.any():
+                active = active[~is_collision]
+                population = population.subset(~is_collision)
+
+        return [(bool(collision), int(steps)) for collision, steps in zip(self.collisions, self.steps)]
+
+
+class TestBatchedSimulation(unittest.TestCase):
+
+    def test_matches_object_simulation(self):
+        from neural_net import Network
+        from physics_2d import (
+            load_track_data_from_image, PhysicalPlaneWithTrack, Simulation, Car,
+            CarNeuralControlManager, Vector2D
+        )
+
+        random.seed(6)
+        track = load_track_data_from_image('tracks/1.png')
+        networks = [Network(5, 3, 15, 2) for _ in range(0, 12)]
+        for network in networks[6:]:
+            for neuron in network.all_neurons:
+                for connection in neuron.connections:
+                    connection.strength = connection.strength * 0.3
+
+        batched = BatchedSimulation(track, networks, Vector2D(2, 4))
+        results = batched.simulate()
+
+        for index, network in enumerate(networks):
+            plane = PhysicalPlaneWithTrack(track)
+            car = Car(10, 20, 200, CarNeuralControlManager(network))
+            plane.add_physical_object(car, position=Vector2D(2, 4))
+            self.assertEqual(results[index], Simulation(plane).simulate())
+
+            final_position = plane.physical_objects[0][1]
+            self.assertEqual(batched.positions[index, 0], final_position.x)
+            self.assertEqual(batched.positions[index, 1], final_position.y)
+
+    def test_sensor_table(self):
+        from neural_net import Network
+        from physics_2d import load_track_data_from_image, Vector2D
+        from track import SensorTable
+
+        random.seed(8)
+        track = load_track_data_from_image('tracks/1.png')
+        table = SensorTable.from_track(track, angle_resolution_degrees=15)
+        batched = BatchedSimulation(track, [Network(5, 3, 15, 2) for _ in range(0, 4)], Vector2D(2, 4),
+                                    max_steps=50, sensor_table=table)
+        active = np.arange(0, 4)
+        batched.force_angles[:] = [0, 20, 100, -200]
+        self.assertEqual(
+            batched.calculate_sensor_data(active).tolist(),
+            table.lookup(batched.positions, batched.force_angles).tolist()
+        )
+        self.assertEqual(len(batched.simulate()), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,361 @@
+import unittest
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import multiprocessing
+
+import numpy as np
+
+from physics_2d import (
+    PhysicalPlane, PhysicalPlaneWithTrack, PhysicalObject, Car, GeometricVector2D, Vector2D,
+    Simulation, CarNeuralControlManager, CarCompiledControlManager, SharedTrackPlane, SharedSimulation,
+)
+from neural_net import Network
+from compiled_net import CompiledNetwork, Population
+from quantized import QuantizedNetwork
+from pruning import SparseNetwork, prune_by_magnitude
+from batched_sim import BatchedSimulation
+from track import load_track, load_sensor_table
+
+
+TRACK_PATH = 'tracks/1.png'
+START_POSITION = (2, 4)
+BENCHMARK_VERSION = 1
+
+
+class CarConstantControlManager:
+
+    def __init__(self, turn=0.01, acceleration=0.5):
+        self.actions = (turn, acceleration)
+
+    def decide_actions(self, inputs):
+        return self.actions
+
+
+def measure(operation, calls, warmup=None, ops_per_call=1, setup=None):
+    # every call timed on its own, latencies are per call and ops/s counts
+    # ops_per_call for calls that work on a whole batch. setup runs before
+    # every call outside of the timed part.
+    if warmup is None:
+        warmup = max(1, calls // 10)
+    for _ in range(0, warmup):
+        if setup is not None:
+            setup()
+        operation()
+
+    latencies = np.empty(calls)
+    for index in range(0, calls):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        operation()
+        latencies[index] = time.perf_counter() - started
+
+    total = latencies.sum()
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e6
+    return {
+        'calls': calls,
+        'ops_per_second': calls * ops_per_call / total if total > 0 else float('inf'),
+        'mean_us': total / calls * 1e6,
+        'p50_us': p50,
+        'p90_us': p90,
+        'p99_us': p99,
+    }
+
+
+def random_networks(count, seed, shape=(5, 3, 15, 2)):
+    random.seed(seed)
+    return [Network(*shape) for _ in range(0, count)]
+
+
+def car_on_track(control_manager, track, sensor_table=None):
+    plane = PhysicalPlaneWithTrack(track, sensor_table=sensor_table)
+    car = Car(10, 20, 200, control_manager)
+    plane.add_physical_object(car, position=Vector2D(*START_POSITION))
+    return plane, car
+
+
+def benchmark_physics_steps(objects=10, steps=20000, seed=0):
+    # time derivatives only, the integration part of every simulation step
+    random.seed(seed)
+    plane = PhysicalPlane()
+    for _ in range(0, objects):
+        thing = PhysicalObject(10)
+        thing.apply_force(GeometricVector2D(random.uniform(0, 20), random.uniform(0, 360)))
+        plane.add_physical_object(thing, Vector2D(random.uniform(0, 50), random.uniform(0, 50)))
+
+    result = measure(plane.calculate_time_derivatives, steps)
+    result['objects'] = objects
+    result['steps_per_second'] = result['ops_per_second']
+    return result
+
+
+def benchmark_car_steps(steps=5000, seed=0, track_path=TRACK_PATH):
+    # a full step of one car without a network: derivatives, sensors and
+    # controls, collision check
+    random.seed(seed)
+    plane, car = car_on_track(CarConstantControlManager(), load_track(track_path))
+
+    def step():
+        plane.calculate_time_derivatives()
+        plane.apply_object_actions()
+        plane.detect_collisions()
+
+    result = measure(step, steps)
+    result['steps_per_second'] = result['ops_per_second']
+    return result
+
+
+def benchmark_sensors(calls=5000, cars=256, seed=0, track_path=TRACK_PATH):
+    # five rays from random open cells, one car at a time through the object
+    # model and the sensor table, many cars at once through the batched engine
+    track = load_track(track_path)
+    rng = np.random.default_rng(seed)
+    open_y, open_x = np.nonzero(track.grid() == 0)
+    picks = rng.integers(0, len(open_x), size=cars)
+    positions = np.stack([open_x[picks], open_y[picks]], axis=1) * track.track_granularity_m + 0.05
+    angles = rng.uniform(0, 360, size=cars)
+
+    plane, car = car_on_track(None, track)
+    table = load_sensor_table(track_path)
+    table_plane, table_car = car_on_track(None, track, sensor_table=table)
+    queries = [(Vector2D(x, y), angle) for (x, y), angle in zip(positions.tolist(), angles.tolist())]
+    cursor = [0]
+
+    def next_query(physical_object):
+        position, angle = queries[cursor[0] % len(queries)]
+        cursor[0] += 1
+        physical_object.force.angle = angle
+        return position
+
+    batched = BatchedSimulation(track, random_networks(cars, seed), Vector2D(*START_POSITION))
+    batched.positions[:] = positions
+    batched.force_angles[:] = angles
+    active = np.arange(0, cars)
+
+    return {
+        'object_ray_march': measure(lambda: car.calculate_sensor_data(next_query(car), plane), calls),
+        'sensor_table': measure(lambda: table_car.calculate_sensor_data(next_query(table_car), table_plane), calls),
+        'batched_ray_march': measure(
+            lambda: batched.calculate_sensor_data(active), max(10, calls // cars), ops_per_call=cars
+        ),
+    }
+
+
+def benchmark_networks(calls=5000, population=256, seed=0):
+    # one decision of one network: the recursive fire() of the original
+    # model, the iterative fire_inputs, the compiled matrices and a whole
+    # population per call
+    network = random_networks(1, seed)[0]
+    compiled = CompiledNetwork.from_network(network)
+    float16 = QuantizedNetwork.from_compiled(compiled, 'float16')
+    int8 = QuantizedNetwork.from_compiled(compiled, 'int8')
+    sparse = SparseNetwork.from_compiled(compiled)
+    pruned = prune_by_magnitude(compiled, 0.5)
+    networks = random_networks(population, seed + 1)
+    batch = Population.from_networks(networks)
+    rng = np.random.default_rng(seed)
+    inputs = rng.uniform(1, 20, size=(population, 5))
+    fired = (inputs > 3).tolist()
+    cursor = [0]
+
+    def next_inputs():
+        cursor[0] += 1
+        return fired[cursor[0] % population]
+
+    def recursive_fire():
+        for input_neuron, is_fired in zip(network.input_layer, next_inputs()):
+            if is_fired:
+                input_neuron.fire()
+
+    def iterative_fire():
+        network.fire_inputs(next_inputs())
+
+    return {
+        'object_fire': measure(recursive_fire, calls, setup=network.reset),
+        'object_fire_inputs': measure(iterative_fire, calls, setup=network.reset),
+        'object_reset': measure(network.reset, calls),
+        'compiled_evaluate': measure(lambda: compiled.evaluate(next_inputs()), calls),
+        'float16_evaluate': measure(lambda: float16.evaluate(next_inputs()), calls),
+        'int8_evaluate': measure(lambda: int8.evaluate(next_inputs()), calls),
+        'sparse_evaluate': measure(lambda: sparse.evaluate(next_inputs()), calls),
+        'pruned_evaluate': measure(lambda: pruned.evaluate(next_inputs()), calls),
+        'population_decide_actions': measure(
+            lambda: batch.decide_actions(inputs), max(10, calls // population), ops_per_call=population
+        ),
+    }
+
+
+def benchmark_simulations(networks=8, max_steps=1000, seed=0, track_path=TRACK_PATH):
+    # Simulation.simulate of whole runs, ops are simulations
+    track = load_track(track_path)
+    population = random_networks(networks, seed)
+    cursor = [0]
+
+    def simulate(make_control_manager):
+        def run():
+            network = population[cursor[0] % networks]
+            cursor[0] += 1
+            plane, car = car_on_track(make_control_manager(network), track)
+            Simulation(plane, max_steps=max_steps).simulate()
+        return run
+
+    def batched():
+        BatchedSimulation(track, population, Vector2D(*START_POSITION), max_steps=max_steps).simulate()
+
+    def shared_plane():
+        plane = SharedTrackPlane(track)
+        for network in population:
+            plane.add_physical_object(Car(10, 20, 200, CarCompiledControlManager(network)), Vector2D(*START_POSITION))
+        SharedSimulation(plane, max_steps=max_steps).simulate()
+
+    return {
+        'max_steps': max_steps,
+        'object_network': measure(simulate(CarNeuralControlManager), networks, warmup=1),
+        'compiled_network': measure(simulate(CarCompiledControlManager), networks, warmup=1),
+        'batched': measure(batched, 2, warmup=1, ops_per_call=networks),
+        'shared_plane': measure(shared_plane, 2, warmup=1, ops_per_call=networks),
+    }
+
+
+def benchmark_generations(networks=16, generations=2, evaluators=('serial', 'batched', 'process', 'shared'), seed=0):
+    # a whole generation of neural_car.py per call, ops are simulations
+    from evaluation import EVALUATORS
+
+    population = random_networks(networks, seed)
+    results = {'networks': networks}
+    for name in evaluators:
+        with EVALUATORS[name]() as evaluator:
+            results[name] = measure(
+                lambda: evaluator.evaluate(population), generations, warmup=1, ops_per_call=networks
+            )
+    return results
+
+
+def benchmark_worker_startup(calls=5, start_methods=None, modules=('evaluation', 'scenarios')):
+    # a pool worker from nothing to its first answer, for every start
+    # method, and what importing the worker modules costs a fresh interpreter
+    from evaluation import measure_worker_startup
+
+    results = {}
+    for start_method in start_methods or multiprocessing.get_all_start_methods():
+        results[start_method] = measure(lambda: measure_worker_startup(start_method), calls, warmup=1)
+
+    for module in modules:
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            "import time; started = time.perf_counter(); import %s; print(time.perf_counter() - started)" % module,
+        ], cwd=os.path.dirname(os.path.abspath(__file__)))
+        results['import_%s_seconds' % module] = float(output)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+SUITES = {
+    'physics': lambda scale: benchmark_physics_steps(steps=20000 // scale),
+    'car': lambda scale: benchmark_car_steps(steps=5000 // scale),
+    'sensors': lambda scale: benchmark_sensors(calls=5000 // scale),
+    'networks': lambda scale: benchmark_networks(calls=5000 // scale),
+    'simulations': lambda scale: benchmark_simulations(max_steps=3000 // scale),
+    'generations': lambda scale: benchmark_generations(networks=16 // min(scale, 4)),
+    'workers': lambda scale: benchmark_worker_startup(calls=max(2, 10 // scale)),
+}
+
+
+def run_suites(names=None, quick=False):
+    # the same seeds, track and sizes every time so that two results can
+    # be compared, quick divides the work by ten for a smoke run
+    scale = 10 if quick else 1
+    results = {
+        'version': BENCHMARK_VERSION,
+        'revision': git_revision(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'quick': quick,
+        'results': {},
+    }
+    for name in names or sorted(SUITES):
+        results['results'][name] = SUITES[name](scale)
+    return results
+
+
+def compare(baseline, current, path=()):
+    # ops/s of current against baseline for every benchmark found in both,
+    # above 1 is faster
+    ratios = {}
+    for key, value in current.items():
+        if key not in baseline:
+            continue
+        if isinstance(value, dict):
+            ratios.update(compare(baseline[key], value, path + (key,)))
+        elif key == 'ops_per_second' and baseline[key]:
+            ratios['.'.join(path)] = value / baseline[key]
+    return ratios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of the simulation")
+    parser.add_argument('suites', nargs='*', help="any of %s, all of them when none given" % ', '.join(sorted(SUITES)))
+    parser.add_argument('--quick', action='store_true', help="a tenth of the work, for smoke runs")
+    parser.add_argument('--output', help="write the results to this file instead of stdout")
+    parser.add_argument('--compare', help="results of an earlier run to print speedups against")
+    arguments = parser.parse_args(argv)
+    for name in arguments.suites:
+        if name not in SUITES:
+            parser.error("unknown suite %s" % name)
+
+    results = run_suites(arguments.suites, arguments.quick)
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            results['speedups'] = compare(json.load(baseline_file)['results'], results['results'])
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_measure(self):
+        result = measure(lambda: None, 50, ops_per_call=4)
+        self.assertEqual(result['calls'], 50)
+        self.assertLessEqual(result['p50_us'], result['p90_us'])
+        self.assertLessEqual(result['p90_us'], result['p99_us'])
+        self.assertGreater(result['ops_per_second'], 0)
+
+    def test_compare(self):
+        baseline = {'a': {'ops_per_second': 10.0, 'p50_us': 1.0}, 'b': {'c': {'ops_per_second': 4.0}}}
+        current = {'a': {'ops_per_second': 20.0}, 'b': {'c': {'ops_per_second': 2.0}}, 'd': {'ops_per_second': 1.0}}
+        self.assertEqual(compare(baseline, current), {'a': 2.0, 'b.c': 0.5})
+
+    def test_quick_suites_write_json(self):
+        results = run_suites(['sensors', 'networks'], quick=True)
+        json.dumps(results)
+        self.assertEqual(
+            sorted(results['results']['sensors']), ['batched_ray_march', 'object_ray_march', 'sensor_table']
+        )
+        self.assertIn('compiled_evaluate', results['results']['networks'])
+
+
+if __name__ == '__main__':
+    main()
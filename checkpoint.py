@@ -0,0 +1,258 @@
+import unittest
+import os
+import re
+import json
+import random
+import tempfile
+
+import numpy as np
+
+from genome import Genome
+from recording import StreamRecorder, StateStream
+
+
+CHECKPOINT_VERSION = 1
+CHECKPOINT_PATTERN = re.compile(r'^generation-(\d+)\.ckpt\.npz$')
+
+
+class Checkpoint:
+    # one evaluated generation: the genomes with their scores, the state of
+    # the evolver and of the random module, and the best genome so far.
+    # stored as an npz of plain arrays with the rest as a json header, no
+    # pickles, so an old checkpoint can always be read or rejected
+
+    def __init__(self, generation, genomes, scores, evolver_state, random_state=None,
+                 best_genome=None, best_score=None):
+        self.generation = generation
+        self.genomes = genomes
+        self.scores = list(scores)
+        self.evolver_state = evolver_state
+        self.random_state = random_state if random_state is not None else random.getstate()
+        self.best_genome = best_genome
+        self.best_score = best_score
+
+    def save(self, path):
+        metadata = {
+            'version': CHECKPOINT_VERSION,
+            'generation': self.generation,
+            'layer_sizes': self.genomes[0].layer_sizes,
+            'evolver': self.evolver_state,
+            'random': self.random_state,
+            'best_score': self.best_score,
+        }
+        arrays = {
+            'metadata': np.frombuffer(json.dumps(metadata).encode(), dtype=np.uint8),
+            'genomes': np.stack([genome.values for genome in self.genomes]),
+            'scores': np.array(self.scores, dtype=np.float64),
+        }
+        if self.best_genome is not None:
+            arrays['best_genome'] = self.best_genome.values
+
+        # written next to the target first, a run killed while saving
+        # leaves the previous checkpoint intact
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix='.npz')
+        with os.fdopen(descriptor, 'wb') as checkpoint_file:
+            np.savez_compressed(checkpoint_file, **arrays)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            metadata = json.loads(arrays['metadata'].tobytes().decode())
+            if metadata.get('version') != CHECKPOINT_VERSION:
+                raise ValueError("%s is a version %s checkpoint, expected %s" % (
+                    path, metadata.get('version'), CHECKPOINT_VERSION
+                ))
+
+            layer_sizes = metadata['layer_sizes']
+            genomes = [Genome(layer_sizes, values.copy()) for values in arrays['genomes']]
+            best_genome = None
+            if 'best_genome' in arrays:
+                best_genome = Genome(layer_sizes, arrays['best_genome'].copy())
+            scores = arrays['scores'].tolist()
+
+        version, internal_state, gauss_next = metadata['random']
+        return cls(
+            metadata['generation'], genomes, scores, metadata['evolver'],
+            (version, tuple(internal_state), gauss_next), best_genome, metadata['best_score'],
+        )
+
+    def resume(self, evolver):
+        # the genomes of the generation after this one, exactly the ones an
+        # uninterrupted run would have gone on with
+        evolver.restore(self.evolver_state)
+        random.setstate(self.random_state)
+        return evolver.next_generation(self.genomes, self.scores)
+
+
+class CheckpointManager:
+
+    def __init__(self, directory, every=10, keep=3):
+        self.directory = directory
+        self.every = every
+        self.keep = keep
+        # set whenever the best genome changes, the trajectory on disk is of
+        # an older car until the next record_best
+        self.trajectory_stale = False
+
+    def path(self, generation):
+        return os.path.join(self.directory, 'generation-%06d.ckpt.npz' % generation)
+
+    @property
+    def trajectory_path(self):
+        return os.path.join(self.directory, 'best.states')
+
+    def generations(self):
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in os.listdir(self.directory):
+            match = CHECKPOINT_PATTERN.match(name)
+            if match:
+                found.append(int(match.group(1)))
+        return sorted(found)
+
+    def is_due(self, generation):
+        return generation % self.every == 0
+
+    def save(self, checkpoint):
+        checkpoint.save(self.path(checkpoint.generation))
+        for generation in self.generations()[0:-self.keep]:
+            os.remove(self.path(generation))
+
+    def latest(self):
+        generations = self.generations()
+        if not generations:
+            return None
+        return Checkpoint.load(self.path(generations[-1]))
+
+    def best_changed(self):
+        self.trajectory_stale = True
+
+    def record_best(self, genome, track_path=None, config=None, stop_policies=None):
+        # called with every checkpoint, the best genome may have changed in
+        # any generation since the last one
+        if self.trajectory_stale or not os.path.exists(self.trajectory_path):
+            record_trajectory(genome, self.trajectory_path, track_path, config, stop_policies)
+            self.trajectory_stale = False
+            return True
+        return False
+
+
+def record_trajectory(genome, path, track_path=None, config=None, stop_policies=None):
+    # runs the genome once more with every step streamed to path, for
+    # load.py to play back
+    from evaluation import TRACK_PATH, simulate_network
+    from track import load_track
+
+    recorder = StreamRecorder(path)
+    score, result = simulate_network(
+        genome, load_track(track_path or TRACK_PATH), stop_policies, config, recorder
+    )
+    recorder.close()
+    return score
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def evolver(self):
+        from evolution import Evolver, TournamentSelection, UniformCrossover, AdaptiveMutation
+
+        return Evolver(
+            TournamentSelection(), UniformCrossover(), AdaptiveMutation(),
+            population_size=12, elite=2, rng=np.random.default_rng(3)
+        )
+
+    def train(self, evolver, genomes, generations, start=0, manager=None):
+        from evolution import weight_sum
+
+        for generation in range(start, generations):
+            scores = weight_sum(genomes)
+            if manager is not None and manager.is_due(generation):
+                manager.save(Checkpoint(generation, genomes, scores, evolver.state()))
+            genomes = evolver.next_generation(genomes, scores)
+        return genomes
+
+    def test_resume_matches_uninterrupted_run(self):
+        evolver = self.evolver()
+        genomes = evolver.populate([3, 4, 2])
+        expected = self.train(evolver, genomes, 8)
+
+        manager = CheckpointManager(tempfile.mkdtemp(), every=3, keep=2)
+        evolver = self.evolver()
+        self.train(evolver, evolver.populate([3, 4, 2]), 5, manager=manager)
+        self.assertEqual(manager.generations(), [0, 3])
+
+        # a fresh process: new evolver, population from the checkpoint
+        checkpoint = manager.latest()
+        self.assertEqual(checkpoint.generation, 3)
+        evolver = self.evolver()
+        genomes = self.train(evolver, checkpoint.resume(evolver), 8, start=4)
+        self.assertEqual(genomes, expected)
+
+    def test_round_trip(self):
+        genomes = [Genome.random([2, 3, 1], np.random.default_rng(4)) for _ in range(0, 4)]
+        path = os.path.join(tempfile.mkdtemp(), 'run.ckpt.npz')
+        random.seed(5)
+        Checkpoint(7, genomes, [4.0, 1.0, 3.0, 2.0], {'a': 1}, best_genome=genomes[1], best_score=1.0).save(path)
+        state = random.getstate()
+        random.random()
+
+        checkpoint = Checkpoint.load(path)
+        self.assertEqual(checkpoint.generation, 7)
+        self.assertEqual(checkpoint.genomes, genomes)
+        self.assertEqual(checkpoint.genomes[0].values.dtype, np.float32)
+        self.assertEqual(checkpoint.scores, [4.0, 1.0, 3.0, 2.0])
+        self.assertEqual(checkpoint.best_genome, genomes[1])
+        self.assertEqual(checkpoint.best_score, 1.0)
+        self.assertEqual(checkpoint.random_state, state)
+        self.assertLess(os.path.getsize(path), 4 * len(genomes[0]) * 4 + 16384)
+
+    def test_rejects_other_versions(self):
+        path = os.path.join(tempfile.mkdtemp(), 'run.ckpt.npz')
+        metadata = json.dumps({'version': CHECKPOINT_VERSION + 1}).encode()
+        np.savez(path, metadata=np.frombuffer(metadata, dtype=np.uint8))
+        with self.assertRaises(ValueError):
+            Checkpoint.load(path)
+
+    def test_record_trajectory(self):
+        from neural_net import Network
+
+        random.seed(6)
+        genome = Genome.from_network(Network(5, 3, 15, 2))
+        path = os.path.join(tempfile.mkdtemp(), 'best.states')
+        score = record_trajectory(genome, path)
+
+        states = StateStream(path)
+        self.assertGreater(len(states), 0)
+        self.assertAlmostEqual((500 - states[-1][0].x) + (500 - states[-1][0].y), score, places=3)
+
+    def test_trajectory_follows_best_between_checkpoints(self):
+        # the best changes in generation 3, generation 10 is the next
+        # checkpoint and does not improve on it
+        from neural_net import Network
+        from physics_2d import SimulationConfig
+
+        config = SimulationConfig(max_steps=200)
+        random.seed(7)
+        first, second = [Genome.from_network(Network(5, 3, 15, 2)) for _ in range(0, 2)]
+        manager = CheckpointManager(tempfile.mkdtemp(), every=10)
+
+        history = []
+        for generation, best in [(0, first), (3, second), (10, None), (20, None)]:
+            if best is not None:
+                best_genome = best
+                manager.best_changed()
+            if manager.is_due(generation):
+                history.append(manager.record_best(best_genome, config=config))
+        self.assertEqual(history, [True, True, False])
+
+        expected_path = os.path.join(tempfile.mkdtemp(), 'second.states')
+        record_trajectory(second, expected_path, config=config)
+        self.assertEqual(list(StateStream(manager.trajectory_path)), list(StateStream(expected_path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,340 @@
+import unittest
+import random
+
+import numpy as np
+
+from neural_net import Network
+
+
+class CompiledNetwork:
+
+    def __init__(self, weights, thresholds, masks=None):
+        # weights[i] connects layer i to layer i+1 and has shape
+        # (size of layer i, size of layer i+1), thresholds[i] belong to
+        # the neurons of layer i+1. masks[i] marks the connections a pruned
+        # network still has, None when all of them are there.
+        self.weights = [np.array(layer, dtype=np.float64) for layer in weights]
+        self.thresholds = [np.array(layer, dtype=np.float64) for layer in thresholds]
+        self.masks = None
+        if masks is not None:
+            self.masks = [np.array(layer, dtype=bool) for layer in masks]
+
+        self.layer_sizes = [self.weights[0].shape[0]]
+        for layer in self.weights:
+            self.layer_sizes.append(layer.shape[1])
+
+    @classmethod
+    def from_network(cls, network):
+        layers = [network.input_layer] + network.hidden_layers + [network.output_layer]
+
+        weights = []
+        thresholds = []
+        masks = []
+        for previous_layer, layer in zip(layers, layers[1:]):
+            positions = {id(neuron): position for position, neuron in enumerate(layer)}
+            matrix = np.zeros((len(previous_layer), len(layer)))
+            mask = np.zeros((len(previous_layer), len(layer)), dtype=bool)
+            for row, neuron in enumerate(previous_layer):
+                for connection in neuron.connections:
+                    matrix[row, positions[id(connection.neuronB)]] = connection.strength
+                    mask[row, positions[id(connection.neuronB)]] = True
+
+            weights.append(matrix)
+            thresholds.append([neuron.threshold for neuron in layer])
+            masks.append(mask)
+
+        if all(mask.all() for mask in masks):
+            masks = None
+        return cls(weights, thresholds, masks)
+
+    def saturations(self, fired_inputs, refire='always'):
+        # A neuron fires its whole fan-out every time it receives a spike
+        # while its saturation is at or above the threshold. Spikes reach a
+        # layer in the order the previous layer fired, so the saturation
+        # after each spike is a running sum over that order and the next
+        # layer fires in (spike, neuron) order. With refire 'once' only the
+        # first spike over the threshold fires, as in Network.fire_inputs.
+        events = np.flatnonzero(np.asarray(fired_inputs, dtype=bool))
+        # counted like Network.fire_inputs, a fire per firing neuron and an
+        # event per spike a connection delivers
+        fires = len(events)
+        spikes = 0
+
+        layer_saturations = []
+        for layer, (weights, thresholds) in enumerate(zip(self.weights, self.thresholds)):
+            if len(events) == 0:
+                layer_saturations.append(np.zeros(weights.shape[1]))
+                continue
+
+            running = np.cumsum(weights[events], axis=0)
+            layer_saturations.append(running[-1])
+            fired = running >= thresholds
+            if self.masks is None:
+                spikes += len(events) * weights.shape[1]
+            else:
+                # a missing connection adds nothing and fires nothing
+                delivered = self.masks[layer][events]
+                spikes += int(np.count_nonzero(delivered))
+                fired &= delivered
+            if refire == 'once':
+                fired &= np.cumsum(fired, axis=0) == 1
+            events = np.nonzero(fired)[1]
+            fires += len(events)
+
+        self.last_propagation = {'events': spikes, 'fires': fires}
+        return layer_saturations
+
+    def evaluate(self, fired_inputs, refire='always'):
+        return self.saturations(fired_inputs, refire)[-1]
+
+
+def compile_network(network):
+    # a Network, or anything with to_compiled like a Genome
+    if isinstance(network, CompiledNetwork):
+        return network
+    if hasattr(network, 'to_compiled'):
+        return network.to_compiled()
+    return CompiledNetwork.from_network(network)
+
+
+class Population:
+
+    def __init__(self, weights, thresholds):
+        # weights[i] has shape (networks, size of layer i, size of layer i+1)
+        self.weights = [np.asarray(layer, dtype=np.float64) for layer in weights]
+        self.thresholds = [np.asarray(layer, dtype=np.float64) for layer in thresholds]
+
+        self.layer_sizes = [self.weights[0].shape[1]]
+        for layer in self.weights:
+            self.layer_sizes.append(layer.shape[2])
+
+    @classmethod
+    def from_networks(cls, networks):
+        compiled = []
+        for network in networks:
+            network = compile_network(network)
+            if network.masks is not None:
+                raise ValueError("Pruned networks can not be part of a population, evaluate them one by one")
+            compiled.append(network)
+
+        layer_sizes = compiled[0].layer_sizes
+        for network in compiled:
+            if network.layer_sizes != layer_sizes:
+                raise ValueError("All networks of a population need the same shape, got %s and %s" % (
+                    layer_sizes, network.layer_sizes
+                ))
+
+        layers = range(0, len(layer_sizes) - 1)
+        return cls(
+            [np.stack([network.weights[layer] for network in compiled]) for layer in layers],
+            [np.stack([network.thresholds[layer] for network in compiled]) for layer in layers],
+        )
+
+    def __len__(self):
+        return self.weights[0].shape[0]
+
+    def __getitem__(self, index):
+        return CompiledNetwork(
+            [layer[index] for layer in self.weights],
+            [layer[index] for layer in self.thresholds],
+        )
+
+    def subset(self, indices):
+        return Population(
+            [layer[indices] for layer in self.weights],
+            [layer[indices] for layer in self.thresholds],
+        )
+
+    def saturations(self, fired_inputs, refire='always'):
+        # Same cascade as CompiledNetwork.saturations, with every network's
+        # spike sequence padded to the longest one. Padding adds 0.0 to the
+        # running sums, so saturations stay identical to the single network.
+        count = len(self)
+        network_ids, events = np.nonzero(np.asarray(fired_inputs, dtype=bool))
+
+        layer_saturations = []
+        for weights, thresholds in zip(self.weights, self.thresholds):
+            width = weights.shape[2]
+            if len(events) == 0:
+                layer_saturations.append(np.zeros((count, width)))
+                continue
+
+            counts = np.bincount(network_ids, minlength=count)
+            starts = np.cumsum(counts) - counts
+            slots = np.arange(0, len(events)) - starts[network_ids]
+
+            spikes = np.zeros((count, counts.max(), width))
+            spikes[network_ids, slots] = weights[network_ids, events]
+            is_spike = np.zeros((count, counts.max(), 1), dtype=bool)
+            is_spike[network_ids, slots] = True
+
+            running = np.cumsum(spikes, axis=1)
+            layer_saturations.append(running[:, -1])
+            fired = (running >= thresholds[:, np.newaxis, :]) & is_spike
+            if refire == 'once':
+                fired &= np.cumsum(fired, axis=1) == 1
+            network_ids, _, events = np.nonzero(fired)
+
+        return layer_saturations
+
+    def evaluate(self, fired_inputs, refire='always'):
+        return self.saturations(fired_inputs, refire)[-1]
+
+    def decide_actions(self, inputs):
+        # batched CarNeuralControlManager.decide_actions, one row of sensor
+        # data per network
+        saturations = self.evaluate(np.asarray(inputs) > 3)
+        actions = np.minimum(saturations, 100) / 100
+        return (actions[:, 0], actions[:, 1])
+
+
+class TestCompiledNetwork(unittest.TestCase):
+
+    def fire_network(self, network, fired_inputs):
+        network.reset()
+        for input_number, is_fired in enumerate(fired_inputs):
+            if is_fired:
+                network.input_layer[input_number].fire()
+
+        layers = network.hidden_layers + [network.output_layer]
+        return [[neuron.saturation for neuron in layer] for layer in layers]
+
+    def assert_equivalent(self, network, fired_inputs):
+        compiled = CompiledNetwork.from_network(network)
+        expected = self.fire_network(network, fired_inputs)
+        result = [list(layer) for layer in compiled.saturations(fired_inputs)]
+        self.assertEqual(result, expected)
+
+    def test_random_networks(self):
+        random.seed(1)
+        for shape in [(5, 3, 15, 2), (2, 4, 40, 3), (3, 1, 4, 1)]:
+            network = Network(*shape)
+            for _ in range(0, 20):
+                fired_inputs = [random.random() > 0.4 for _ in range(0, shape[0])]
+                self.assert_equivalent(network, fired_inputs)
+
+    def test_mutated_networks(self):
+        # mutation makes some strengths negative, so a neuron can drop below
+        # its threshold again and the order of incoming spikes matters
+        random.seed(2)
+        for _ in range(0, 30):
+            network = Network(5, 3, 15, 2)
+            for neuron in network.all_neurons:
+                for connection in neuron.connections:
+                    connection.strength -= 0.3
+            network.randomize_connections()
+            fired_inputs = [random.random() > 0.3 for _ in range(0, 5)]
+            self.assert_equivalent(network, fired_inputs)
+
+    def test_fire_once_policy(self):
+        random.seed(16)
+        for _ in range(0, 30):
+            network = Network(5, 3, 15, 2)
+            for neuron in network.all_neurons:
+                for connection in neuron.connections:
+                    connection.strength -= random.random() * 0.3
+            fired_inputs = [random.random() > 0.3 for _ in range(0, 5)]
+
+            network.reset()
+            network.fire_inputs(fired_inputs, refire='once')
+            expected = [[neuron.saturation for neuron in layer] for layer in network.hidden_layers + [network.output_layer]]
+
+            compiled = CompiledNetwork.from_network(network)
+            result = [list(layer) for layer in compiled.saturations(fired_inputs, refire='once')]
+            self.assertEqual(result, expected)
+
+            batched = Population.from_networks([network, network]).saturations([fired_inputs, [0] * 5], refire='once')
+            self.assertEqual([list(layer[0]) for layer in batched], expected)
+
+    def test_propagation_counts_match_network(self):
+        random.seed(21)
+        for refire in ('always', 'once'):
+            for _ in range(0, 20):
+                network = Network(5, 3, 15, 2)
+                fired_inputs = [random.random() > 0.3 for _ in range(0, 5)]
+                network.reset()
+                expected = network.fire_inputs(fired_inputs, refire)
+
+                compiled = CompiledNetwork.from_network(network)
+                compiled.evaluate(fired_inputs, refire)
+                self.assertEqual(compiled.last_propagation, expected)
+
+    def test_no_inputs_fired(self):
+        network = Network(5, 3, 15, 2)
+        compiled = CompiledNetwork.from_network(network)
+        self.assertEqual(list(compiled.evaluate([0, 0, 0, 0, 0])), [0, 0])
+
+    def test_layer_sizes(self):
+        compiled = CompiledNetwork.from_network(Network(5, 3, 15, 2))
+        self.assertEqual(compiled.layer_sizes, [5, 5, 5, 5, 2])
+
+    def test_control_managers_agree(self):
+        from physics_2d import CarNeuralControlManager, CarCompiledControlManager
+
+        random.seed(3)
+        network = Network(5, 3, 15, 2)
+        neural = CarNeuralControlManager(network)
+        compiled = CarCompiledControlManager(network)
+        for _ in range(0, 50):
+            sensor_data = [float(random.randint(1, 20)) for _ in range(0, 5)]
+            self.assertEqual(
+                compiled.decide_actions(sensor_data),
+                neural.decide_actions(sensor_data)
+            )
+
+
+class TestPopulation(unittest.TestCase):
+
+    def test_population_matches_single_networks(self):
+        random.seed(4)
+        networks = []
+        for _ in range(0, 40):
+            network = Network(5, 3, 15, 2)
+            for neuron in network.all_neurons:
+                for connection in neuron.connections:
+                    connection.strength -= random.random() * 0.4
+            networks.append(network)
+
+        population = Population.from_networks(networks)
+        for _ in range(0, 10):
+            fired_inputs = np.array([
+                [random.random() > 0.4 for _ in range(0, 5)]
+                for _ in networks
+            ])
+            batched = population.saturations(fired_inputs)
+            for index, network in enumerate(networks):
+                single = CompiledNetwork.from_network(network).saturations(fired_inputs[index])
+                for batched_layer, single_layer in zip(batched, single):
+                    self.assertEqual(list(batched_layer[index]), list(single_layer))
+
+    def test_decide_actions(self):
+        from physics_2d import CarNeuralControlManager
+
+        random.seed(5)
+        networks = [Network(5, 3, 15, 2) for _ in range(0, 20)]
+        population = Population.from_networks(networks)
+        sensor_data = [[float(random.randint(1, 20)) for _ in range(0, 5)] for _ in networks]
+
+        turns, accelerations = population.decide_actions(sensor_data)
+        for index, network in enumerate(networks):
+            self.assertEqual(
+                (turns[index], accelerations[index]),
+                CarNeuralControlManager(network).decide_actions(sensor_data[index])
+            )
+
+    def test_shapes_must_match(self):
+        with self.assertRaises(ValueError):
+            Population.from_networks([Network(5, 3, 15, 2), Network(5, 2, 10, 2)])
+
+    def test_getitem(self):
+        networks = [Network(5, 3, 15, 2) for _ in range(0, 3)]
+        population = Population.from_networks(networks)
+        self.assertEqual(len(population), 3)
+        self.assertEqual(
+            list(population[1].evaluate([1, 0, 1, 1, 0])),
+            list(CompiledNetwork.from_network(networks[1]).evaluate([1, 0, 1, 1, 0]))
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
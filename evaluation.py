@@ -0,0 +1,722 @@
+import unittest
+import os
+import random
+import time
+import pickle
+import multiprocessing
+import concurrent.futures
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from compiled_net import CompiledNetwork, Population
+from physics_2d import Car, CarCompiledControlManager, GeometricVector2D, Vector2D, SimulationConfig
+from batched_sim import BatchedSimulation
+from track import load_track, image_hash
+from recording import NullRecorder
+from genome import Genome, population_from_genomes
+from fitness_cache import FitnessCache
+from profiling import Profiler
+
+
+TRACK_PATH = 'tracks/1.png'
+START_POSITION = (2, 4)
+
+
+def score_position(position):
+    # how far away from the end of the track, smaller is better
+    return (500 - position.x) + (500 - position.y)
+
+
+def drive(network, track, start=START_POSITION, heading=0.0, stop_policies=None, config=None, recorder=None,
+          profiler=None):
+    # one car from start facing heading degrees, returns its final position
+    if config is None:
+        config = SimulationConfig()
+    if recorder is None:
+        # nobody looks at trajectories during training
+        recorder = NullRecorder()
+
+    plane = config.make_plane(track)
+    sim = config.make_simulation(plane, stop_policies=stop_policies, recorder=recorder, profiler=profiler)
+    car = Car(
+        10, 20, 200,
+        CarCompiledControlManager(network)
+    )
+    car.apply_force(GeometricVector2D(0, heading))
+    plane.add_physical_object(car, position=Vector2D(*start))
+    result = sim.simulate()
+
+    return (plane.physical_objects[0][1], result)
+
+
+def simulate_network(network, track, stop_policies=None, config=None, recorder=None, profiler=None):
+    position, result = drive(network, track, START_POSITION, 0.0, stop_policies, config, recorder, profiler)
+    return (score_position(position), result)
+
+
+def compute_score(network, track, stop_policies=None, config=None):
+    return simulate_network(network, track, stop_policies, config)[0]
+
+
+def as_population(networks):
+    if isinstance(networks, Population):
+        return networks
+    if all(isinstance(network, Genome) for network in networks):
+        return population_from_genomes(networks)
+    return Population.from_networks(networks)
+
+
+class SharedPopulation:
+
+    def __init__(self, layer_sizes, capacity, name=None):
+        self.layer_sizes = list(layer_sizes)
+        self.capacity = capacity
+
+        shapes = []
+        for inputs, outputs in zip(self.layer_sizes, self.layer_sizes[1:]):
+            shapes.append((capacity, inputs, outputs))
+        for outputs in self.layer_sizes[1:]:
+            shapes.append((capacity, outputs))
+        size = sum(int(np.prod(shape)) for shape in shapes) * 8
+
+        if name is None:
+            self.shared_memory = shared_memory.SharedMemory(create=True, size=size)
+            self.is_owner = True
+        else:
+            # pool workers share the resource tracker of the process that
+            # started them, so attaching again does not hand over ownership
+            self.shared_memory = shared_memory.SharedMemory(name=name)
+            self.is_owner = False
+
+        arrays = []
+        offset = 0
+        for shape in shapes:
+            arrays.append(np.ndarray(shape, dtype=np.float64, buffer=self.shared_memory.buf, offset=offset))
+            offset += int(np.prod(shape)) * 8
+
+        layer_count = len(self.layer_sizes) - 1
+        self.weights = arrays[0:layer_count]
+        self.thresholds = arrays[layer_count:]
+
+    def __getstate__(self):
+        return {
+            'layer_sizes': self.layer_sizes,
+            'capacity': self.capacity,
+            'name': self.shared_memory.name,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state['layer_sizes'], state['capacity'], state['name'])
+
+    def store(self, population):
+        if population.layer_sizes != self.layer_sizes:
+            raise ValueError("Population of shape %s does not fit shared arrays of shape %s" % (
+                population.layer_sizes, self.layer_sizes
+            ))
+        if len(population) > self.capacity:
+            raise ValueError("Population of %s networks does not fit shared arrays for %s" % (
+                len(population), self.capacity
+            ))
+
+        count = len(population)
+        for shared, layer in zip(self.weights, population.weights):
+            shared[0:count] = layer
+        for shared, layer in zip(self.thresholds, population.thresholds):
+            shared[0:count] = layer
+
+    def __getitem__(self, index):
+        return CompiledNetwork(
+            [layer[index] for layer in self.weights],
+            [layer[index] for layer in self.thresholds],
+        )
+
+    def close(self):
+        # numpy views have to go before the buffer can be released
+        self.weights = None
+        self.thresholds = None
+        self.shared_memory.close()
+        if self.is_owner:
+            self.shared_memory.unlink()
+
+
+_worker = {}
+
+
+def _initialize_worker(shared_population, track_path, config=None):
+    _worker['population'] = shared_population
+    _worker['track'] = load_track(track_path)
+    _worker['config'] = config
+
+
+def _score_index(index, stop_policies, profile=False):
+    # profiles go back to the parent as plain dictionaries to be merged
+    profiler = Profiler() if profile else None
+    score, result = simulate_network(
+        _worker['population'][index], _worker['track'], stop_policies, _worker['config'], profiler=profiler
+    )
+    return (score, result.steps_saved, profiler.to_dict() if profile else None)
+
+
+def _initialize_network_worker(track_path):
+    _worker['track'] = load_track(track_path)
+
+
+def _score_network(network):
+    return compute_score(network, _worker['track'])
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+def measure_worker_startup(start_method=None, track_path=TRACK_PATH, max_workers=1):
+    # seconds from creating a pool until a worker that loaded its track
+    # answers, what recreating a pool costs. fork copies the parent, spawn
+    # and forkserver import the worker modules from scratch
+    context = multiprocessing.get_context(start_method)
+    started = time.perf_counter()
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers, mp_context=context, initializer=_initialize_network_worker, initargs=(track_path,)
+    )
+    executor.submit(_worker_ready).result()
+    ready = time.perf_counter() - started
+    executor.shutdown()
+    return {
+        'start_method': context.get_start_method(),
+        'seconds': ready,
+        'shutdown_seconds': time.perf_counter() - started - ready,
+    }
+
+
+def chunk_sizes(count, max_workers):
+    return max(1, count // (max_workers * 4))
+
+
+def pickled_map_bytes(arguments, results, chunksize):
+    # what ProcessPoolExecutor.map sends, one pickled chunk of arguments out
+    # and one chunk of results back per task
+    total = 0
+    for start in range(0, len(arguments), chunksize):
+        total += len(pickle.dumps(arguments[start:start + chunksize]))
+        total += len(pickle.dumps(results[start:start + chunksize]))
+    return total
+
+
+class Evaluator:
+
+    last_generation = None
+    steps_saved = 0
+    track_path = TRACK_PATH
+    config = None
+    _track_key = None
+    # with profile set every simulation is timed per phase, last_profile is
+    # the Profiler of the last evaluate merged over all of them
+    profile = False
+    last_profile = None
+
+    @property
+    def track_key(self):
+        if self._track_key is None:
+            self._track_key = image_hash(self.track_path)
+        return self._track_key
+
+    def evaluate(self, networks, stop_policies=None):
+        raise NotImplementedError()
+
+    def collect(self, simulations):
+        self.steps_saved = sum(result.steps_saved for score, result in simulations)
+        return [score for score, result in simulations]
+
+    def make_profilers(self, count):
+        # one per simulation, threads never share one
+        if not self.profile:
+            return [None] * count
+        return [Profiler() for _ in range(0, count)]
+
+    def merge_profiles(self, profiles):
+        if not self.profile:
+            return None
+        return Profiler.merged(profiles)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SerialEvaluator(Evaluator):
+
+    def __init__(self, track_path=TRACK_PATH, config=None):
+        self.track_path = track_path
+        self.track = load_track(track_path)
+        self.config = config
+
+    def evaluate(self, networks, stop_policies=None):
+        profilers = self.make_profilers(len(networks))
+        simulations = [
+            simulate_network(network, self.track, stop_policies, self.config, profiler=profiler)
+            for network, profiler in zip(networks, profilers)
+        ]
+        self.last_profile = self.merge_profiles(profilers)
+        return self.collect(simulations)
+
+
+class ThreadEvaluator(Evaluator):
+
+    def __init__(self, track_path=TRACK_PATH, max_workers=None, config=None):
+        self.track_path = track_path
+        self.track = load_track(track_path)
+        self.config = config
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+
+    def evaluate(self, networks, stop_policies=None):
+        profilers = self.make_profilers(len(networks))
+        simulations = list(self.executor.map(
+            lambda network, profiler: simulate_network(
+                network, self.track, stop_policies, self.config, profiler=profiler
+            ),
+            networks, profilers,
+        ))
+        self.last_profile = self.merge_profiles(profilers)
+        return self.collect(simulations)
+
+    def close(self):
+        self.executor.shutdown()
+
+
+class BatchedEvaluator(Evaluator):
+
+    def __init__(self, track_path=TRACK_PATH, config=None):
+        if config is None:
+            config = SimulationConfig()
+        if config.integrator != 'semi_implicit_euler' or config.swept_collisions:
+            raise ValueError("BatchedEvaluator only runs semi implicit Euler without swept collisions")
+
+        self.track_path = track_path
+        self.track = load_track(track_path)
+        self.config = config
+
+    def evaluate(self, networks, stop_policies=None):
+        if stop_policies:
+            raise ValueError("BatchedEvaluator does not support stop policies")
+
+        simulation = BatchedSimulation(
+            self.track, as_population(networks), Vector2D(*START_POSITION),
+            max_steps=self.config.max_steps,
+            time_delta_seconds=self.config.time_delta_seconds,
+            substeps=self.config.substeps,
+            control_interval=self.config.control_interval,
+        )
+        simulation.simulate()
+        return [score_position(Vector2D(x, y)) for x, y in simulation.positions]
+
+
+class SharedPlaneEvaluator(Evaluator):
+    # the whole population as cars on one plane, each stopped on its own,
+    # with object_collisions cars that touch crash into each other
+
+    def __init__(self, track_path=TRACK_PATH, config=None, object_collisions=False):
+        if config is None:
+            config = SimulationConfig()
+        self.track_path = track_path
+        self.track = load_track(track_path)
+        self.config = config
+        self.object_collisions = object_collisions
+
+    def evaluate(self, networks, stop_policies=None):
+        plane = self.config.make_shared_plane(self.track, object_collisions=self.object_collisions)
+        for network in networks:
+            plane.add_physical_object(Car(10, 20, 200, CarCompiledControlManager(network)), Vector2D(*START_POSITION))
+
+        profiler = Profiler() if self.profile else None
+        results = self.config.make_simulation(
+            plane, stop_policies=stop_policies, recorder=NullRecorder(), profiler=profiler
+        ).simulate()
+        self.last_profile = profiler
+        return self.collect([
+            (score_position(position), result) for (car, position), result in zip(plane.physical_objects, results)
+        ])
+
+
+class SharedMemoryEvaluator(Evaluator):
+
+    def __init__(self, layer_sizes, capacity, track_path=TRACK_PATH, max_workers=None, config=None,
+                 start_method=None):
+        self.track_path = track_path
+        self.config = config
+        self.shared_population = SharedPopulation(layer_sizes, capacity)
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_initialize_worker,
+            initargs=(self.shared_population, track_path, config),
+        )
+        self.max_workers = self.executor._max_workers
+        self.last_generation = None
+
+    def evaluate(self, networks, stop_policies=None):
+        population = as_population(networks)
+
+        started = time.perf_counter()
+        self.shared_population.store(population)
+        indices = list(range(0, len(population)))
+        chunksize = chunk_sizes(len(indices), self.max_workers)
+        results = list(self.executor.map(
+            _score_index, indices, [stop_policies] * len(indices), [self.profile] * len(indices),
+            chunksize=chunksize,
+        ))
+        scores = [score for score, steps_saved, profile in results]
+        self.steps_saved = sum(steps_saved for score, steps_saved, profile in results)
+        self.last_profile = self.merge_profiles(profile for score, steps_saved, profile in results)
+
+        self.last_generation = {
+            'networks': len(indices),
+            'seconds': time.perf_counter() - started,
+            'ipc_bytes': pickled_map_bytes(
+                list(zip(indices, [stop_policies] * len(indices))), results, chunksize
+            ),
+        }
+        return scores
+
+    def close(self):
+        self.executor.shutdown()
+        self.shared_population.close()
+
+
+class ProcessEvaluator(Evaluator):
+
+    def __init__(self, track_path=TRACK_PATH, max_workers=None, config=None, start_method=None):
+        self.track_path = track_path
+        self.max_workers = max_workers
+        self.config = config
+        # None is the platform default, every module the workers import is
+        # safe to import again under spawn and forkserver
+        self.start_method = start_method
+        self.shared_evaluator = None
+
+    def evaluate(self, networks, stop_policies=None):
+        # the shared arrays are sized by the first population and only
+        # recreated when a later one does not fit
+        population = as_population(networks)
+        shared = self.shared_evaluator
+        if shared is None or shared.shared_population.layer_sizes != population.layer_sizes \
+                or shared.shared_population.capacity < len(population):
+            self.close()
+            self.shared_evaluator = SharedMemoryEvaluator(
+                population.layer_sizes, len(population), self.track_path, self.max_workers, self.config,
+                self.start_method,
+            )
+
+        self.shared_evaluator.profile = self.profile
+        scores = self.shared_evaluator.evaluate(population, stop_policies)
+        self.last_generation = self.shared_evaluator.last_generation
+        self.steps_saved = self.shared_evaluator.steps_saved
+        self.last_profile = self.shared_evaluator.last_profile
+        return scores
+
+    def close(self):
+        if self.shared_evaluator is not None:
+            self.shared_evaluator.close()
+            self.shared_evaluator = None
+
+
+EVALUATORS = {
+    'serial': SerialEvaluator,
+    'thread': ThreadEvaluator,
+    'process': ProcessEvaluator,
+    'batched': BatchedEvaluator,
+    'shared': SharedPlaneEvaluator,
+}
+
+
+def evaluate_cached(networks, evaluator, stop_policies, cache):
+    # only networks the cache has never seen are simulated, each of them once.
+    # policies the cache can not tell apart leave every score uncached
+    if not cache.accepts(stop_policies):
+        scores = evaluator.evaluate(networks, stop_policies)
+        return scores, len(scores)
+
+    config = evaluator.config if evaluator.config is not None else SimulationConfig()
+    keys = [cache.key(network, evaluator.track_key, config, stop_policies) for network in networks]
+    scores, missing = cache.lookup(keys)
+
+    evaluator.steps_saved = 0
+    if missing:
+        new_scores = evaluator.evaluate([networks[indices[0]] for indices in missing.values()], stop_policies)
+        for (key, indices), score in zip(missing.items(), new_scores):
+            cache.put(key, score)
+            for index in indices:
+                scores[index] = score
+
+    return scores, len(missing)
+
+
+def evaluate_population(networks, evaluator='process', stop_policies=None, config=None, cache=None, profile=False):
+    # runs every network exactly once, evaluator is either one of the names
+    # in EVALUATORS or a long lived Evaluator reused across generations,
+    # config and profile only apply to evaluators created here by name. with
+    # a FitnessCache networks scored before are not simulated again
+    if isinstance(evaluator, str):
+        with EVALUATORS[evaluator](config=config) as owned_evaluator:
+            owned_evaluator.profile = profile
+            return evaluate_population(networks, owned_evaluator, stop_policies, cache=cache)
+
+    evaluator.last_profile = None
+    started = time.perf_counter()
+    if cache is None:
+        scores = evaluator.evaluate(networks, stop_policies)
+        simulations = len(scores)
+    else:
+        scores, simulations = evaluate_cached(networks, evaluator, stop_policies, cache)
+    seconds = time.perf_counter() - started
+
+    report = {
+        'evaluator': type(evaluator).__name__,
+        'networks': len(scores),
+        'simulations': simulations,
+        'seconds': seconds,
+        'simulations_per_second': simulations / seconds if seconds > 0 else float('inf'),
+        'steps_saved': evaluator.steps_saved,
+    }
+    if cache is not None:
+        report.update(cache.take_stats())
+    if evaluator.last_profile is not None:
+        report['profile'] = evaluator.last_profile.report()
+    return scores, report
+
+
+def benchmark_generation(networks, track_path=TRACK_PATH, max_workers=None, generations=2):
+    # pickling Network objects to a fresh pool every generation, as the
+    # training loops do, against long lived workers reading shared arrays
+    results = {'networks': len(networks), 'pickled': [], 'shared': []}
+
+    for _ in range(0, generations):
+        started = time.perf_counter()
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers, initializer=_initialize_network_worker, initargs=(track_path,)
+        ) as executor:
+            chunksize = chunk_sizes(len(networks), executor._max_workers)
+            scores = list(executor.map(_score_network, networks, chunksize=chunksize))
+        results['pickled'].append({
+            'seconds': time.perf_counter() - started,
+            'ipc_bytes': pickled_map_bytes(networks, scores, chunksize),
+        })
+
+    population = Population.from_networks(networks)
+    with SharedMemoryEvaluator(population.layer_sizes, len(population), track_path, max_workers) as evaluator:
+        for _ in range(0, generations):
+            evaluator.evaluate(population)
+            results['shared'].append(evaluator.last_generation)
+
+    return results
+
+
+class TestEvaluatePopulation(unittest.TestCase):
+
+    def test_all_evaluators_agree(self):
+        from neural_net import Network
+
+        random.seed(11)
+        networks = [Network(5, 3, 15, 2) for _ in range(0, 6)]
+        track = load_track(TRACK_PATH)
+        expected = [compute_score(network, track) for network in networks]
+
+        for name in sorted(EVALUATORS):
+            scores, report = evaluate_population(networks, name)
+            self.assertEqual(scores, expected, name)
+            self.assertEqual(report['simulations'], 6)
+            self.assertGreater(report['simulations_per_second'], 0)
+
+    def test_genomes_score_like_their_networks(self):
+        from neural_net import Network
+
+        random.seed(12)
+        networks = [Network(5, 3, 15, 2) for _ in range(0, 4)]
+        genomes = [Genome.from_network(network, dtype=np.float64) for network in networks]
+        expected, _ = evaluate_population(networks, 'serial')
+
+        for name in sorted(EVALUATORS):
+            scores, report = evaluate_population(genomes, name)
+            self.assertEqual(scores, expected, name)
+
+    def test_evaluators_agree_on_coarser_config(self):
+        from neural_net import Network
+
+        random.seed(14)
+        networks = [Network(5, 3, 15, 2) for _ in range(0, 4)]
+        config = SimulationConfig(max_steps=600, time_delta_seconds=0.05, substeps=2, control_interval=2)
+        track = load_track(TRACK_PATH)
+        expected = [compute_score(network, track, config=config) for network in networks]
+        self.assertNotEqual(expected, [compute_score(network, track) for network in networks])
+
+        for name in sorted(EVALUATORS):
+            scores, report = evaluate_population(networks, name, config=config)
+            self.assertEqual(scores, expected, name)
+
+        with self.assertRaises(ValueError):
+            BatchedEvaluator(config=SimulationConfig(integrator='verlet'))
+
+    def test_cache_skips_known_networks(self):
+        from neural_net import Network
+
+        random.seed(13)
+        genomes = [Genome.from_network(Network(5, 3, 15, 2)) for _ in range(0, 3)]
+        cache = FitnessCache()
+        with SerialEvaluator() as evaluator:
+            expected, _ = evaluate_population(genomes, evaluator)
+
+            scores, report = evaluate_population(genomes + [genomes[0].clone()], evaluator, cache=cache)
+            self.assertEqual(scores, expected + expected[0:1])
+            self.assertEqual(report['simulations'], 3)
+            self.assertEqual(report['networks'], 4)
+            self.assertEqual((report['cache_hits'], report['cache_misses']), (1, 3))
+
+            scores, report = evaluate_population(genomes, evaluator, cache=cache)
+            self.assertEqual(scores, expected)
+            self.assertEqual(report['simulations'], 0)
+            self.assertEqual(report['cache_hit_rate'], 1.0)
+
+            # another config is another simulation
+            evaluator.config = SimulationConfig(max_steps=100)
+            scores, report = evaluate_population(genomes, evaluator, cache=cache)
+            self.assertEqual(report['cache_misses'], 3)
+
+            # closures of one factory share a name, their scores stay uncached
+            from physics_2d import ScoreCutoffPolicy
+
+            def constant(value):
+                return lambda position: value
+
+            cached = len(cache)
+            stopped, report = evaluate_population(
+                genomes, evaluator, [ScoreCutoffPolicy(constant(1), cutoff=0, grace_steps=0)], cache=cache
+            )
+            self.assertEqual(report['simulations'], 3)
+            running, report = evaluate_population(
+                genomes, evaluator, [ScoreCutoffPolicy(constant(-1), cutoff=0, grace_steps=0)], cache=cache
+            )
+            self.assertEqual(report['simulations'], 3)
+            self.assertEqual(running, scores)
+            self.assertNotEqual(stopped, running)
+            self.assertEqual(len(cache), cached)
+
+    def test_stop_policies_report_saved_steps(self):
+        from neural_net import Network
+        from physics_2d import NoProgressPolicy
+
+        random.seed(13)
+        networks = [Network(5, 3, 15, 2) for _ in range(0, 4)]
+        policies = [NoProgressPolicy(steps=100, min_distance=100)]
+        track = load_track(TRACK_PATH)
+        expected = [simulate_network(network, track, policies) for network in networks]
+
+        for name in ['serial', 'thread', 'process', 'shared']:
+            scores, report = evaluate_population(networks, name, policies)
+            self.assertEqual(scores, [score for score, result in expected])
+            self.assertEqual(report['steps_saved'], sum(result.steps_saved for score, result in expected))
+            self.assertGreater(report['steps_saved'], 0)
+
+        with self.assertRaises(ValueError):
+            evaluate_population(networks, 'batched', policies)
+
+    def test_profiles_merge_across_workers(self):
+        from neural_net import Network
+
+        random.seed(15)
+        networks = [Network(5, 3, 15, 2) for _ in range(0, 4)]
+        config = SimulationConfig(max_steps=300)
+        expected, _ = evaluate_population(networks, 'serial', config=config)
+
+        counts = []
+        for name in ['serial', 'thread', 'process']:
+            scores, report = evaluate_population(networks, name, config=config, profile=True)
+            self.assertEqual(scores, expected, name)
+            profile = report['profile']
+            self.assertEqual(profile['counts']['simulations'], 4)
+            self.assertGreater(profile['network_events_per_decision'], 0)
+            counts.append(profile['counts'])
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(counts[0], counts[2])
+
+        scores, report = evaluate_population(networks, 'serial', config=config)
+        self.assertNotIn('profile', report)
+
+    def test_spawned_workers_score_like_forked_ones(self):
+        from neural_net import Network
+
+        random.seed(16)
+        networks = [Network(5, 3, 15, 2) for _ in range(0, 3)]
+        config = SimulationConfig(max_steps=300)
+        expected, _ = evaluate_population(networks, 'serial', config=config)
+        with ProcessEvaluator(max_workers=1, config=config, start_method='spawn') as evaluator:
+            scores, report = evaluate_population(networks, evaluator)
+        self.assertEqual(scores, expected)
+
+        startup = measure_worker_startup('spawn')
+        self.assertEqual(startup['start_method'], 'spawn')
+        self.assertGreater(startup['seconds'], 0)
+
+    def test_process_evaluator_grows_with_population(self):
+        from neural_net import Network
+
+        random.seed(12)
+        networks = [Network(5, 3, 15, 2) for _ in range(0, 4)]
+        with ProcessEvaluator(max_workers=2) as evaluator:
+            evaluate_population(networks[0:2], evaluator)
+            first = evaluator.shared_evaluator
+            evaluate_population(networks[0:1], evaluator)
+            self.assertIs(evaluator.shared_evaluator, first)
+            scores, report = evaluate_population(networks, evaluator)
+            self.assertIsNot(evaluator.shared_evaluator, first)
+            self.assertEqual(len(scores), 4)
+
+
+class TestSharedMemoryEvaluator(unittest.TestCase):
+
+    def networks(self, count):
+        from neural_net import Network
+
+        random.seed(10)
+        return [Network(5, 3, 15, 2) for _ in range(0, count)]
+
+    def test_scores_match_serial_evaluation(self):
+        networks = self.networks(6)
+        track = load_track(TRACK_PATH)
+        expected = [compute_score(network, track) for network in networks]
+
+        with SharedMemoryEvaluator([5, 5, 5, 5, 2], 10, max_workers=2) as evaluator:
+            self.assertEqual(evaluator.evaluate(networks), expected)
+            # a second generation reuses the same workers and arrays
+            self.assertEqual(evaluator.evaluate(networks[::-1]), expected[::-1])
+            self.assertEqual(evaluator.last_generation['networks'], 6)
+
+    def test_shared_population_pickles_as_name(self):
+        networks = self.networks(3)
+        population = Population.from_networks(networks)
+        shared = SharedPopulation(population.layer_sizes, 3)
+        try:
+            shared.store(population)
+            self.assertLess(len(pickle.dumps(shared)), 200)
+            self.assertEqual(
+                shared[2].evaluate([1, 1, 0, 1, 1]).tolist(),
+                population[2].evaluate([1, 1, 0, 1, 1]).tolist()
+            )
+            with self.assertRaises(ValueError):
+                shared.store(Population.from_networks(self.networks(4)))
+        finally:
+            shared.close()
+
+    def test_benchmark_reports_ipc_bytes(self):
+        results = benchmark_generation(self.networks(4), max_workers=2, generations=1)
+        self.assertEqual(len(results['pickled']), 1)
+        self.assertEqual(len(results['shared']), 1)
+        self.assertLess(results['shared'][0]['ipc_bytes'], results['pickled'][0]['ipc_bytes'])
+
+
+if __name__ == '__main__':
+    unittest.main()
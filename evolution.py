@@ -0,0 +1,323 @@
+import unittest
+import time
+
+import numpy as np
+
+from genome import Genome
+
+
+# every strategy works on the whole generation at once, genomes stacked
+# into one (population, genes) matrix, scores are smaller is better
+
+
+class TruncationSelection:
+    # the top networks, each one parent of the same number of children,
+    # what the training loops always did by hand
+
+    def __init__(self, top=5):
+        self.top = top
+
+    def select(self, scores, count, rng):
+        order = np.argsort(scores, kind='stable')[0:self.top]
+        copies = -(-count // len(order))
+        return np.repeat(order, copies)[0:count]
+
+
+class TournamentSelection:
+
+    def __init__(self, size=3):
+        self.size = size
+
+    def select(self, scores, count, rng):
+        scores = np.asarray(scores)
+        contestants = rng.integers(0, len(scores), size=(count, self.size))
+        winners = np.argmin(scores[contestants], axis=1)
+        return contestants[np.arange(count), winners]
+
+
+class RankSelection:
+    # linear ranking, the best network is picked pressure times as often as
+    # the average one and the worst 2 - pressure times
+
+    def __init__(self, pressure=1.5):
+        if not 1.0 <= pressure <= 2.0:
+            raise ValueError("Rank selection pressure has to be between 1 and 2, got %s" % pressure)
+        self.pressure = pressure
+
+    def probabilities(self, scores):
+        count = len(scores)
+        ranks = np.empty(count)
+        # rank 0 is the worst network
+        ranks[np.argsort(scores, kind='stable')[::-1]] = np.arange(count)
+        if count == 1:
+            return np.ones(1)
+        weights = (2 - self.pressure) + 2 * (self.pressure - 1) * ranks / (count - 1)
+        return weights / weights.sum()
+
+    def select(self, scores, count, rng):
+        return rng.choice(len(scores), size=count, p=self.probabilities(scores))
+
+
+class UniformCrossover:
+
+    def __init__(self, rate=0.5):
+        self.rate = rate
+
+    def cross(self, first, second, gene_layers, rng):
+        return np.where(rng.random(first.shape) < self.rate, second, first)
+
+
+class LayerwiseCrossover:
+    # whole layers, weights together with the thresholds they feed
+
+    def __init__(self, rate=0.5):
+        self.rate = rate
+
+    def cross(self, first, second, gene_layers, rng):
+        from_second = rng.random((first.shape[0], gene_layers.max() + 1)) < self.rate
+        return np.where(from_second[:, gene_layers], second, first)
+
+
+class Mutation:
+    # uniform noise on the weights, rate is the share of weights touched
+
+    def __init__(self, scale=0.1, rate=1.0):
+        self.scale = scale
+        self.rate = rate
+
+    def mutate(self, values, weight_count, rng):
+        noise = rng.uniform(-self.scale, self.scale, (values.shape[0], weight_count))
+        if self.rate < 1.0:
+            noise *= rng.random(noise.shape) < self.rate
+        values[:, 0:weight_count] += noise.astype(values.dtype)
+
+    def adapt(self, success_rate):
+        pass
+
+
+class AdaptiveMutation(Mutation):
+    # one fifth success rule, grows the step while more than a fifth of the
+    # children beat their first parent and shrinks it otherwise
+
+    def __init__(self, scale=0.1, rate=1.0, target=0.2, factor=1.2, minimum=0.001, maximum=1.0):
+        super().__init__(scale, rate)
+        self.target = target
+        self.factor = factor
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def adapt(self, success_rate):
+        if success_rate > self.target:
+            self.scale = min(self.scale * self.factor, self.maximum)
+        elif success_rate < self.target:
+            self.scale = max(self.scale / self.factor, self.minimum)
+
+
+class Evolver:
+
+    def __init__(self, selection=None, crossover=None, mutation=None, population_size=18, elite=3, rng=None):
+        if elite > population_size:
+            raise ValueError("%s elite networks do not fit a population of %s" % (elite, population_size))
+
+        self.selection = selection if selection is not None else TruncationSelection()
+        self.crossover = crossover
+        self.mutation = mutation if mutation is not None else Mutation()
+        self.population_size = population_size
+        self.elite = elite
+        self.rng = rng if rng is not None else np.random.default_rng()
+        # score of the first parent of every child in the last generation
+        self.parent_scores = None
+
+    def populate(self, layer_sizes):
+        return [Genome.random(layer_sizes, self.rng) for _ in range(0, self.population_size)]
+
+    def next_generation(self, genomes, scores):
+        scores = np.asarray(scores, dtype=np.float64)
+        if len(scores) != len(genomes):
+            raise ValueError("Got %s scores for %s genomes" % (len(scores), len(genomes)))
+
+        if self.parent_scores is not None and len(self.parent_scores) <= len(scores):
+            children_scores = scores[0:len(self.parent_scores)]
+            self.mutation.adapt(float(np.mean(children_scores < self.parent_scores)))
+
+        template = genomes[0]
+        values = np.stack([genome.values for genome in genomes])
+        children_count = self.population_size - self.elite
+
+        parents = self.selection.select(scores, children_count, self.rng)
+        children = values[parents]
+        if self.crossover is not None:
+            mates = self.selection.select(scores, children_count, self.rng)
+            children = self.crossover.cross(children, values[mates], template.gene_layers(), self.rng)
+        self.mutation.mutate(children, template.weight_count, self.rng)
+        self.parent_scores = scores[parents]
+
+        # elites go through unchanged but as copies, mutating a child can
+        # never reach back into them
+        elites = values[np.argsort(scores, kind='stable')[0:self.elite]]
+
+        return [
+            Genome(template.layer_sizes, row.copy())
+            for row in np.concatenate([children, elites])
+        ]
+
+    def state(self):
+        # everything the next generation depends on besides the genomes and
+        # their scores, plain values so that it can be written as json
+        return {
+            'rng': self.rng.bit_generator.state,
+            'mutation_scale': self.mutation.scale,
+            'parent_scores': None if self.parent_scores is None else self.parent_scores.tolist(),
+        }
+
+    def restore(self, state):
+        self.rng.bit_generator.state = state['rng']
+        self.mutation.scale = state['mutation_scale']
+        if state['parent_scores'] is None:
+            self.parent_scores = None
+        else:
+            self.parent_scores = np.array(state['parent_scores'], dtype=np.float64)
+
+    def evolve(self, genomes, evaluate, generations, callback=None):
+        for generation in range(0, generations):
+            scores = evaluate(genomes)
+            if callback is not None:
+                callback(generation, genomes, scores)
+            genomes = self.next_generation(genomes, scores)
+        return genomes
+
+
+def convergence(evolver, genomes, evaluate, generations):
+    # best score after every generation against the CPU time of this
+    # process, evaluators running in other processes are not counted so
+    # compare strategies with the serial or batched evaluator
+    history = []
+    started = time.process_time()
+
+    def record(generation, genomes, scores):
+        history.append({
+            'generation': generation,
+            'cpu_seconds': time.process_time() - started,
+            'best_score': float(np.min(scores)),
+        })
+
+    evolver.evolve(genomes, evaluate, generations, record)
+    return history
+
+
+def compare_strategies(evolvers, layer_sizes, evaluate, generations, target=None):
+    # every evolver starts from its own random population of the same shape
+    results = {}
+    for name, evolver in evolvers.items():
+        history = convergence(evolver, evolver.populate(layer_sizes), evaluate, generations)
+        reached = [entry['cpu_seconds'] for entry in history if target is not None and entry['best_score'] <= target]
+        results[name] = {
+            'history': history,
+            'best_score': min(entry['best_score'] for entry in history),
+            'cpu_seconds': history[-1]['cpu_seconds'],
+            'cpu_seconds_to_target': reached[0] if reached else None,
+        }
+    return results
+
+
+def weight_sum(genomes):
+    # toy fitness for the tests, smaller weights are better
+    return [float(np.abs(genome.weights).sum()) for genome in genomes]
+
+
+class TestSelection(unittest.TestCase):
+
+    def test_truncation_matches_the_training_loop(self):
+        scores = [7, 3, 9, 1, 5, 8, 2]
+        parents = TruncationSelection(5).select(scores, 15, np.random.default_rng(0))
+        self.assertEqual(parents.tolist(), [3] * 3 + [6] * 3 + [1] * 3 + [4] * 3 + [0] * 3)
+
+    def test_tournament_prefers_better_scores(self):
+        scores = np.arange(100, dtype=np.float64)
+        parents = TournamentSelection(4).select(scores, 2000, np.random.default_rng(1))
+        self.assertLess(np.mean(parents), 30)
+
+    def test_rank_probabilities(self):
+        probabilities = RankSelection(2.0).probabilities([5.0, 1.0, 3.0])
+        self.assertEqual(probabilities.tolist(), [0.0, 2 / 3, 1 / 3])
+        self.assertAlmostEqual(RankSelection(1.5).probabilities(np.arange(10)).sum(), 1.0)
+        with self.assertRaises(ValueError):
+            RankSelection(3.0)
+
+
+class TestCrossover(unittest.TestCase):
+
+    def setUp(self):
+        self.genome = Genome.random([3, 2, 2])
+        self.first = np.zeros((50, len(self.genome)))
+        self.second = np.ones((50, len(self.genome)))
+
+    def test_uniform(self):
+        children = UniformCrossover().cross(self.first, self.second, self.genome.gene_layers(), np.random.default_rng(2))
+        self.assertTrue(0.3 < children.mean() < 0.7)
+
+    def test_layerwise_keeps_layers_whole(self):
+        gene_layers = self.genome.gene_layers()
+        self.assertEqual(gene_layers.tolist(), [0] * 6 + [1] * 4 + [0] * 2 + [1] * 2)
+        children = LayerwiseCrossover().cross(self.first, self.second, gene_layers, np.random.default_rng(3))
+        for layer in (0, 1):
+            block = children[:, gene_layers == layer]
+            self.assertTrue(np.all(block.min(axis=1) == block.max(axis=1)))
+
+
+class TestEvolver(unittest.TestCase):
+
+    def test_generation_layout(self):
+        rng = np.random.default_rng(4)
+        evolver = Evolver(TruncationSelection(5), population_size=18, elite=3, rng=rng)
+        genomes = evolver.populate([5, 5, 5, 5, 2])
+        scores = weight_sum(genomes)
+        generation = evolver.next_generation(genomes, scores)
+
+        self.assertEqual(len(generation), 18)
+        best = np.argsort(scores, kind='stable')
+        for elite, index in zip(generation[15:], best[0:3]):
+            self.assertEqual(elite, genomes[index])
+            self.assertIsNot(elite, genomes[index])
+            self.assertFalse(np.shares_memory(elite.values, genomes[index].values))
+
+        children = np.stack([child.values for child in generation[0:3]])
+        self.assertTrue(np.all(np.abs(children - genomes[best[0]].values) <= 0.1 + 1e-6))
+
+    def test_elites_are_not_aliased(self):
+        evolver = Evolver(population_size=6, elite=2, rng=np.random.default_rng(5))
+        genomes = evolver.populate([2, 2, 1])
+        generation = evolver.next_generation(genomes, weight_sum(genomes))
+        before = [genome.values.copy() for genome in genomes]
+        for genome in generation:
+            genome.mutate(0.5)
+        for genome, values in zip(genomes, before):
+            self.assertEqual(genome.values.tolist(), values.tolist())
+
+    def test_adaptive_mutation(self):
+        mutation = AdaptiveMutation(scale=0.1)
+        mutation.adapt(0.5)
+        self.assertAlmostEqual(mutation.scale, 0.12)
+        mutation.adapt(0.0)
+        mutation.adapt(0.0)
+        self.assertAlmostEqual(mutation.scale, 0.1 / 1.2)
+
+        evolver = Evolver(TournamentSelection(), mutation=AdaptiveMutation(), population_size=20, elite=2, rng=np.random.default_rng(6))
+        evolver.evolve(evolver.populate([2, 2, 1]), weight_sum, 5)
+        self.assertNotEqual(evolver.mutation.scale, 0.1)
+
+    def test_strategies_converge(self):
+        evolvers = {
+            'truncation': Evolver(TruncationSelection(5), population_size=40, rng=np.random.default_rng(7)),
+            'tournament': Evolver(TournamentSelection(3), UniformCrossover(), population_size=40, rng=np.random.default_rng(7)),
+            'rank': Evolver(RankSelection(), LayerwiseCrossover(), AdaptiveMutation(), population_size=40, rng=np.random.default_rng(7)),
+        }
+        results = compare_strategies(evolvers, [3, 4, 2], weight_sum, 30, target=5.0)
+        for name, result in results.items():
+            self.assertEqual(len(result['history']), 30)
+            self.assertLess(result['best_score'], result['history'][0]['best_score'], name)
+            self.assertGreaterEqual(result['cpu_seconds'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,219 @@
+import unittest
+import os
+import json
+import hashlib
+import tempfile
+import collections
+
+import numpy as np
+
+from genome import Genome
+from compiled_net import CompiledNetwork, compile_network
+from pruning import SparseNetwork
+
+
+FITNESS_CACHE_VERSION = 1
+
+
+def network_digest(network):
+    if isinstance(network, (Genome, SparseNetwork)):
+        return network.digest()
+    compiled = compile_network(network)
+    if compiled.masks is not None:
+        # pruned, the missing connections are part of what it is
+        return SparseNetwork.from_compiled(compiled).digest()
+    return Genome.from_compiled(compiled, dtype=np.float64).digest()
+
+
+def policy_key(stop_policies):
+    # the settings of every policy, functions by name so that the key stays
+    # the same across runs. None when a policy holds a lambda, a closure or
+    # another function whose name does not say what it does, two of those
+    # can share a name and score differently
+    key = []
+    for policy in stop_policies or []:
+        settings = []
+        for name, value in sorted(vars(policy).items()):
+            if callable(value):
+                qualname = getattr(value, '__qualname__', None)
+                if qualname is None or '<lambda>' in qualname or '<locals>' in qualname:
+                    return None
+                value = '%s.%s' % (getattr(value, '__module__', ''), qualname)
+            settings.append((name, value))
+        key.append((type(policy).__name__, settings))
+    return repr(key)
+
+
+class FitnessCache:
+    # simulations are deterministic given the weights, the track and the
+    # config, so a score once computed is the score forever
+
+    def __init__(self, capacity=100000, path=None):
+        self.capacity = capacity
+        self.path = path
+        self.scores = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def accepts(self, stop_policies):
+        return policy_key(stop_policies) is not None
+
+    def key(self, network, track_key, config, stop_policies=None):
+        policies = policy_key(stop_policies)
+        if policies is None:
+            raise ValueError("Scores under stop policies holding lambdas or local functions can not be cached")
+
+        digest = hashlib.sha256()
+        for part in (network_digest(network), track_key, repr(config.key()), policies):
+            digest.update(part.encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key):
+        score = self.scores.get(key)
+        if score is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.scores.move_to_end(key)
+        return score
+
+    def lookup(self, keys):
+        # scores of the known keys and None for the rest, with the positions
+        # of every unknown key. a key repeated within one lookup is only
+        # missed once, the repeats are hits
+        scores = [None] * len(keys)
+        missing = collections.OrderedDict()
+        for index, key in enumerate(keys):
+            if key in missing:
+                self.hits += 1
+                missing[key].append(index)
+                continue
+            scores[index] = self.get(key)
+            if scores[index] is None:
+                missing[key] = [index]
+        return scores, missing
+
+    def put(self, key, score):
+        self.scores[key] = score
+        self.scores.move_to_end(key)
+        while len(self.scores) > self.capacity:
+            self.scores.popitem(last=False)
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __contains__(self, key):
+        return key in self.scores
+
+    def take_stats(self):
+        # hits and misses since the last call, one call per generation
+        lookups = self.hits + self.misses
+        stats = {
+            'cache_hits': self.hits,
+            'cache_misses': self.misses,
+            'cache_hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+        self.hits = 0
+        self.misses = 0
+        return stats
+
+    def save(self, path=None):
+        path = path or self.path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix='.json')
+        with os.fdopen(descriptor, 'w') as cache_file:
+            json.dump({'version': FITNESS_CACHE_VERSION, 'scores': list(self.scores.items())}, cache_file)
+        os.replace(temporary_path, path)
+
+    def load(self, path=None):
+        with open(path or self.path) as cache_file:
+            data = json.load(cache_file)
+        # scores of an older format may have been computed differently
+        if data.get('version') != FITNESS_CACHE_VERSION:
+            return
+        for key, score in data['scores']:
+            self.put(key, score)
+
+
+class TestFitnessCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = FitnessCache(capacity=2)
+        cache.put('a', 1.0)
+        cache.put('b', 2.0)
+        self.assertEqual(cache.get('a'), 1.0)
+        cache.put('c', 3.0)
+
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), 3.0)
+        self.assertEqual(cache.take_stats(), {'cache_hits': 2, 'cache_misses': 1, 'cache_hit_rate': 2 / 3})
+        self.assertEqual(cache.take_stats()['cache_hits'], 0)
+
+    def test_key(self):
+        from physics_2d import SimulationConfig, NoProgressPolicy
+
+        genome = Genome.random([2, 3, 1], np.random.default_rng(0))
+        cache = FitnessCache()
+        key = cache.key(genome, 'track', SimulationConfig())
+
+        self.assertEqual(cache.key(genome.clone(), 'track', SimulationConfig()), key)
+        self.assertNotEqual(cache.key(genome.clone().mutate(0.1), 'track', SimulationConfig()), key)
+        self.assertNotEqual(cache.key(genome, 'other', SimulationConfig()), key)
+        self.assertNotEqual(cache.key(genome, 'track', SimulationConfig(max_steps=10)), key)
+        self.assertNotEqual(cache.key(genome, 'track', SimulationConfig(), [NoProgressPolicy()]), key)
+        self.assertNotEqual(
+            cache.key(genome, 'track', SimulationConfig(), [NoProgressPolicy(steps=100)]),
+            cache.key(genome, 'track', SimulationConfig(), [NoProgressPolicy()]),
+        )
+
+    def test_policies_with_anonymous_functions_are_not_cached(self):
+        from physics_2d import SimulationConfig, ScoreCutoffPolicy
+
+        def cutoff_at(limit):
+            return lambda position: limit - position.x
+
+        def named_cutoff_at(limit):
+            def score(position):
+                return limit - position.x
+            return score
+
+        genome = Genome.random([2, 3, 1], np.random.default_rng(0))
+        cache = FitnessCache()
+        for score_function in (cutoff_at(400), named_cutoff_at(400)):
+            policies = [ScoreCutoffPolicy(score_function, cutoff=400)]
+            self.assertFalse(cache.accepts(policies))
+            with self.assertRaises(ValueError):
+                cache.key(genome, 'track', SimulationConfig(), policies)
+
+        policies = [ScoreCutoffPolicy(network_digest, cutoff=400)]
+        self.assertTrue(cache.accepts(policies))
+        self.assertEqual(
+            cache.key(genome, 'track', SimulationConfig(), policies),
+            cache.key(genome, 'track', SimulationConfig(), [ScoreCutoffPolicy(network_digest, cutoff=400)]),
+        )
+
+    def test_network_digest(self):
+        from neural_net import Network
+
+        network = Network(2, 1, 3, 1)
+        self.assertEqual(network_digest(network), network_digest(CompiledNetwork.from_network(network)))
+
+    def test_persistence(self):
+        path = os.path.join(tempfile.mkdtemp(), 'fitness.json')
+        cache = FitnessCache(path=path)
+        cache.put('a', 0.1 + 0.2)
+        cache.save()
+
+        restored = FitnessCache(path=path)
+        self.assertEqual(restored.get('a'), 0.1 + 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+import unittest
+import random
+import struct
+import hashlib
+
+import numpy as np
+
+from neural_net import Network
+from compiled_net import CompiledNetwork, Population
+
+
+GENOME_MAGIC = b'NGN1'
+GENOME_DTYPES = {'f4': np.float32, 'f8': np.float64}
+
+
+class Genome:
+    # every weight of a network followed by every threshold in one flat
+    # vector, layer by layer. layer_sizes is the shape header.
+
+    def __init__(self, layer_sizes, values):
+        self.layer_sizes = list(layer_sizes)
+        self.values = values
+
+        self.weight_count = 0
+        for inputs, outputs in zip(self.layer_sizes, self.layer_sizes[1:]):
+            self.weight_count += inputs * outputs
+
+        expected = self.weight_count + sum(self.layer_sizes[1:])
+        if len(values) != expected:
+            raise ValueError("Genome of shape %s needs %s values, got %s" % (
+                self.layer_sizes, expected, len(values)
+            ))
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def from_compiled(cls, compiled, dtype=np.float32):
+        if compiled.masks is not None:
+            raise ValueError("A genome has every connection, pruned networks have none")
+        parts = [layer.ravel() for layer in compiled.weights]
+        parts.extend(compiled.thresholds)
+        return cls(compiled.layer_sizes, np.concatenate(parts).astype(dtype))
+
+    @classmethod
+    def from_network(cls, network, dtype=np.float32):
+        # float32 halves the size of a genome, going back to a Network and
+        # again to a genome is exact but the first rounding from the
+        # float64 strengths of a Network is not, use dtype=np.float64 then
+        return cls.from_compiled(CompiledNetwork.from_network(network), dtype)
+
+    @classmethod
+    def random(cls, layer_sizes, rng=None, dtype=np.float32):
+        # same distribution as a new Network, weights in [0, 1), thresholds 0.5
+        if rng is None:
+            rng = np.random.default_rng()
+        genome = cls(layer_sizes, np.full(Genome.size(layer_sizes), 0.5, dtype=dtype))
+        genome.weights[:] = rng.random(genome.weight_count)
+        return genome
+
+    @staticmethod
+    def size(layer_sizes):
+        weights = sum(inputs * outputs for inputs, outputs in zip(layer_sizes, layer_sizes[1:]))
+        return weights + sum(layer_sizes[1:])
+
+    @property
+    def weights(self):
+        return self.values[0:self.weight_count]
+
+    @property
+    def thresholds(self):
+        return self.values[self.weight_count:]
+
+    def layers(self):
+        weights = []
+        thresholds = []
+        weight_offset = 0
+        threshold_offset = self.weight_count
+        for inputs, outputs in zip(self.layer_sizes, self.layer_sizes[1:]):
+            weights.append(self.values[weight_offset:weight_offset + inputs * outputs].reshape(inputs, outputs))
+            thresholds.append(self.values[threshold_offset:threshold_offset + outputs])
+            weight_offset += inputs * outputs
+            threshold_offset += outputs
+        return weights, thresholds
+
+    def gene_layers(self):
+        # index of the layer every value belongs to, weights of a layer and
+        # the thresholds of the neurons they feed share the same index
+        layer_ids = np.empty(len(self.values), dtype=np.intp)
+        weight_offset = 0
+        threshold_offset = self.weight_count
+        for layer, (inputs, outputs) in enumerate(zip(self.layer_sizes, self.layer_sizes[1:])):
+            layer_ids[weight_offset:weight_offset + inputs * outputs] = layer
+            layer_ids[threshold_offset:threshold_offset + outputs] = layer
+            weight_offset += inputs * outputs
+            threshold_offset += outputs
+        return layer_ids
+
+    def to_compiled(self):
+        weights, thresholds = self.layers()
+        return CompiledNetwork(weights, thresholds)
+
+    def to_network(self):
+        hidden_sizes = self.layer_sizes[1:-1]
+        if not hidden_sizes or len(set(hidden_sizes)) != 1:
+            raise ValueError("A Network needs equally sized hidden layers, got %s" % self.layer_sizes)
+
+        network = Network(
+            self.layer_sizes[0], len(hidden_sizes), sum(hidden_sizes), self.layer_sizes[-1]
+        )
+        weights, thresholds = self.layers()
+        layers = [network.input_layer] + network.hidden_layers + [network.output_layer]
+        for layer, next_layer, layer_weights, layer_thresholds in zip(layers, layers[1:], weights, thresholds):
+            for row, neuron in enumerate(layer):
+                for column, connection in enumerate(neuron.connections):
+                    connection.strength = float(layer_weights[row, column])
+            for neuron, threshold in zip(next_layer, layer_thresholds):
+                neuron.threshold = float(threshold)
+
+        return network
+
+    def clone(self):
+        return Genome(self.layer_sizes, self.values.copy())
+
+    def mutate(self, scale=0.1, rng=None):
+        # the vectorized randomize_connections, thresholds stay as they are
+        if rng is None:
+            rng = np.random.default_rng()
+        self.weights[:] += rng.uniform(-scale, scale, self.weight_count).astype(self.values.dtype)
+        return self
+
+    def to_bytes(self):
+        dtype = self.values.dtype.str[1:]
+        header = struct.pack('<4s2sH', GENOME_MAGIC, dtype.encode(), len(self.layer_sizes))
+        header += struct.pack('<%sI' % len(self.layer_sizes), *self.layer_sizes)
+        return header + self.values.astype('<' + dtype).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, dtype, layer_count = struct.unpack_from('<4s2sH', data)
+        if magic != GENOME_MAGIC:
+            raise ValueError("Not a genome")
+        offset = struct.calcsize('<4s2sH')
+        layer_sizes = struct.unpack_from('<%sI' % layer_count, data, offset)
+        offset += 4 * layer_count
+
+        dtype = dtype.decode()
+        values = np.frombuffer(data, dtype='<' + dtype, offset=offset).astype(GENOME_DTYPES[dtype])
+        return cls(layer_sizes, values)
+
+    def digest(self):
+        return hashlib.sha256(self.to_bytes()).hexdigest()
+
+    def __eq__(self, other):
+        return self.layer_sizes == other.layer_sizes and np.array_equal(self.values, other.values)
+
+
+def population_from_genomes(genomes):
+    # stacks the flat vectors once and slices the layers out of the stack
+    layer_sizes = genomes[0].layer_sizes
+    for genome in genomes:
+        if genome.layer_sizes != layer_sizes:
+            raise ValueError("All genomes of a population need the same shape, got %s and %s" % (
+                layer_sizes, genome.layer_sizes
+            ))
+
+    stacked = np.stack([genome.values for genome in genomes]).astype(np.float64)
+    count = len(genomes)
+
+    weights = []
+    thresholds = []
+    weight_offset = 0
+    threshold_offset = genomes[0].weight_count
+    for inputs, outputs in zip(layer_sizes, layer_sizes[1:]):
+        weights.append(stacked[:, weight_offset:weight_offset + inputs * outputs].reshape(count, inputs, outputs))
+        thresholds.append(stacked[:, threshold_offset:threshold_offset + outputs])
+        weight_offset += inputs * outputs
+        threshold_offset += outputs
+
+    return Population(weights, thresholds)
+
+
+class TestGenome(unittest.TestCase):
+
+    def test_network_round_trip(self):
+        random.seed(17)
+        network = Network(5, 3, 15, 2)
+        network.randomize_connections()
+
+        exact = Genome.from_network(network, dtype=np.float64)
+        restored = exact.to_network()
+        self.assertEqual(
+            CompiledNetwork.from_network(restored).evaluate([1, 1, 0, 1, 0]).tolist(),
+            CompiledNetwork.from_network(network).evaluate([1, 1, 0, 1, 0]).tolist()
+        )
+        self.assertEqual(Genome.from_network(restored, dtype=np.float64), exact)
+
+        compact = Genome.from_network(network)
+        self.assertEqual(compact.values.dtype, np.float32)
+        self.assertEqual(Genome.from_network(compact.to_network()), compact)
+
+    def test_layout(self):
+        genome = Genome.from_network(Network(5, 3, 15, 2))
+        self.assertEqual(genome.layer_sizes, [5, 5, 5, 5, 2])
+        self.assertEqual(genome.weight_count, 25 + 25 + 25 + 10)
+        self.assertEqual(len(genome), 85 + 17)
+        self.assertEqual(genome.thresholds.tolist(), [0.5] * 17)
+
+    def test_clone_and_mutate(self):
+        rng = np.random.default_rng(0)
+        genome = Genome.random([5, 5, 5, 5, 2], rng)
+        child = genome.clone().mutate(0.1, rng)
+
+        self.assertFalse(np.shares_memory(child.values, genome.values))
+        difference = child.values - genome.values
+        self.assertTrue(np.all(np.abs(difference[0:genome.weight_count]) <= 0.1))
+        self.assertTrue(np.any(difference[0:genome.weight_count] != 0))
+        self.assertEqual(difference[genome.weight_count:].tolist(), [0] * 17)
+
+    def test_bytes_round_trip(self):
+        genome = Genome.random([5, 5, 5, 5, 2], np.random.default_rng(1))
+        data = genome.to_bytes()
+        self.assertEqual(len(data), 8 + 5 * 4 + len(genome) * 4)
+        self.assertEqual(Genome.from_bytes(data), genome)
+
+        exact = Genome.random([2, 3, 1], np.random.default_rng(1), dtype=np.float64)
+        self.assertEqual(Genome.from_bytes(exact.to_bytes()), exact)
+
+    def test_population(self):
+        rng = np.random.default_rng(2)
+        genomes = [Genome.random([5, 5, 5, 5, 2], rng) for _ in range(0, 6)]
+        population = population_from_genomes(genomes)
+        for index, genome in enumerate(genomes):
+            self.assertEqual(
+                population[index].evaluate([1, 0, 1, 1, 1]).tolist(),
+                genome.to_compiled().evaluate([1, 0, 1, 1, 1]).tolist()
+            )
+
+    def test_wrong_size(self):
+        with self.assertRaises(ValueError):
+            Genome([2, 1], np.zeros(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,8 @@
+import sys
 import pickle
 import arcade
 
-from physics_2d import *
+from recording import StateStream, is_state_stream
 
 
 
@@ -12,10 +13,12 @@ SCREEN_HEIGHT = 500
 class SimulationVisualisation(arcade.Window):
 
     
-    def __init__(self, width, height, title, simulation):
+    def __init__(self, width, height, title, states, track_granularity_m=0.1):
         super().__init__(width, height, title)
 
-        self.simulation = simulation
+        # a list of recorded steps or a StateStream read frame by frame
+        self.states = states
+        self.track_granularity_m = track_granularity_m
         self.current_step = 0
 
     def setup(self):
@@ -23,10 +26,7 @@ class SimulationVisualisation(arcade.Window):
 
     def on_draw(self):
         arcade.start_render()
-        try:
-            step = self.simulation.states[self.current_step]
-        except:
-            step = self.simulation.states[-1]
+        step = self.states[min(self.current_step, len(self.states) - 1)]
 
         self.current_step +=1 
         arcade.draw_lrwh_rectangle_textured(
@@ -36,8 +36,8 @@ class SimulationVisualisation(arcade.Window):
         )
 
         arcade.draw_rectangle_filled(
-            step[0].x / self.simulation.plane.track_granularity_m,
-            step[0].y / self.simulation.plane.track_granularity_m,
+            step[0].x / self.track_granularity_m,
+            step[0].y / self.track_granularity_m,
             10,
             10,
             arcade.color.ALIZARIN_CRIMSON
@@ -46,13 +46,21 @@ class SimulationVisualisation(arcade.Window):
 
 
 def main():
-    result_sim = pickle.load(open('result.sim', 'rb'))
+    path = sys.argv[1] if len(sys.argv) > 1 else 'result.sim'
 
-    for step in result_sim.states:
+    if is_state_stream(path):
+        states = StateStream(path)
+        track_granularity_m = 0.1
+    else:
+        result_sim = pickle.load(open(path, 'rb'))
+        states = result_sim.states
+        track_granularity_m = result_sim.plane.track_granularity_m
+
+    for step in states:
         for an_object in step:
             print("object %s" % str(an_object))
 
-    window = SimulationVisualisation(SCREEN_WIDTH, SCREEN_HEIGHT, "Sim", result_sim)
+    window = SimulationVisualisation(SCREEN_WIDTH, SCREEN_HEIGHT, "Sim", states, track_granularity_m)
     window.setup()
     arcade.run()
 
@@ -1,64 +1,120 @@
-import pickle
+import os
+import argparse
+import multiprocessing
 
-from physics_2d import *
+from physics_2d import NoProgressPolicy
 from neural_net import Network
+from genome import Genome
+from evaluation import ProcessEvaluator, evaluate_population
+from evolution import Evolver, TruncationSelection, Mutation
+from fitness_cache import FitnessCache
+from checkpoint import Checkpoint, CheckpointManager, record_trajectory
+from scenarios import ScenarioSet, ScenarioEvaluator
 
 
-track = load_track_data_from_image('tracks/1.png')
-
-# generate networks
-networks = []
-for _ in range(0, 16):
-    networks.append(
-        Network(5, 3, 15, 2)
-    )
-
-def compute_network(network):
-    plane = PhysicalPlaneWithTrack(track)
-    sim = Simulation(plane)
-    car = Car(
-        10, 20, 200,
-        CarNeuralControlManager(network)
-    )
-    plane.add_physical_object(car, position=Vector2D(2, 4))
-
-    collision, last_step = sim.simulate()
-    print(collision, last_step)
-    # calculate how far away from end of track
-    final_position = plane.physical_objects[0][1]
-    score = (500 - final_position.x) + (500 - final_position.y)
-    return score
-
-import concurrent.futures
-
-for generation in range(0, 1000):
-    scored_networks = []
-
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        for network, score in zip(networks, executor.map(compute_network, networks)):
-            score = compute_network(network)
-            scored_networks.append((score, network))
-
-    # order by highest score
-    top_networks = sorted(scored_networks, key=lambda x: x[0])[0:5]
-    for net in top_networks:
-        print(net[0])
-    new_networks = []
-
-    for top_network in top_networks:
-        for x in range(0, 3):
-            new_networks.append(
-                copy.deepcopy(top_network[1])
+def train(generations=1000, checkpoint_dir='checkpoints', checkpoint_every=10, resume=False,
+          result_path='result.sim', metric='manhattan', profile=False, start_method=None, stop_early=False):
+    evolver = Evolver(TruncationSelection(top=5), mutation=Mutation(0.1), population_size=18, elite=3)
+    checkpoints = CheckpointManager(checkpoint_dir, every=checkpoint_every)
+    # cars that stand still or spin in place do not need the full step budget,
+    # but cutting them short changes the scores, so only when asked for. Cars
+    # start from rest and get a grace period to pick up speed first
+    stop_policies = None
+    if stop_early:
+        stop_policies = [NoProgressPolicy(steps=200, min_distance=1.0, grace_steps=200)]
+    # the elites carried over unchanged are not simulated again, saved with
+    # every checkpoint so a resumed run does not start cold either
+    cache = FitnessCache(path=os.path.join(checkpoint_dir, 'fitness.json'))
+
+    checkpoint = checkpoints.latest() if resume else None
+    if checkpoint is not None:
+        print("Resuming after generation %s, best score so far %s" % (checkpoint.generation, checkpoint.best_score))
+        networks = checkpoint.resume(evolver)
+        best_genome, best_score = checkpoint.best_genome, checkpoint.best_score
+        first_generation = checkpoint.generation + 1
+    else:
+        # generate networks, kept as flat genomes between generations
+        networks = []
+        for _ in range(0, 16):
+            networks.append(
+                Genome.from_network(Network(5, 3, 15, 2))
             )
+        best_genome, best_score = None, None
+        first_generation = 0
+
+    if metric == 'manhattan':
+        evaluator = ProcessEvaluator(start_method=start_method)
+    else:
+        # distance left along the track instead of in a straight line
+        evaluator = ScenarioEvaluator(ScenarioSet.grid(metric=metric), start_method=start_method)
+    evaluator.profile = profile
+
+    with evaluator:
+        for generation in range(first_generation, generations):
+            # every new network is simulated exactly once
+            scores, report = evaluate_population(networks, evaluator, stop_policies, cache=cache)
+            print("Generation %s: %s simulations in %.2fs, %.1f simulations/s, %s steps saved, %.0f%% cache hits" % (
+                generation, report['simulations'], report['seconds'], report['simulations_per_second'],
+                report['steps_saved'], report['cache_hit_rate'] * 100
+            ))
+            if 'profile' in report:
+                print("  per step: %s" % ', '.join(
+                    "%s %.1fus (%.0f%%)" % (phase, report['profile']['per_step_us'][phase], share * 100)
+                    for phase, share in report['profile']['share'].items()
+                ))
+                print("  %.1f network events per decision, %.1f sensor iterations per ray" % (
+                    report['profile']['network_events_per_decision'], report['profile']['sensor_iterations_per_ray']
+                ))
+
+            # order by highest score
+            for score in sorted(scores)[0:5]:
+                print(score)
+
+            score, genome = min(zip(scores, networks), key=lambda x: x[0])
+            improved = best_score is None or score < best_score
+            if improved:
+                best_genome, best_score = genome.clone(), score
+                checkpoints.best_changed()
+
+            if checkpoints.is_due(generation) or generation == generations - 1:
+                checkpoints.save(Checkpoint(
+                    generation, networks, scores, evolver.state(),
+                    best_genome=best_genome, best_score=best_score,
+                ))
+                cache.save()
+                checkpoints.record_best(best_genome, stop_policies=stop_policies)
+
+            # top 5 networks with 3 mutated children each, the best 3 kept as they are
+            networks = evolver.next_generation(networks, scores)
+
+    # the whole trajectory of the best car, python load.py plays it back
+    if best_genome is not None:
+        record_trajectory(best_genome, result_path, stop_policies=stop_policies)
+    return best_genome, best_score
+
+
+def main(argv=None):
+    # importing this module only defines things, pool workers started with
+    # spawn or forkserver import it again and must not start training
+    parser = argparse.ArgumentParser(description="Evolve networks driving a car around the track")
+    parser.add_argument('--generations', type=int, default=1000)
+    parser.add_argument('--checkpoint-dir', default='checkpoints')
+    parser.add_argument('--checkpoint-every', type=int, default=10)
+    parser.add_argument('--resume', action='store_true', help="continue from the latest checkpoint")
+    parser.add_argument('--result', default='result.sim')
+    parser.add_argument('--metric', choices=['manhattan', 'geodesic'], default='manhattan',
+                        help="how the distance of the car to the end of the track is measured")
+    parser.add_argument('--profile', action='store_true', help="time every simulation step by phase")
+    parser.add_argument('--start-method', choices=multiprocessing.get_all_start_methods(),
+                        help="how evaluation workers are started, the platform default when not given")
+    parser.add_argument('--stop-early', action='store_true',
+                        help="end simulations of cars that make no progress, faster but scored differently")
+    arguments = parser.parse_args(argv)
 
-    for network in new_networks:
-        network.randomize_connections()
-        
-    new_networks.append(top_networks[0][1]) # append best network
-    new_networks.append(top_networks[1][1]) # append best network
-    new_networks.append(top_networks[2][1]) # append best network
+    return train(arguments.generations, arguments.checkpoint_dir, arguments.checkpoint_every, arguments.resume,
+                 arguments.result, arguments.metric, arguments.profile, arguments.start_method,
+                 arguments.stop_early)
 
-    networks = new_networks
-        
 
-pickle.dump(sim, open("result.sim", "wb"))
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
+import unittest
 import random
-import copy
 import string
 
 
@@ -116,15 +116,148 @@ class Network:
         for neuron in self.all_neurons:
             neuron.clean_saturation()
 
+    def prune(self, min_strength):
+        # drops every connection weaker than min_strength, fire and
+        # fire_inputs never walk them again. A dropped connection is not the
+        # same as a zero strength one, that still delivers a spike which can
+        # fire a neuron already over its threshold once more.
+        removed = 0
+        for neuron in self.all_neurons:
+            kept = [connection for connection in neuron.connections if abs(connection.strength) >= min_strength]
+            removed += len(neuron.connections) - len(kept)
+            neuron.connections = kept
+        return removed
+
+    def connection_count(self):
+        return sum(len(neuron.connections) for neuron in self.all_neurons)
+
+    def fire_inputs(self, fired_inputs, refire='always'):
+        # Same cascade as calling fire() on the input neurons, walked with an
+        # explicit stack so deep networks do not hit the recursion limit.
+        # Every spike a connection delivers is one event. With refire
+        # 'always' a neuron fires again on every spike that leaves it at or
+        # above its threshold, like receive_fire does, with 'once' it fires
+        # only the first time it gets there.
+        if refire not in ('always', 'once'):
+            raise ValueError("Unknown refire policy %s" % refire)
+
+        events = 0
+        fires = 0
+        fired_neurons = set()
+
+        for input_neuron, is_fired in zip(self.input_layer, fired_inputs):
+            if not is_fired:
+                continue
+
+            fires += 1
+            stack = [iter(input_neuron.connections)]
+            while stack:
+                connection = next(stack[-1], None)
+                if connection is None:
+                    stack.pop()
+                    continue
+
+                neuron = connection.neuronB
+                neuron.saturation += connection.strength
+                events += 1
+                if neuron.saturation >= neuron.threshold:
+                    if refire == 'once':
+                        if id(neuron) in fired_neurons:
+                            continue
+                        fired_neurons.add(id(neuron))
+                    fires += 1
+                    stack.append(iter(neuron.connections))
+
+        self.last_propagation = {'events': events, 'fires': fires}
+        return self.last_propagation
+
+
+class TestEventPropagation(unittest.TestCase):
+
+    def saturations(self, network):
+        return [neuron.saturation for neuron in network.all_neurons]
+
+    def test_matches_recursive_fire(self):
+        random.seed(15)
+        for shape in [(5, 3, 15, 2), (2, 4, 40, 3)]:
+            for _ in range(0, 20):
+                network = Network(*shape)
+                for neuron in network.all_neurons:
+                    for connection in neuron.connections:
+                        connection.strength -= random.random() * 0.3
+                fired_inputs = [random.random() > 0.4 for _ in range(0, shape[0])]
+
+                for input_neuron, is_fired in zip(network.input_layer, fired_inputs):
+                    if is_fired:
+                        input_neuron.fire()
+                expected = self.saturations(network)
+
+                network.reset()
+                network.fire_inputs(fired_inputs)
+                self.assertEqual(self.saturations(network), expected)
+
+    def test_counts_events(self):
+        network = Network(2, 1, 2, 1)
+        for neuron in network.all_neurons:
+            for connection in neuron.connections:
+                connection.strength = 1.0
+
+        # input -> 2 hidden spikes, each hidden fires once into the output
+        self.assertEqual(network.fire_inputs([1, 0]), {'events': 4, 'fires': 5})
+        network.reset()
+        # the second input makes both hidden neurons fire again
+        self.assertEqual(network.fire_inputs([1, 1]), {'events': 8, 'fires': 10})
+        network.reset()
+        self.assertEqual(network.fire_inputs([1, 1], refire='once'), {'events': 6, 'fires': 5})
+        self.assertEqual(network.output_layer[0].saturation, 2.0)
+
+    def test_deep_network_does_not_recurse(self):
+        network = Network(1, 2000, 2000, 1)
+        for neuron in network.all_neurons:
+            for connection in neuron.connections:
+                connection.strength = 1.0
+
+        stats = network.fire_inputs([1])
+        self.assertEqual(stats['events'], 2001)
+        self.assertEqual(network.output_layer[0].saturation, 1.0)
+
+    def test_prune(self):
+        random.seed(25)
+        network = Network(5, 3, 15, 2)
+        self.assertEqual(network.connection_count(), 85)
+        strengths = [connection.strength for neuron in network.all_neurons for connection in neuron.connections]
+        removed = network.prune(0.3)
+        self.assertEqual(removed, len([strength for strength in strengths if strength < 0.3]))
+        self.assertEqual(network.connection_count(), 85 - removed)
+
+        # both cascades skip the dropped connections
+        network.reset()
+        network.fire_inputs([1, 1, 1, 1, 1])
+        expected = self.saturations(network)
+        network.reset()
+        for input_neuron in network.input_layer:
+            input_neuron.fire()
+        self.assertEqual(self.saturations(network), expected)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            Network(2, 1, 2, 1).fire_inputs([1, 1], refire='sometimes')
+
 
 if __name__ == '__main__':
-    # initiate the networks
+    from genome import Genome
+    from evolution import Evolver, TruncationSelection
+
+    evolver = Evolver(TruncationSelection(top=4), population_size=17, elite=1)
+
+    # initiate the networks, kept as flat genomes between generations
     networks = []
     for x in range(0, 500):
-        networks.append(Network(2, 4, 40, 3))
+        networks.append(Genome.from_network(Network(2, 4, 40, 3)))
 
 
-    def compute_network(network):
+    def compute_network(genome):
+        network = genome.to_network()
         desired_effects = [
             ((1, 0), (10, 5, 5)),
             ((0, 1), (5, 10, 5)),
@@ -167,9 +300,9 @@ if __name__ == '__main__':
         ## judge networks by assumptions
         scores = []
         with concurrent.futures.ProcessPoolExecutor() as executor:
-            for network, score in zip(networks, executor.map(compute_network, networks)):
+            for score in executor.map(compute_network, networks):
                 print("Score %s" % score)
-                scores.append((score, network))
+                scores.append(score)
 
 
     #        for network in networks:
@@ -179,23 +312,9 @@ if __name__ == '__main__':
     #            scores.append((score, network))
     #                
 
-        # order the networks according to the score
-        # take 5 top networks and create 10 more with deepcopy (5 each)
-        top_net = sorted(scores, key=lambda x: x[0])[0:4]
-        new_networks = []
-        for top_network in top_net:
-            for x in range(0, 4):
-                new_networks.append(copy.deepcopy(top_network[1]))
-
-
-        for network in new_networks:
-            network.randomize_connections()
-
-
-        new_networks.append(top_net[0][1]) # append best network
-        #random.shuffle(new_networks)
+        # take 4 top networks with 4 mutated children each, plus the best
+        networks = evolver.next_generation(networks, scores)
 
-        networks = new_networks
 
 
     import pdb; pdb.set_trace()
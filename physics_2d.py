@@ -2,56 +2,444 @@ import unittest
 import math
 import random
 import copy
+import time
 
-from PIL import Image
 from neural_net import Network
+from compiled_net import compile_network
+from track import Track
+from recording import ListRecorder
 from collections import defaultdict
 
 
+class SimulationResult(tuple):
+
+    def __new__(cls, is_collision, steps, stop_reason=None, steps_saved=0):
+        # unpacks like the (is_collision, steps) tuple simulate used to return
+        result = super().__new__(cls, (is_collision, steps))
+        result.stop_reason = stop_reason
+        result.steps_saved = steps_saved
+        return result
+
+    def __getnewargs__(self):
+        return (self[0], self[1], self.stop_reason, self.steps_saved)
+
+    @property
+    def is_collision(self):
+        return self[0]
+
+    @property
+    def steps(self):
+        return self[1]
+
+
 class Simulation:
 
-    def __init__(self, plane):
+    def __init__(self, plane, max_steps=3000, stop_policies=None, recorder=None, control_interval=1,
+                 profiler=None):
         self.plane = plane
-        self.states = []
+        if recorder is None:
+            recorder = ListRecorder()
+        self.recorder = recorder
+        self.max_steps = max_steps
+        # objects decide on their controls every control_interval steps and
+        # keep them in between
+        self.control_interval = control_interval
+        # policies keep per run state, so every simulation gets its own copy
+        self.stop_policies = [copy.copy(policy) for policy in stop_policies or []]
+        # without a profiler nothing is timed or counted
+        self.profiler = profiler
+
+    def step(self, step_number):
+        self.plane.calculate_time_derivatives()
+        if step_number % self.control_interval == 0:
+            self.plane.apply_object_actions()
+        is_collision = self.plane.detect_collisions()
+
+        self.recorder.record(self.plane, step_number)
+        return is_collision
+
+    def profiled_step(self, step_number):
+        clock = time.perf_counter
+        started = clock()
+        self.plane.calculate_time_derivatives()
+        integrated = clock()
+        if step_number % self.control_interval == 0:
+            self.plane.apply_object_actions()
+        acted = clock()
+        is_collision = self.plane.detect_collisions()
+        detected = clock()
+
+        self.recorder.record(self.plane, step_number)
+        self.profiler.record_step(integrated - started, acted - integrated, detected - acted, clock() - detected)
+        return is_collision
 
     def simulate(self):
         is_collision = False
         steps = 0
+        stop_reason = None
 
-        for step_number in range(0, 3000):
-            self.plane.calculate_time_derivatives()
-            self.plane.apply_object_actions()
-            is_collision = self.plane.detect_collisions()
+        for policy in self.stop_policies:
+            policy.reset(self.plane)
+
+        step = self.step
+        if self.profiler is not None:
+            step = self.profiled_step
+            self.plane.profiler = self.profiler
+            self.profiler.counts['simulations'] += 1
 
-            self.states.append(
-                self.plane.dump_state()
-            )
+        for step_number in range(0, self.max_steps):
+            is_collision = step(step_number)
 
             if is_collision:
+                stop_reason = 'collision'
                 break
             steps += 1
 
-        return (is_collision, steps)
+            for policy in self.stop_policies:
+                if policy.should_stop(self.plane, step_number):
+                    stop_reason = policy.reason
+                    break
+            if stop_reason is not None:
+                break
+
+        self.recorder.close()
+        if self.profiler is not None:
+            self.plane.profiler = None
+
+        steps_saved = 0
+        if stop_reason is not None and stop_reason != 'collision':
+            steps_saved = self.max_steps - steps
+
+        return SimulationResult(is_collision, steps, stop_reason, steps_saved)
+
+    @property
+    def states(self):
+        return self.recorder.states
+
+    def __setstate__(self, state):
+        # simulations pickled before recorders kept their states in a list
+        if 'recorder' not in state:
+            state['recorder'] = ListRecorder()
+            state['recorder'].states = state.pop('states')
+        self.__dict__.update(state)
+
+
+class ObjectView:
+    # what a stop policy sees of one object of a shared plane, a plane with
+    # only that object on it
+
+    def __init__(self, plane, index):
+        self.physical_objects = [plane.physical_objects[index]]
+
+
+class SharedSimulation(Simulation):
+    # every object of a SharedTrackPlane runs until it collides, a copy of
+    # the stop policies gives up on it or max_steps is reached, and gets the
+    # SimulationResult it would have got alone on the plane
+
+    def simulate(self):
+        plane = self.plane
+        count = len(plane.physical_objects)
+        views = [ObjectView(plane, index) for index in range(0, count)]
+        policies = [[copy.copy(policy) for policy in self.stop_policies] for _ in range(0, count)]
+        steps = [0] * count
+        stop_reasons = [None] * count
+
+        for view, object_policies in zip(views, policies):
+            for policy in object_policies:
+                policy.reset(view)
+
+        step = self.step
+        if self.profiler is not None:
+            step = self.profiled_step
+            plane.profiler = self.profiler
+            self.profiler.counts['simulations'] += 1
+
+        for step_number in range(0, self.max_steps):
+            # the plane replaces active instead of changing it in place
+            active = plane.active
+            step(step_number)
+
+            for index in active:
+                if plane.collided[index]:
+                    stop_reasons[index] = 'collision'
+                    continue
+                steps[index] += 1
+
+                for policy in policies[index]:
+                    if policy.should_stop(views[index], step_number):
+                        stop_reasons[index] = policy.reason
+                        plane.stop(index)
+                        break
+
+            if not plane.active:
+                break
+
+        self.recorder.close()
+        if self.profiler is not None:
+            plane.profiler = None
+
+        results = []
+        for index in range(0, count):
+            steps_saved = 0
+            if stop_reasons[index] is not None and stop_reasons[index] != 'collision':
+                steps_saved = self.max_steps - steps[index]
+            results.append(SimulationResult(plane.collided[index], steps[index], stop_reasons[index], steps_saved))
+        return results
+
+
+class SimulationConfig:
+    # everything about a run that trades accuracy for throughput, the
+    # defaults are the original fixed 0.01s semi-implicit Euler stepping
+
+    def __init__(self, max_steps=3000, time_delta_seconds=0.01, integrator='semi_implicit_euler',
+                 substeps=1, control_interval=1, swept_collisions=False):
+        if integrator not in INTEGRATORS:
+            raise ValueError("Unknown integrator %s, choose one of %s" % (integrator, sorted(INTEGRATORS)))
+
+        self.max_steps = max_steps
+        self.time_delta_seconds = time_delta_seconds
+        self.integrator = integrator
+        self.substeps = substeps
+        self.control_interval = control_interval
+        self.swept_collisions = swept_collisions
+
+    def key(self):
+        return (
+            self.max_steps, self.time_delta_seconds, self.integrator,
+            self.substeps, self.control_interval, self.swept_collisions,
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, SimulationConfig) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return "SimulationConfig%s" % str(self.key())
+
+    def make_plane(self, track_data, sensor_table=None):
+        return PhysicalPlaneWithTrack(
+            track_data,
+            sensor_table=sensor_table,
+            time_delta_seconds=self.time_delta_seconds,
+            integrator=self.integrator,
+            substeps=self.substeps,
+            swept_collisions=self.swept_collisions,
+        )
+
+    def make_shared_plane(self, track_data, sensor_table=None, object_collisions=False):
+        return SharedTrackPlane(
+            track_data,
+            object_collisions=object_collisions,
+            sensor_table=sensor_table,
+            time_delta_seconds=self.time_delta_seconds,
+            integrator=self.integrator,
+            substeps=self.substeps,
+            swept_collisions=self.swept_collisions,
+        )
+
+    def make_simulation(self, plane, stop_policies=None, recorder=None, profiler=None):
+        simulation_class = SharedSimulation if isinstance(plane, SharedTrackPlane) else Simulation
+        return simulation_class(
+            plane,
+            max_steps=self.max_steps,
+            stop_policies=stop_policies,
+            recorder=recorder,
+            control_interval=self.control_interval,
+            profiler=profiler,
+        )
+
+
+class StopPolicy:
+    # decides from the first object of the plane whether a simulation can
+    # end before max_steps, on a shared plane every object gets its own
+    # copy looking at an ObjectView
+
+    reason = None
+
+    def reset(self, plane):
+        pass
+
+    def should_stop(self, plane, step_number):
+        raise NotImplementedError()
+
+
+class NoProgressPolicy(StopPolicy):
+
+    reason = 'no_progress'
+
+    def __init__(self, steps=200, min_distance=1.0, grace_steps=0):
+        self.steps = steps
+        self.min_distance = min_distance
+        self.grace_steps = grace_steps
+        self.anchor = None
+
+    def reset(self, plane):
+        self.anchor = None
+        if self.grace_steps == 0:
+            self.move_anchor(plane)
+
+    def move_anchor(self, plane):
+        position = plane.physical_objects[0][1]
+        self.anchor = (position.x, position.y)
+
+    def should_stop(self, plane, step_number):
+        # windows of steps are counted from the end of the grace period,
+        # the first one measured from where the car is at that point
+        elapsed = step_number + 1 - self.grace_steps
+        if elapsed == 0:
+            self.move_anchor(plane)
+        if elapsed <= 0 or elapsed % self.steps != 0:
+            return False
+
+        position = plane.physical_objects[0][1]
+        distance = math.hypot(position.x - self.anchor[0], position.y - self.anchor[1])
+        self.anchor = (position.x, position.y)
+        return distance < self.min_distance
+
+
+class MinimumVelocityPolicy(StopPolicy):
+
+    reason = 'too_slow'
+
+    def __init__(self, min_velocity=0.1, grace_steps=100):
+        self.min_velocity = min_velocity
+        self.grace_steps = grace_steps
+
+    def should_stop(self, plane, step_number):
+        if step_number < self.grace_steps:
+            return False
+
+        velocity = plane.physical_objects[0][0].get_velocity()
+        return math.hypot(velocity.x, velocity.y) < self.min_velocity
+
+
+class BoundingRegionPolicy(StopPolicy):
+
+    reason = 'left_region'
+
+    def __init__(self, minimum, maximum):
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def should_stop(self, plane, step_number):
+        position = plane.physical_objects[0][1]
+        return not (
+            self.minimum.x <= position.x <= self.maximum.x
+            and self.minimum.y <= position.y <= self.maximum.y
+        )
+
+
+class ScoreCutoffPolicy(StopPolicy):
+    # score_function maps a position to a score where smaller is better. The
+    # car may still improve after being stopped, margin is how much worse
+    # than the cutoff it is allowed to be before giving up on it.
+
+    reason = 'below_cutoff'
+
+    def __init__(self, score_function, cutoff, margin=0.0, grace_steps=100):
+        self.score_function = score_function
+        self.cutoff = cutoff
+        self.margin = margin
+        self.grace_steps = grace_steps
+
+    def should_stop(self, plane, step_number):
+        if step_number < self.grace_steps:
+            return False
+
+        return self.score_function(plane.physical_objects[0][1]) > self.cutoff + self.margin
+
+
+class SemiImplicitEulerIntegrator:
+    # velocity first, then position from the new velocity
+
+    def integrate(self, physical_object, position, time_delta_seconds):
+        physical_object.calculate_time_derivatives(time_delta_seconds)
+        velocity = physical_object.velocity
+        position.x += velocity.x * time_delta_seconds
+        position.y += velocity.y * time_delta_seconds
+
+
+class ExplicitEulerIntegrator:
+
+    def integrate(self, physical_object, position, time_delta_seconds):
+        velocity = physical_object.velocity
+        position.x += velocity.x * time_delta_seconds
+        position.y += velocity.y * time_delta_seconds
+        physical_object.calculate_time_derivatives(time_delta_seconds)
+
+
+class VerletIntegrator:
+    # velocity Verlet, averaging the acceleration at both ends of the step
+
+    def integrate(self, physical_object, position, time_delta_seconds):
+        velocity = physical_object.velocity
+        acceleration_x, acceleration_y = physical_object.get_acceleration(position, velocity)
+        position.x += (velocity.x * time_delta_seconds) + (0.5 * acceleration_x * time_delta_seconds ** 2)
+        position.y += (velocity.y * time_delta_seconds) + (0.5 * acceleration_y * time_delta_seconds ** 2)
+
+        next_acceleration_x, next_acceleration_y = physical_object.get_acceleration(position, velocity)
+        velocity.x += 0.5 * (acceleration_x + next_acceleration_x) * time_delta_seconds
+        velocity.y += 0.5 * (acceleration_y + next_acceleration_y) * time_delta_seconds
+
+
+class RK2Integrator:
+    # midpoint method
+
+    def integrate(self, physical_object, position, time_delta_seconds):
+        velocity = physical_object.velocity
+        half_step = time_delta_seconds / 2
+        acceleration_x, acceleration_y = physical_object.get_acceleration(position, velocity)
+
+        middle_velocity = Vector2D(velocity.x + acceleration_x * half_step, velocity.y + acceleration_y * half_step)
+        middle_position = Vector2D(position.x + velocity.x * half_step, position.y + velocity.y * half_step)
+        middle_acceleration_x, middle_acceleration_y = physical_object.get_acceleration(
+            middle_position, middle_velocity
+        )
+
+        position.x += middle_velocity.x * time_delta_seconds
+        position.y += middle_velocity.y * time_delta_seconds
+        velocity.x += middle_acceleration_x * time_delta_seconds
+        velocity.y += middle_acceleration_y * time_delta_seconds
+
+
+INTEGRATORS = {
+    'semi_implicit_euler': SemiImplicitEulerIntegrator,
+    'explicit_euler': ExplicitEulerIntegrator,
+    'verlet': VerletIntegrator,
+    'rk2': RK2Integrator,
+}
+
 
 class PhysicalPlane:
-    def __init__(self):
+
+    # set by a Simulation while it runs with a Profiler
+    profiler = None
+
+    def __init__(self, time_delta_seconds=0.01, integrator='semi_implicit_euler', substeps=1):
         self.physical_objects = []
-        self.time_delta_seconds = 0.01
+        self.time_delta_seconds = time_delta_seconds
+        if isinstance(integrator, str):
+            if integrator not in INTEGRATORS:
+                raise ValueError("Unknown integrator %s, choose one of %s" % (integrator, sorted(INTEGRATORS)))
+            integrator = INTEGRATORS[integrator]()
+        self.integrator = integrator
+        self.substeps = substeps
 
     def add_physical_object(self, physical_object, position):
-        self.physical_objects.append((physical_object, position))
+        # positions are moved in place, every object gets a copy of its own
+        # so the vector of the caller never moves
+        self.physical_objects.append((physical_object, Vector2D(position.x, position.y)))
 
     def calculate_time_derivatives(self):
-        new_physical_objects = []
-
+        # positions and velocities are updated in place, nothing is allocated
+        time_delta_seconds = self.time_delta_seconds / self.substeps
+        integrate = self.integrator.integrate
         for physical_object, position in self.physical_objects:
-            physical_object.calculate_time_derivatives(self.time_delta_seconds)
-            velocity = physical_object.get_velocity()
-            new_position_x = position.x + (velocity.x * self.time_delta_seconds)
-            new_position_y = position.y + (velocity.y * self.time_delta_seconds)
-            new_physical_objects.append((physical_object, Vector2D(new_position_x, new_position_y)))
-
-        self.physical_objects = new_physical_objects
+            for _ in range(0, self.substeps):
+                integrate(physical_object, position, time_delta_seconds)
 
     def apply_object_actions(self):
         for physical_object, current_position in self.physical_objects:
@@ -59,9 +447,10 @@ class PhysicalPlane:
                 physical_object.apply_controls(current_position, self)
 
     def dump_state(self):
+        # copies, the positions themselves keep moving
         objects = []
         for physical_object in self.physical_objects:
-            objects.append(physical_object[1])
+            objects.append(Vector2D(physical_object[1].x, physical_object[1].y))
 
         return objects
     
@@ -71,37 +460,190 @@ class PhysicalPlane:
 
 class PhysicalPlaneWithTrack(PhysicalPlane):
 
-    def __init__(self,  track_data):
-        super().__init__()
+    def __init__(self,  track_data, sensor_table=None, swept_collisions=False, **kwargs):
+        super().__init__(**kwargs)
         self.track_data = track_data
-        self.track_granularity_m = 0.1
+        self.track = Track.from_track_data(track_data)
+        self.track_granularity_m = self.track.track_granularity_m
+        self.sensor_table = sensor_table
+        # with large time steps a car can jump over a thin wall between two
+        # steps, swept collisions check the whole segment it travelled
+        self.swept_collisions = swept_collisions
+        self.previous_positions = []
+
+    def calculate_time_derivatives(self):
+        if self.swept_collisions:
+            self.previous_positions = [
+                (position.x, position.y) for physical_object, position in self.physical_objects
+            ]
+        super().calculate_time_derivatives()
 
     def detect_collisions(self):
-        for physical_object, position in self.physical_objects:
-            track_position_x = math.floor(position.x / self.track_granularity_m)
-            track_position_y = math.floor(position.y / self.track_granularity_m)
+        for index in range(0, len(self.physical_objects)):
+            if self.is_object_colliding(index):
+                return True
+        return False
+
+    def is_object_colliding(self, index):
+        position = self.physical_objects[index][1]
+        if self.swept_collisions and self.previous_positions:
+            return self.is_segment_colliding(self.previous_positions[index], position)
+        return self.track.is_wall_at(position)
+
+    def is_segment_colliding(self, start, end):
+        # samples at most half a cell apart, ending on the final position
+        distance = math.hypot(end.x - start[0], end.y - start[1])
+        samples = max(1, math.ceil(distance / (self.track_granularity_m / 2)))
+        for sample in range(1, samples):
+            fraction = sample / samples
+            if self.track.is_wall(
+                math.floor((start[0] + (end.x - start[0]) * fraction) / self.track_granularity_m),
+                math.floor((start[1] + (end.y - start[1]) * fraction) / self.track_granularity_m),
+            ):
+                return True
+        return self.track.is_wall_at(end)
+
+
+class SpatialHash:
+    # uniform grid of cell_size meters, a box is listed in every cell it
+    # overlaps so only boxes sharing a cell need an exact check
+
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+
+    def clear(self):
+        self.cells.clear()
+
+    def insert(self, key, minimum, maximum):
+        cell_size = self.cell_size
+        cells = self.cells
+        for cell_x in range(math.floor(minimum.x / cell_size), math.floor(maximum.x / cell_size) + 1):
+            for cell_y in range(math.floor(minimum.y / cell_size), math.floor(maximum.y / cell_size) + 1):
+                cells[(cell_x, cell_y)].append(key)
+
+    def candidate_pairs(self):
+        # keys inserted in increasing order come out as (smaller, larger)
+        pairs = set()
+        for keys in self.cells.values():
+            for first in range(0, len(keys) - 1):
+                for second in range(first + 1, len(keys)):
+                    pairs.add((keys[first], keys[second]))
+        return pairs
+
+
+def boxes_overlap(first, second):
+    return (
+        first[0].x <= second[1].x and second[0].x <= first[1].x
+        and first[0].y <= second[1].y and second[0].y <= first[1].y
+    )
+
+
+class SharedTrackPlane(PhysicalPlaneWithTrack):
+    # many cars on one track. Each one stops on its own when it hits a wall,
+    # with object_collisions when its boundaries touch another moving car,
+    # or when stop() is called for it. Only the active ones are integrated,
+    # steered and checked, stopped ones stay where they are and no longer
+    # get in the way of the others.
+
+    def __init__(self, track_data, object_collisions=False, cell_size=1.0, **kwargs):
+        super().__init__(track_data, **kwargs)
+        self.object_collisions = object_collisions
+        self.spatial_hash = SpatialHash(cell_size)
+        self.active = []
+        self.collided = []
 
-            try:
-                is_collision = bool(self.track_data[track_position_y][track_position_x])
-            except:
-                is_collision = True
-            return is_collision
+    def add_physical_object(self, physical_object, position):
+        super().add_physical_object(physical_object, position)
+        self.active = self.active + [len(self.physical_objects) - 1]
+        self.collided.append(False)
+
+    def stop(self, index):
+        self.active = [active for active in self.active if active != index]
 
+    def calculate_time_derivatives(self):
+        objects = self.physical_objects
+        if self.swept_collisions:
+            self.previous_positions = [(position.x, position.y) for physical_object, position in objects]
+
+        time_delta_seconds = self.time_delta_seconds / self.substeps
+        integrate = self.integrator.integrate
+        for index in self.active:
+            physical_object, position = objects[index]
+            for _ in range(0, self.substeps):
+                integrate(physical_object, position, time_delta_seconds)
+
+    def apply_object_actions(self):
+        for index in self.active:
+            physical_object, current_position = self.physical_objects[index]
+            if hasattr(physical_object, 'apply_controls'):
+                physical_object.apply_controls(current_position, self)
+
+    def touching_objects(self):
+        # broadphase through the spatial hash, then the exact boxes
+        spatial_hash = self.spatial_hash
+        spatial_hash.clear()
+        boxes = {}
+        for index in self.active:
+            physical_object, position = self.physical_objects[index]
+            boxes[index] = physical_object.get_boundaries(position)
+            spatial_hash.insert(index, *boxes[index])
+
+        touching = set()
+        for first, second in spatial_hash.candidate_pairs():
+            if boxes_overlap(boxes[first], boxes[second]):
+                touching.add(first)
+                touching.add(second)
+        return touching
+
+    def detect_collisions(self):
+        # marks every car that collided in this step, the plane as a whole
+        # is done once no car is moving any more
+        colliding = set(index for index in self.active if self.is_object_colliding(index))
+        if self.object_collisions:
+            colliding.update(self.touching_objects())
+
+        if colliding:
+            for index in colliding:
+                self.collided[index] = True
+            self.active = [index for index in self.active if index not in colliding]
+        return not self.active
 
 
 class GeometricVector2D:
 
+    __slots__ = ('length', '_angle', '_sin', '_cos')
+
     def __init__(self, length, angle):
         self.length = float(length)
         self.angle = float(angle)
 
+    @property
+    def angle(self):
+        return self._angle
+
+    @angle.setter
+    def angle(self, angle):
+        # sin and cos are worked out again on the next read
+        self._angle = angle
+        self._sin = None
+
+    def _calculate_direction(self):
+        radians = math.radians(self._angle)
+        self._sin = math.sin(radians)
+        self._cos = math.cos(radians)
+
     @property
     def x(self):
-        return math.sin(math.radians(self.angle)) * self.length
+        if self._sin is None:
+            self._calculate_direction()
+        return self._sin * self.length
 
     @property
     def y(self):
-        return math.cos(math.radians(self.angle)) * self.length
+        if self._sin is None:
+            self._calculate_direction()
+        return self._cos * self.length
 
     def turn(self, degrees):
         self.angle += degrees
@@ -116,12 +658,15 @@ class GeometricVector2D:
         self.length = length
 
     def get_linear_function(self):
-        y = math.sin(math.radians(self.angle))
-        x = math.cos(math.radians(self.angle))
-        a = x/y
+        if self._sin is None:
+            self._calculate_direction()
+        a = self._cos/self._sin
         return a
 
 class Vector2D:
+
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
         self.x = float(x)
         self.y = float(y)
@@ -144,18 +689,20 @@ class PhysicalObject:
         self.force = force
 
     def calculate_time_derivatives(self, time_delta_seconds):
-        x_velocity = self.velocity.x
-        y_velocity = self.velocity.y
+        force_x = self.force.x
+        force_y = self.force.y
 
-        if self.force.x != 0:
-            x_velocity += ((self.force.x/self.mass) * time_delta_seconds)
-        if self.force.y != 0:
-            y_velocity += ((self.force.y/self.mass) * time_delta_seconds)
-        self.velocity = Vector2D(x_velocity, y_velocity)
+        if force_x != 0:
+            self.velocity.x += ((force_x/self.mass) * time_delta_seconds)
+        if force_y != 0:
+            self.velocity.y += ((force_y/self.mass) * time_delta_seconds)
 
     def get_velocity(self):
         return self.velocity
 
+    def get_acceleration(self, position, velocity):
+        return (self.force.x/self.mass, self.force.y/self.mass)
+
     def get_boundaries(self, *args, **kwargs):
         raise NotImplementedError()
 
@@ -189,11 +736,20 @@ class PhysicalRect(PhysicalObject):
 
 class Car(PhysicalObject):
 
-    def __init__(self, mass, acceleration_force_max, agility_degrees_max, control_manager=None):
+    def __init__(self, mass, acceleration_force_max, agility_degrees_max, control_manager=None, size=0.5):
         super().__init__(mass)
         self.acceleration_force_max = acceleration_force_max
         self.agility_degrees_max = agility_degrees_max
         self.control_manager = control_manager
+        # side of the square the car fits in whichever way it is turned
+        self.size = size
+
+    def get_boundaries(self, position):
+        half = self.size / 2
+        return (
+            Vector2D(position.x - half, position.y - half),
+            Vector2D(position.x + half, position.y + half),
+        )
 
     def turn(self, value):
         assert value >= -1
@@ -206,15 +762,42 @@ class Car(PhysicalObject):
         self.force.set_length(self.acceleration_force_max * value)
     
     def apply_controls(self, current_position, plane):
+        if plane.profiler is not None:
+            return self.apply_controls_profiled(current_position, plane, plane.profiler)
+
         sensor_data = self.calculate_sensor_data(current_position, plane)
         angle, acceleration = self.control_manager.decide_actions(sensor_data)
         self.set_acceleration(acceleration)
         self.turn(angle)
 
+    def apply_controls_profiled(self, current_position, plane, profiler):
+        clock = time.perf_counter
+        started = clock()
+        sensor_data = self.calculate_sensor_data(current_position, plane)
+        sensed = clock()
+        angle, acceleration = self.control_manager.decide_actions(sensor_data)
+        decided = clock()
+        self.set_acceleration(acceleration)
+        self.turn(angle)
+
+        # a ray marched one meter per iteration until it read what it read,
+        # the sensor table answers without marching
+        if getattr(plane, 'sensor_table', None) is None:
+            sensor_iterations = int(sum(sensor_data))
+        else:
+            sensor_iterations = 0
+        network = getattr(self.control_manager, 'network', None)
+        profiler.record_controls(
+            sensed - started, decided - sensed, len(sensor_data), sensor_iterations,
+            getattr(network, 'last_propagation', None),
+        )
+
     def set_control_manager(self, control_manager):
         self.control_manager = control_manager
 
     def calculate_sensor_data(self, current_position, plane):
+        if getattr(plane, 'sensor_table', None) is not None:
+            return plane.sensor_table.sensor_data(current_position, self.force.angle)
 
         def get_distance_in_direction(angle):
             direction = GeometricVector2D(0, angle)
@@ -222,12 +805,8 @@ class Car(PhysicalObject):
                 direction.length += 1
                 new_x = math.floor((direction.x + current_position.x) / plane.track_granularity_m)
                 new_y = math.floor((direction.y + current_position.y) / plane.track_granularity_m)
-                try:
-                    is_collision = plane.track_data[new_y][new_x]
-                except: # if out of bounds then treat as collision
-                    break
-
-                if is_collision:
+                # out of bounds is a wall as well
+                if plane.track.is_wall(new_x, new_y):
                    break
 
             return direction.length
@@ -313,7 +892,279 @@ class TestPhysicalPlaneWithBasicObject(unittest.TestCase):
             round(a, 1),
             round(1, 1)
         )
-        
+
+    def test_geo_vector2d_direction_follows_angle(self):
+        # sin and cos are cached on the first read, turning has to drop them
+        vector = GeometricVector2D(10, 0)
+        self.assertEqual((round(vector.x, 5), round(vector.y, 5)), (0, 10))
+
+        vector.turn(90)
+        self.assertEqual((round(vector.x, 5), round(vector.y, 5)), (10, 0))
+
+        vector.angle = 180
+        self.assertEqual((round(vector.x, 5), round(vector.y, 5)), (0, -10))
+
+    def test_dumped_states_are_copies(self):
+        plane = PhysicalPlane()
+        thing = PhysicalObject(10)
+        thing.apply_force(GeometricVector2D(10, 90))
+        plane.add_physical_object(thing, Vector2D(0, 0))
+
+        states = []
+        for _ in range(0, 3):
+            plane.calculate_time_derivatives()
+            states.append(plane.dump_state())
+
+        self.assertIsNot(states[0][0], plane.physical_objects[0][1])
+        self.assertLess(states[0][0].x, states[1][0].x)
+        self.assertLess(states[1][0].x, states[2][0].x)
+        self.assertEqual(states[2][0], plane.physical_objects[0][1])
+
+    def test_positions_are_not_aliased(self):
+        # the same vector given to two objects starts both there and moves
+        # neither of them twice
+        start = Vector2D(0, 0)
+        plane = PhysicalPlane()
+        for _ in range(0, 2):
+            thing = PhysicalObject(10)
+            thing.apply_force(GeometricVector2D(10, 90))
+            plane.add_physical_object(thing, start)
+
+        for _ in range(0, 10):
+            plane.calculate_time_derivatives()
+
+        self.assertEqual(start, Vector2D(0, 0))
+        self.assertIsNot(plane.physical_objects[0][1], start)
+        self.assertIsNot(plane.physical_objects[0][1], plane.physical_objects[1][1])
+        self.assertEqual(plane.physical_objects[0][1], plane.physical_objects[1][1])
+        self.assertGreater(plane.physical_objects[0][1].x, 0)
+
+
+class TestIntegrators(unittest.TestCase):
+
+    def position_after_one_second(self, integrator, substeps=1):
+        plane = PhysicalPlane(integrator=integrator, substeps=substeps)
+        thing = PhysicalObject(10)
+        thing.apply_force(GeometricVector2D(10, 90))
+        plane.add_physical_object(thing, Vector2D(0, 0))
+        for _ in range(0, 100):
+            plane.calculate_time_derivatives()
+        return plane.physical_objects[0][1].x
+
+    def test_constant_acceleration(self):
+        # x = a * t^2 / 2 = 0.5 after one second at 1 m/s^2
+        self.assertAlmostEqual(self.position_after_one_second('verlet'), 0.5)
+        self.assertAlmostEqual(self.position_after_one_second('rk2'), 0.5)
+        self.assertAlmostEqual(self.position_after_one_second('semi_implicit_euler'), 0.505)
+        self.assertAlmostEqual(self.position_after_one_second('explicit_euler'), 0.495)
+        self.assertAlmostEqual(self.position_after_one_second('semi_implicit_euler', substeps=10), 0.5005)
+
+    def test_unknown_integrator(self):
+        with self.assertRaises(ValueError):
+            SimulationConfig(integrator='leapfrog')
+        with self.assertRaises(ValueError):
+            PhysicalPlane(integrator='leapfrog')
+
+    def test_swept_collisions_do_not_tunnel(self):
+        grid = [[0] * 10 for _ in range(0, 10)]
+        for row in grid:
+            row[5] = 1
+
+        for swept, expected in [(False, False), (True, True)]:
+            plane = PhysicalPlaneWithTrack(grid, swept_collisions=swept, time_delta_seconds=0.1)
+            thing = PhysicalObject(10)
+            thing.velocity = Vector2D(2, 0)
+            plane.add_physical_object(thing, Vector2D(0.42, 0.5))
+            plane.calculate_time_derivatives()
+            self.assertEqual(plane.detect_collisions(), expected)
+
+    def test_control_interval(self):
+        class CountingControlManager:
+            decisions = 0
+
+            def decide_actions(self, inputs):
+                self.decisions += 1
+                return (0, 0)
+
+        control_manager = CountingControlManager()
+        config = SimulationConfig(max_steps=100, control_interval=4)
+        plane = config.make_plane([[0] * 100 for _ in range(0, 100)])
+        plane.add_physical_object(Car(10, 20, 200, control_manager), Vector2D(5, 5))
+        result = config.make_simulation(plane).simulate()
+        self.assertEqual(result, (False, 100))
+        self.assertEqual(control_manager.decisions, 25)
+
+    def test_default_config_matches_original_stepping(self):
+        config = SimulationConfig()
+        self.assertEqual(config, SimulationConfig(3000, 0.01, 'semi_implicit_euler', 1, 1, False))
+        self.assertNotEqual(config, SimulationConfig(time_delta_seconds=0.02))
+        plane = config.make_plane([[0]])
+        self.assertEqual(plane.time_delta_seconds, 0.01)
+        self.assertIsInstance(plane.integrator, SemiImplicitEulerIntegrator)
+
+    def test_profiled_simulation_matches_unprofiled(self):
+        from profiling import Profiler
+
+        grid = [[0] * 100 for _ in range(0, 100)]
+        results = []
+        for profiler in (None, Profiler()):
+            random.seed(5)
+            network = Network(5, 3, 15, 2)
+            plane = PhysicalPlaneWithTrack(grid)
+            plane.add_physical_object(Car(10, 20, 200, CarCompiledControlManager(network)), Vector2D(2, 4))
+            result = Simulation(plane, max_steps=50, control_interval=2, profiler=profiler).simulate()
+            results.append((result, plane.physical_objects[0][1].x, plane.physical_objects[0][1].y))
+        self.assertEqual(results[0], results[1])
+        self.assertIsNone(plane.profiler)
+
+        counts = profiler.counts
+        self.assertEqual(counts['simulations'], 1)
+        self.assertEqual(counts['steps'], results[1][0].steps + results[1][0].is_collision)
+        self.assertEqual(counts['decisions'], (counts['steps'] + 1) // 2)
+        self.assertEqual(counts['sensor_rays'], counts['decisions'] * 5)
+        self.assertGreaterEqual(counts['sensor_iterations'], counts['sensor_rays'])
+        self.assertGreater(profiler.seconds['sensors'], 0)
+
+
+class TestSimulationStopPolicies(unittest.TestCase):
+
+    def plane_with_thing(self, force):
+        plane = PhysicalPlane()
+        thing = PhysicalObject(10)
+        thing.apply_force(force)
+        plane.add_physical_object(thing, Vector2D(0, 0))
+        return plane
+
+    def test_runs_full_budget_without_policies(self):
+        result = Simulation(self.plane_with_thing(GeometricVector2D(0, 0)), max_steps=50).simulate()
+        self.assertEqual(result, (False, 50))
+        self.assertEqual(result.stop_reason, None)
+        self.assertEqual(result.steps_saved, 0)
+
+    def test_no_progress(self):
+        plane = self.plane_with_thing(GeometricVector2D(0, 0))
+        result = Simulation(plane, max_steps=1000, stop_policies=[NoProgressPolicy(steps=100)]).simulate()
+        self.assertEqual(result, (False, 100))
+        self.assertEqual(result.stop_reason, 'no_progress')
+        self.assertEqual(result.steps_saved, 900)
+
+    def test_no_progress_after_grace_period(self):
+        # standing still for the grace period does not count, the first
+        # window starts where the object is once it is over
+        policy = NoProgressPolicy(steps=100, grace_steps=50)
+        result = Simulation(self.plane_with_thing(GeometricVector2D(0, 0)), max_steps=1000, stop_policies=[policy]).simulate()
+        self.assertEqual(result, (False, 150))
+        self.assertEqual(result.stop_reason, 'no_progress')
+
+        moving = self.plane_with_thing(GeometricVector2D(100, 0))
+        result = Simulation(moving, max_steps=300, stop_policies=[policy]).simulate()
+        self.assertEqual(result.stop_reason, None)
+
+    def test_minimum_velocity(self):
+        plane = self.plane_with_thing(GeometricVector2D(0, 0))
+        result = Simulation(plane, stop_policies=[MinimumVelocityPolicy(grace_steps=10)]).simulate()
+        self.assertEqual(result.steps, 11)
+        self.assertEqual(result.stop_reason, 'too_slow')
+
+        moving = self.plane_with_thing(GeometricVector2D(100, 0))
+        result = Simulation(moving, max_steps=200, stop_policies=[MinimumVelocityPolicy(grace_steps=10)]).simulate()
+        self.assertEqual(result.stop_reason, None)
+
+    def test_bounding_region(self):
+        plane = self.plane_with_thing(GeometricVector2D(1000, 90))
+        policy = BoundingRegionPolicy(Vector2D(-1, -1), Vector2D(1, 1))
+        result = Simulation(plane, stop_policies=[policy]).simulate()
+        self.assertEqual(result.stop_reason, 'left_region')
+        self.assertGreater(plane.physical_objects[0][1].x, 1)
+        self.assertEqual(result.steps_saved, 3000 - result.steps)
+
+    def test_score_cutoff(self):
+        plane = self.plane_with_thing(GeometricVector2D(0, 0))
+        policy = ScoreCutoffPolicy(lambda position: 500 - position.x, cutoff=400, grace_steps=0)
+        result = Simulation(plane, stop_policies=[policy]).simulate()
+        self.assertEqual(result, (False, 1))
+        self.assertEqual(result.stop_reason, 'below_cutoff')
+
+    def test_policies_are_copied_per_simulation(self):
+        policy = NoProgressPolicy(steps=10)
+        Simulation(self.plane_with_thing(GeometricVector2D(0, 0)), stop_policies=[policy]).simulate()
+        self.assertIsNone(policy.anchor)
+
+    def test_result_pickles(self):
+        import pickle
+
+        result = pickle.loads(pickle.dumps(SimulationResult(True, 12, 'collision', 0)))
+        self.assertEqual(result, (True, 12))
+        self.assertEqual(result.stop_reason, 'collision')
+
+
+class TestSharedTrackPlane(unittest.TestCase):
+
+    def test_every_object_is_checked_for_walls(self):
+        grid = [[0] * 10 for _ in range(0, 10)]
+        grid[5][5] = 1
+        plane = PhysicalPlaneWithTrack(grid)
+        plane.add_physical_object(PhysicalObject(10), Vector2D(0.15, 0.15))
+        self.assertFalse(plane.detect_collisions())
+        plane.add_physical_object(PhysicalObject(10), Vector2D(0.55, 0.55))
+        self.assertTrue(plane.detect_collisions())
+
+    def test_cars_run_as_they_would_alone(self):
+        from track import load_track
+
+        class FullThrottleControlManager:
+            def decide_actions(self, inputs):
+                return (0, 1)
+
+        track = load_track('tracks/1.png')
+        config = SimulationConfig(max_steps=600)
+        policies = [NoProgressPolicy(steps=100, min_distance=0.5)]
+        random.seed(22)
+        control_managers = [CarCompiledControlManager(Network(5, 3, 15, 2)) for _ in range(0, 5)]
+        control_managers.append(FullThrottleControlManager())
+        starts = [(2, 4), (2.5, 4), (2, 4.5)]
+
+        expected = []
+        for index, control_manager in enumerate(control_managers):
+            plane = config.make_plane(track)
+            plane.add_physical_object(Car(10, 20, 200, control_manager), Vector2D(*starts[index % 3]))
+            result = config.make_simulation(plane, stop_policies=policies).simulate()
+            position = plane.physical_objects[0][1]
+            expected.append((result, result.stop_reason, result.steps_saved, position.x, position.y))
+
+        plane = config.make_shared_plane(track)
+        for index, control_manager in enumerate(control_managers):
+            plane.add_physical_object(Car(10, 20, 200, control_manager), Vector2D(*starts[index % 3]))
+        results = config.make_simulation(plane, stop_policies=policies).simulate()
+        self.assertEqual([
+            (result, result.stop_reason, result.steps_saved, position.x, position.y)
+            for result, (car, position) in zip(results, plane.physical_objects)
+        ], expected)
+        self.assertEqual([result.stop_reason for result in results], ['no_progress'] * 5 + ['collision'])
+        self.assertEqual(plane.active, [])
+
+    def test_spatial_hash(self):
+        spatial_hash = SpatialHash(cell_size=1.0)
+        spatial_hash.insert(0, Vector2D(0.2, 0.2), Vector2D(0.8, 0.8))
+        spatial_hash.insert(1, Vector2D(0.7, 0.7), Vector2D(1.2, 1.2))
+        spatial_hash.insert(2, Vector2D(5.0, 5.0), Vector2D(5.5, 5.5))
+        spatial_hash.insert(3, Vector2D(1.1, 0.1), Vector2D(1.3, 0.3))
+        self.assertEqual(spatial_hash.candidate_pairs(), set([(0, 1), (1, 3)]))
+        self.assertTrue(boxes_overlap((Vector2D(0, 0), Vector2D(1, 1)), (Vector2D(1, 1), Vector2D(2, 2))))
+        self.assertFalse(boxes_overlap((Vector2D(0, 0), Vector2D(1, 1)), (Vector2D(1.1, 0), Vector2D(2, 1))))
+
+    def test_object_collisions_stop_touching_cars(self):
+        grid = [[0] * 200 for _ in range(0, 200)]
+        config = SimulationConfig(max_steps=50)
+        for object_collisions, expected in [(False, [False, False, False]), (True, [True, True, False])]:
+            plane = config.make_shared_plane(grid, object_collisions=object_collisions)
+            for position in [Vector2D(5, 5), Vector2D(5.3, 5.2), Vector2D(10, 10)]:
+                plane.add_physical_object(Car(10, 20, 200, CarRandomControlManager(), size=0.5), position)
+            results = config.make_simulation(plane).simulate()
+            self.assertEqual([result.is_collision for result in results], expected)
+            self.assertEqual(results[2].steps, 50)
+
+
 class CarRandomControlManager:
 
     def __init__(self):
@@ -328,33 +1179,56 @@ class CarRandomControlManager:
 
 class CarNeuralControlManager:
 
-    def __init__(self, network=None):
+    def __init__(self, network=None, refire='always'):
         if network is not None:
             self.network = network
         else:
             self.network = Network(5, 3, 15, 2)
+        self.refire = refire
 
     def decide_actions(self, inputs):
         self.network.reset()
-        for input_id, sensor in enumerate(inputs):
-            if sensor > 3:
-                self.network.input_layer[input_id].fire()
+        self.network.fire_inputs([sensor > 3 for sensor in inputs], self.refire)
 
         turn = self.network.output_layer[0].saturation
         acceleration = self.network.output_layer[1].saturation
-        if turn > 100:
-            turn = 100
+        return saturations_to_actions(turn, acceleration)
 
-        if acceleration > 100:
-            acceleration = 100
 
-        turn = turn/100
-        acceleration = acceleration/100
+class CarCompiledControlManager:
+
+    def __init__(self, network, refire='always'):
+        if hasattr(network, 'evaluate'):
+            # compiled, quantized and sparse networks are evaluated as they are
+            self.network = network
+        else:
+            self.network = compile_network(network)
+        self.refire = refire
+
+    def decide_actions(self, inputs):
+        fired_inputs = [sensor > 3 for sensor in inputs]
+        turn, acceleration = self.network.evaluate(fired_inputs, self.refire)
+        return saturations_to_actions(float(turn), float(acceleration))
 
-        return (turn, acceleration)
+
+def saturations_to_actions(turn, acceleration):
+    if turn > 100:
+        turn = 100
+
+    if acceleration > 100:
+        acceleration = 100
+
+    turn = turn/100
+    acceleration = acceleration/100
+
+    return (turn, acceleration)
 
 
 def load_track_data_from_image(image_path):
+    # PIL only when a track is read from an image, pool workers get theirs
+    # from the track cache
+    from PIL import Image
+
     img = Image.open(image_path)
     track = img.load()
 
@@ -0,0 +1,108 @@
+import unittest
+
+
+# the phases of a simulation step, object_actions is split further into
+# the sensors and the decision of every car
+PROFILE_PHASES = ('time_derivatives', 'object_actions', 'sensors', 'decisions', 'collisions', 'recording')
+STEP_PHASES = ('time_derivatives', 'object_actions', 'collisions', 'recording')
+PROFILE_COUNTERS = (
+    'simulations', 'steps', 'decisions',
+    'sensor_rays', 'sensor_iterations', 'network_events', 'network_fires',
+)
+
+
+class Profiler:
+    # seconds per phase and plain counters, only filled in by a Simulation
+    # given one. Profilers of many runs, threads or pool workers merge into
+    # one, across processes as the dictionaries of to_dict.
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(PROFILE_PHASES, 0.0)
+        self.counts = dict.fromkeys(PROFILE_COUNTERS, 0)
+
+    def record_step(self, time_derivatives, object_actions, collisions, recording):
+        seconds = self.seconds
+        seconds['time_derivatives'] += time_derivatives
+        seconds['object_actions'] += object_actions
+        seconds['collisions'] += collisions
+        seconds['recording'] += recording
+        self.counts['steps'] += 1
+
+    def record_controls(self, sensors, decisions, sensor_rays, sensor_iterations, propagation=None):
+        self.seconds['sensors'] += sensors
+        self.seconds['decisions'] += decisions
+        counts = self.counts
+        counts['decisions'] += 1
+        counts['sensor_rays'] += sensor_rays
+        counts['sensor_iterations'] += sensor_iterations
+        if propagation is not None:
+            counts['network_events'] += propagation['events']
+            counts['network_fires'] += propagation['fires']
+
+    def to_dict(self):
+        return {'seconds': dict(self.seconds), 'counts': dict(self.counts)}
+
+    @classmethod
+    def from_dict(cls, data):
+        profiler = cls()
+        profiler.merge(data)
+        return profiler
+
+    def merge(self, other):
+        if isinstance(other, Profiler):
+            other = other.to_dict()
+        for phase, seconds in other['seconds'].items():
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+        for counter, count in other['counts'].items():
+            self.counts[counter] = self.counts.get(counter, 0) + count
+        return self
+
+    @classmethod
+    def merged(cls, profilers):
+        total = cls()
+        for profiler in profilers:
+            if profiler is not None:
+                total.merge(profiler)
+        return total
+
+    def report(self):
+        counts = self.counts
+        step_seconds = sum(self.seconds[phase] for phase in STEP_PHASES)
+        steps = counts['steps']
+        decisions = counts['decisions']
+        return {
+            'seconds': dict(self.seconds),
+            'share': dict(
+                (phase, self.seconds[phase] / step_seconds if step_seconds else 0.0) for phase in PROFILE_PHASES
+            ),
+            'per_step_us': dict(
+                (phase, self.seconds[phase] / steps * 1e6 if steps else 0.0) for phase in PROFILE_PHASES
+            ),
+            'counts': dict(counts),
+            'network_events_per_decision': counts['network_events'] / decisions if decisions else 0.0,
+            'sensor_iterations_per_ray': counts['sensor_iterations'] / counts['sensor_rays'] if counts['sensor_rays'] else 0.0,
+        }
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_merge_and_report(self):
+        first = Profiler()
+        first.record_step(0.1, 0.3, 0.05, 0.05)
+        first.record_controls(0.1, 0.2, 5, 42, {'events': 10, 'fires': 4})
+        second = Profiler.from_dict(first.to_dict())
+        second.record_step(0.1, 0.3, 0.05, 0.05)
+        second.record_controls(0.1, 0.2, 5, 18)
+
+        total = Profiler.merged([first, second.to_dict(), None])
+        report = total.report()
+        self.assertEqual(report['counts']['steps'], 3)
+        self.assertEqual(report['counts']['decisions'], 3)
+        self.assertAlmostEqual(report['share']['object_actions'], 0.6)
+        self.assertAlmostEqual(report['per_step_us']['time_derivatives'], 0.1 * 1e6)
+        self.assertEqual(report['network_events_per_decision'], 20 / 3)
+        self.assertEqual(report['sensor_iterations_per_ray'], 102 / 15)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,277 @@
+import unittest
+import random
+import hashlib
+import itertools
+
+import numpy as np
+
+from neural_net import Network
+from compiled_net import CompiledNetwork, compile_network
+
+
+class SparseNetwork:
+    # every layer in CSR form, the connections of neuron j of layer i go to
+    # indices[i][indptr[i][j]:indptr[i][j + 1]] with the strengths in data.
+    # This is the form a pruned network is stored, hashed and pickled in.
+    # It is evaluated by the masked CompiledNetwork with the same
+    # connections, built on first use and not pickled, so the cascade and
+    # its saturations are exactly those of CompiledNetwork.
+
+    def __init__(self, layer_sizes, indptr, indices, data, thresholds):
+        self.layer_sizes = list(layer_sizes)
+        self.indptr = [np.asarray(layer, dtype=np.int32) for layer in indptr]
+        self.indices = [np.asarray(layer, dtype=np.int32) for layer in indices]
+        self.data = [np.asarray(layer, dtype=np.float64) for layer in data]
+        self.thresholds = [np.asarray(layer, dtype=np.float64) for layer in thresholds]
+        self.compiled = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['compiled'] = None
+        return state
+
+    @classmethod
+    def from_compiled(cls, compiled, min_strength=None):
+        # keeps the connections compiled has, with min_strength only those at
+        # least that strong
+        indptr = []
+        indices = []
+        data = []
+        for layer, weights in enumerate(compiled.weights):
+            if compiled.masks is None:
+                mask = np.ones(weights.shape, dtype=bool)
+            else:
+                mask = compiled.masks[layer].copy()
+            if min_strength is not None:
+                mask &= np.abs(weights) >= min_strength
+
+            rows, columns = np.nonzero(mask)
+            indptr.append(np.concatenate([[0], np.cumsum(mask.sum(axis=1))]))
+            indices.append(columns)
+            data.append(weights[rows, columns])
+        return cls(compiled.layer_sizes, indptr, indices, data, compiled.thresholds)
+
+    @classmethod
+    def from_network(cls, network, min_strength=None):
+        return cls.from_compiled(compile_network(network), min_strength)
+
+    def connection_count(self):
+        return sum(len(layer) for layer in self.indices)
+
+    @property
+    def nbytes(self):
+        # the compact form only, once evaluated a network also holds its
+        # dense compiled form
+        return sum(layer.nbytes for layer in self.indptr + self.indices + self.data + self.thresholds)
+
+    def to_compiled(self):
+        weights = []
+        masks = []
+        for indptr, indices, data, inputs, outputs in zip(
+                self.indptr, self.indices, self.data, self.layer_sizes, self.layer_sizes[1:]):
+            rows = np.repeat(np.arange(0, inputs), np.diff(indptr))
+            matrix = np.zeros((inputs, outputs))
+            matrix[rows, indices] = data
+            mask = np.zeros((inputs, outputs), dtype=bool)
+            mask[rows, indices] = True
+            weights.append(matrix)
+            masks.append(mask)
+        return CompiledNetwork(weights, self.thresholds, masks)
+
+    def digest(self):
+        digest = hashlib.sha256(repr(self.layer_sizes).encode())
+        for layer in self.indptr + self.indices + self.data + self.thresholds:
+            digest.update(layer.tobytes())
+        return digest.hexdigest()
+
+    def saturations(self, fired_inputs, refire='always'):
+        if self.compiled is None:
+            self.compiled = self.to_compiled()
+        layer_saturations = self.compiled.saturations(fired_inputs, refire)
+        self.last_propagation = self.compiled.last_propagation
+        return layer_saturations
+
+    def evaluate(self, fired_inputs, refire='always'):
+        return self.saturations(fired_inputs, refire)[-1]
+
+
+def prune_by_magnitude(network, min_strength):
+    return SparseNetwork.from_network(network, min_strength)
+
+
+def prune_by_fitness(network, evaluate, tolerance=0.0, max_trials=None):
+    # tries dropping connections weakest first and keeps every drop that
+    # leaves evaluate(network), smaller is better, within tolerance of the
+    # unpruned score. One evaluation per connection tried.
+    compiled = compile_network(network)
+    masks = [np.ones(weights.shape, dtype=bool) for weights in compiled.weights]
+    if compiled.masks is not None:
+        masks = [mask.copy() for mask in compiled.masks]
+
+    pruned = SparseNetwork.from_compiled(compiled)
+    start_count = pruned.connection_count()
+    base_score = evaluate(pruned)
+    score = base_score
+
+    candidates = sorted(
+        (abs(compiled.weights[layer][row, column]), layer, row, column)
+        for layer, mask in enumerate(masks)
+        for row, column in zip(*np.nonzero(mask))
+    )
+    if max_trials is not None:
+        candidates = candidates[0:max_trials]
+
+    for strength, layer, row, column in candidates:
+        masks[layer][row, column] = False
+        trial = SparseNetwork.from_compiled(CompiledNetwork(compiled.weights, compiled.thresholds, masks))
+        trial_score = evaluate(trial)
+        if trial_score <= base_score + tolerance:
+            pruned, score = trial, trial_score
+        else:
+            masks[layer][row, column] = True
+
+    return pruned, {
+        'connections': pruned.connection_count(),
+        'removed': start_count - pruned.connection_count(),
+        'trials': len(candidates),
+        'base_score': base_score,
+        'score': score,
+    }
+
+
+def propagation_cost(network, refire='always'):
+    # network events and fires per decision, averaged over every pattern
+    # of fired inputs
+    events = 0
+    fires = 0
+    patterns = list(itertools.product([False, True], repeat=network.layer_sizes[0]))
+    for fired_inputs in patterns:
+        network.evaluate(fired_inputs, refire)
+        events += network.last_propagation['events']
+        fires += network.last_propagation['fires']
+    return {'events': events / len(patterns), 'fires': fires / len(patterns)}
+
+
+class TestSparseNetwork(unittest.TestCase):
+
+    def networks(self, count, seed):
+        random.seed(seed)
+        networks = [Network(5, 3, 15, 2) for _ in range(0, count)]
+        for network in networks:
+            for neuron in network.all_neurons:
+                for connection in neuron.connections:
+                    connection.strength -= random.random() * 0.3
+        return networks
+
+    def assert_same_cascade(self, network, expected, refire='always'):
+        for fired_inputs in itertools.product([0, 1], repeat=5):
+            self.assertEqual(
+                [list(layer) for layer in network.saturations(fired_inputs, refire)],
+                [list(layer) for layer in expected.saturations(fired_inputs, refire)],
+            )
+            self.assertEqual(network.last_propagation, expected.last_propagation)
+
+    def test_matches_compiled_network(self):
+        for network in self.networks(5, 25):
+            compiled = CompiledNetwork.from_network(network)
+            for refire in ('always', 'once'):
+                self.assert_same_cascade(SparseNetwork.from_network(network), compiled, refire)
+
+    def test_pruned_network_matches_object_model(self):
+        for network in self.networks(5, 26):
+            sparse = prune_by_magnitude(network, 0.4)
+            network.prune(0.4)
+            compiled = CompiledNetwork.from_network(network)
+            self.assertIsNotNone(compiled.masks)
+            self.assertEqual(sparse.connection_count(), network.connection_count())
+            self.assert_same_cascade(sparse, compiled)
+            self.assert_same_cascade(sparse.to_compiled(), compiled)
+
+            for _ in range(0, 10):
+                fired_inputs = [random.random() > 0.3 for _ in range(0, 5)]
+                network.reset()
+                propagation = network.fire_inputs(fired_inputs)
+                self.assertEqual(list(sparse.evaluate(fired_inputs)), [neuron.saturation for neuron in network.output_layer])
+                self.assertEqual(sparse.last_propagation, propagation)
+
+    def test_missing_connection_is_not_a_zero_weight(self):
+        # the second spike adds nothing but fires the hidden neuron again,
+        # unless the connection it would come through is gone
+        weights = [[[0.6], [0.0]], [[1.0]]]
+        thresholds = [[0.5], [10.0]]
+        dense = CompiledNetwork(weights, thresholds)
+        pruned = CompiledNetwork(weights, thresholds, [[[True], [False]], [[True]]])
+        self.assertEqual(list(dense.evaluate([1, 1])), [2.0])
+        self.assertEqual(list(pruned.evaluate([1, 1])), [1.0])
+        self.assertEqual(list(SparseNetwork.from_compiled(pruned).evaluate([1, 1])), [1.0])
+        self.assertEqual(list(SparseNetwork.from_compiled(dense, min_strength=0.1).evaluate([1, 1])), [1.0])
+
+    def test_pruning_saves_work(self):
+        network = self.networks(1, 27)[0]
+        dense = SparseNetwork.from_network(network)
+        pruned = prune_by_magnitude(network, 0.4)
+        self.assertEqual(dense.connection_count(), 85)
+        self.assertLess(pruned.connection_count(), 85)
+        # the compact form shrinks with every connection removed, at this
+        # size it is about as large as the dense matrices of CompiledNetwork
+        self.assertLess(pruned.nbytes, dense.nbytes)
+        self.assertLess(propagation_cost(pruned)['events'], propagation_cost(dense)['events'])
+        self.assertEqual(propagation_cost(dense), propagation_cost(CompiledNetwork.from_network(network)))
+
+    def test_compiled_form_is_not_pickled(self):
+        import pickle
+
+        pruned = prune_by_magnitude(self.networks(1, 31)[0], 0.4)
+        saturations = pruned.evaluate([1, 1, 0, 1, 1])
+        self.assertIsNotNone(pruned.compiled)
+
+        restored = pickle.loads(pickle.dumps(pruned))
+        self.assertIsNone(restored.compiled)
+        self.assertEqual(list(restored.evaluate([1, 1, 0, 1, 1])), list(saturations))
+
+    def test_prune_by_fitness(self):
+        network = self.networks(1, 28)[0]
+        reference = CompiledNetwork.from_network(network).evaluate([1, 1, 1, 1, 1])
+
+        def evaluate(candidate):
+            return float(np.abs(candidate.evaluate([1, 1, 1, 1, 1]) - reference).sum())
+
+        pruned, report = prune_by_fitness(network, evaluate, tolerance=0.5)
+        self.assertEqual(report['base_score'], 0.0)
+        self.assertLessEqual(report['score'], 0.5)
+        self.assertEqual(report['score'], evaluate(pruned))
+        self.assertGreater(report['removed'], 0)
+        self.assertEqual(report['connections'] + report['removed'], 85)
+
+        pruned, report = prune_by_fitness(network, evaluate, max_trials=3)
+        self.assertEqual(report['trials'], 3)
+        self.assertLessEqual(report['removed'], 3)
+
+    def test_pruned_networks_stay_out_of_genomes_and_populations(self):
+        from genome import Genome
+        from compiled_net import Population
+        from fitness_cache import network_digest
+
+        network = self.networks(1, 29)[0]
+        pruned = prune_by_magnitude(network, 0.4)
+        with self.assertRaises(ValueError):
+            Genome.from_compiled(pruned.to_compiled())
+        with self.assertRaises(ValueError):
+            Population.from_networks([pruned])
+        self.assertNotEqual(network_digest(pruned), network_digest(network))
+        self.assertEqual(network_digest(pruned), network_digest(pruned.to_compiled()))
+
+    def test_drives_like_the_pruned_object_network(self):
+        from physics_2d import SimulationConfig
+        from evaluation import compute_score, load_track, TRACK_PATH
+
+        track = load_track(TRACK_PATH)
+        config = SimulationConfig(max_steps=300)
+        for network in self.networks(3, 30):
+            sparse = prune_by_magnitude(network, 0.3)
+            network.prune(0.3)
+            self.assertEqual(compute_score(sparse, track, config=config), compute_score(network, track, config=config))
+
+
+if __name__ == '__main__':
+    unittest.main()
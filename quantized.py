@@ -0,0 +1,297 @@
+import unittest
+import sys
+import random
+
+import numpy as np
+
+from neural_net import Network
+from compiled_net import CompiledNetwork, compile_network
+
+
+QUANTIZED_DTYPES = ('float16', 'int8')
+
+
+def narrowest_integers(values):
+    # a threshold well above the largest weight does not fit in int8, it is
+    # kept exact in a wider type rather than clipped
+    for dtype in (np.int8, np.int16, np.int32):
+        limits = np.iinfo(dtype)
+        if len(values) == 0 or (limits.min <= values.min() and values.max() <= limits.max):
+            return values.astype(dtype)
+    return values.astype(np.int64)
+
+
+class QuantizedNetwork:
+    # CompiledNetwork with every layer kept in a compact buffer. int8 layers
+    # store round(weight / scale) with one scale per layer chosen so the
+    # largest weight maps to 127, and their thresholds in the same units, so
+    # the running saturations are exact integer sums. float16 layers keep a
+    # scale of 1 and sum in float32. Thresholds are stored as narrow as
+    # they fit and widened to the accumulator when compared. Only the final
+    # saturations are scaled back to floats.
+
+    def __init__(self, weights, thresholds, scales, dtype, masks=None):
+        if dtype not in QUANTIZED_DTYPES:
+            raise ValueError("Unknown quantized dtype %s, expected one of %s" % (dtype, QUANTIZED_DTYPES))
+        self.dtype = dtype
+        self.weights = weights
+        self.thresholds = thresholds
+        self.scales = np.asarray(scales, dtype=np.float64)
+        self.accumulator = np.int32 if dtype == 'int8' else np.float32
+        # the connections of a pruned network, as in CompiledNetwork
+        self.masks = masks
+
+        self.layer_sizes = [self.weights[0].shape[0]]
+        for layer in self.weights:
+            self.layer_sizes.append(layer.shape[1])
+
+    @classmethod
+    def from_compiled(cls, compiled, dtype='int8'):
+        weights = []
+        thresholds = []
+        scales = []
+        for layer_weights, layer_thresholds in zip(compiled.weights, compiled.thresholds):
+            if dtype == 'int8':
+                largest = np.abs(layer_weights).max()
+                scale = largest / 127 if largest > 0 else 1.0
+                weights.append(np.clip(np.round(layer_weights / scale), -127, 127).astype(np.int8))
+                thresholds.append(narrowest_integers(np.round(np.asarray(layer_thresholds) / scale)))
+            else:
+                scale = 1.0
+                weights.append(np.asarray(layer_weights, dtype=np.float16))
+                thresholds.append(np.asarray(layer_thresholds, dtype=np.float16))
+            scales.append(scale)
+        return cls(weights, thresholds, scales, dtype, compiled.masks)
+
+    @classmethod
+    def from_network(cls, network, dtype='int8'):
+        return cls.from_compiled(compile_network(network), dtype)
+
+    @property
+    def nbytes(self):
+        # everything a network on its own holds, see held_bytes
+        return held_bytes(self)
+
+    @property
+    def stacked_nbytes(self):
+        # the payload alone, what one more network adds to buffers stacking
+        # a whole population
+        total = sum(layer.nbytes for layer in self.weights + self.thresholds) + self.scales.nbytes
+        if self.masks is not None:
+            total += sum(layer.nbytes for layer in self.masks)
+        return total
+
+    def to_compiled(self):
+        # the values the quantized network actually runs with, in float64
+        return CompiledNetwork(
+            [layer.astype(np.float64) * scale for layer, scale in zip(self.weights, self.scales)],
+            [layer.astype(np.float64) * scale for layer, scale in zip(self.thresholds, self.scales)],
+            self.masks,
+        )
+
+    def saturations(self, fired_inputs, refire='always'):
+        # the cascade of CompiledNetwork.saturations on the compact buffers
+        events = np.flatnonzero(np.asarray(fired_inputs, dtype=bool))
+        fires = len(events)
+        spikes = 0
+
+        layer_saturations = []
+        for layer, (weights, thresholds, scale) in enumerate(zip(self.weights, self.thresholds, self.scales)):
+            if len(events) == 0:
+                layer_saturations.append(np.zeros(weights.shape[1]))
+                continue
+
+            running = np.cumsum(weights[events], axis=0, dtype=self.accumulator)
+            layer_saturations.append(running[-1] * scale)
+            fired = running >= thresholds
+            if self.masks is None:
+                spikes += len(events) * weights.shape[1]
+            else:
+                delivered = self.masks[layer][events]
+                spikes += int(np.count_nonzero(delivered))
+                fired &= delivered
+            if refire == 'once':
+                fired &= np.cumsum(fired, axis=0) == 1
+            events = np.nonzero(fired)[1]
+            fires += len(events)
+
+        self.last_propagation = {'events': spikes, 'fires': fires}
+        return layer_saturations
+
+    def evaluate(self, fired_inputs, refire='always'):
+        return self.saturations(fired_inputs, refire)[-1]
+
+
+def object_network_bytes(network):
+    # what a Network holds in Python objects, neurons and connections with
+    # their attribute dictionaries, boxed floats and names
+    total = sys.getsizeof(network) + sys.getsizeof(network.__dict__)
+    for neuron in network.all_neurons:
+        total += sys.getsizeof(neuron) + sys.getsizeof(neuron.__dict__) + sys.getsizeof(neuron.connections)
+        total += sys.getsizeof(neuron.threshold) + sys.getsizeof(neuron.name)
+        for connection in neuron.connections:
+            total += sys.getsizeof(connection) + sys.getsizeof(connection.__dict__)
+            total += sys.getsizeof(connection.strength)
+    return total
+
+
+def held_bytes(network):
+    # what an array backed network holds, counted like object_network_bytes:
+    # the instance with its attribute dictionary, the lists of layers and
+    # every array with its header
+    total = sys.getsizeof(network) + sys.getsizeof(network.__dict__)
+    for value in vars(network).values():
+        if isinstance(value, list):
+            total += sys.getsizeof(value)
+            total += sum(sys.getsizeof(item) for item in value if isinstance(item, np.ndarray))
+        elif isinstance(value, np.ndarray):
+            total += sys.getsizeof(value)
+    return total
+
+
+def rank_correlation(first, second):
+    # Spearman correlation, how well one set of scores keeps the order of
+    # the other, ties broken by position
+    if len(first) < 2:
+        return 1.0
+    first_ranks = np.argsort(np.argsort(first, kind='stable'), kind='stable')
+    second_ranks = np.argsort(np.argsort(second, kind='stable'), kind='stable')
+    return float(np.corrcoef(first_ranks, second_ranks)[0, 1])
+
+
+def fitness_drift(networks, dtypes=QUANTIZED_DTYPES, evaluator='serial', stop_policies=None, config=None):
+    # scores of the quantized networks against full precision and the
+    # memory per network of each. quantized networks are simulated one at
+    # a time, so evaluator is 'serial', 'thread' or one of those instances
+    from evaluation import EVALUATORS
+
+    if isinstance(evaluator, str):
+        with EVALUATORS[evaluator](config=config) as owned_evaluator:
+            return fitness_drift(networks, dtypes, owned_evaluator, stop_policies)
+
+    compiled = [compile_network(network) for network in networks]
+    full_precision = np.array(evaluator.evaluate(compiled, stop_policies))
+    # bytes_per_network is a network on its own, stacked_bytes_per_network
+    # its share of buffers holding the whole population
+    report = {
+        'networks': len(networks),
+        'float64': {
+            'bytes_per_network': float(np.mean([held_bytes(network) for network in compiled])),
+            'stacked_bytes_per_network': float(np.mean([
+                sum(layer.nbytes for layer in network.weights + network.thresholds) for network in compiled
+            ])),
+        },
+    }
+    if all(isinstance(network, Network) for network in networks):
+        report['object'] = {'bytes_per_network': float(np.mean([object_network_bytes(network) for network in networks]))}
+
+    for dtype in dtypes:
+        quantized = [QuantizedNetwork.from_compiled(network, dtype) for network in compiled]
+        scores = np.array(evaluator.evaluate(quantized, stop_policies))
+        drift = np.abs(scores - full_precision)
+        report[dtype] = {
+            'bytes_per_network': float(np.mean([network.nbytes for network in quantized])),
+            'stacked_bytes_per_network': float(np.mean([network.stacked_nbytes for network in quantized])),
+            'mean_drift': float(drift.mean()),
+            'max_drift': float(drift.max()),
+            'changed': int(np.count_nonzero(drift)),
+            'same_best': bool(np.argmin(scores) == np.argmin(full_precision)),
+            'rank_correlation': rank_correlation(full_precision, scores),
+        }
+    return report
+
+
+class TestQuantizedNetwork(unittest.TestCase):
+
+    def networks(self, count, seed):
+        random.seed(seed)
+        return [Network(5, 3, 15, 2) for _ in range(0, count)]
+
+    def test_int8_runs_its_own_values_exactly(self):
+        # integer sums of the quantized weights give what the dequantized
+        # float64 network gives, up to float rounding of the scale
+        for network in self.networks(20, 24):
+            quantized = QuantizedNetwork.from_network(network, 'int8')
+            dequantized = quantized.to_compiled()
+            for _ in range(0, 5):
+                fired_inputs = [random.random() > 0.3 for _ in range(0, 5)]
+                np.testing.assert_allclose(
+                    quantized.evaluate(fired_inputs), dequantized.evaluate(fired_inputs), rtol=1e-9
+                )
+                self.assertEqual(quantized.last_propagation, dequantized.last_propagation)
+
+    def test_quantized_values_stay_close(self):
+        network = self.networks(1, 25)[0]
+        compiled = CompiledNetwork.from_network(network)
+        for dtype, tolerance in [('float16', 1e-3), ('int8', 1 / 254)]:
+            quantized = QuantizedNetwork.from_network(network, dtype)
+            for original, layer in zip(compiled.weights, quantized.to_compiled().weights):
+                self.assertLessEqual(np.abs(original - layer).max(), tolerance * max(1.0, np.abs(original).max()))
+        self.assertEqual(QuantizedNetwork.from_network(network, 'int8').weights[0].dtype, np.int8)
+        with self.assertRaises(ValueError):
+            QuantizedNetwork.from_network(network, 'int4')
+
+    def test_memory(self):
+        network = self.networks(1, 26)[0]
+        compiled = CompiledNetwork.from_network(network)
+        int8 = QuantizedNetwork.from_network(network, 'int8')
+        float16 = QuantizedNetwork.from_network(network, 'float16')
+        # 3 * 5 * 5 + 5 * 2 weights, 3 * 5 + 2 thresholds, 4 scales
+        self.assertEqual(int8.stacked_nbytes, 85 + 17 + 4 * 8)
+        self.assertEqual(float16.stacked_nbytes, 85 * 2 + 17 * 2 + 4 * 8)
+        self.assertLess(int8.stacked_nbytes, sum(layer.nbytes for layer in compiled.weights + compiled.thresholds) / 4)
+
+        # on its own a network is mostly array headers and the instance
+        self.assertGreater(int8.nbytes, 5 * int8.stacked_nbytes)
+        self.assertLess(int8.nbytes, float16.nbytes)
+        self.assertLess(float16.nbytes, held_bytes(compiled))
+        self.assertGreater(object_network_bytes(network), 10 * int8.nbytes)
+
+    def test_thresholds_widen_only_when_needed(self):
+        self.assertEqual(narrowest_integers(np.array([-128.0, 127.0])).dtype, np.int8)
+        self.assertEqual(narrowest_integers(np.array([0.0, 128.0])).dtype, np.int16)
+        self.assertEqual(narrowest_integers(np.array([-40000.0])).dtype, np.int32)
+
+        # weak weights against the usual thresholds of 0.5
+        weights = [np.full((2, 2), 0.001), np.full((2, 1), 0.001)]
+        compiled = CompiledNetwork(weights, [[0.5, 0.5], [0.5]])
+        quantized = QuantizedNetwork.from_compiled(compiled, 'int8')
+        self.assertEqual(quantized.thresholds[0].dtype, np.int32)
+        self.assertEqual(quantized.thresholds[0].tolist(), [63500, 63500])
+        self.assertEqual(list(quantized.evaluate([1, 1])), list(compiled.evaluate([1, 1])))
+
+    def test_control_manager_runs_quantized(self):
+        from physics_2d import CarCompiledControlManager
+
+        network = self.networks(1, 27)[0]
+        quantized = QuantizedNetwork.from_network(network, 'float16')
+        control_manager = CarCompiledControlManager(quantized)
+        self.assertIs(control_manager.network, quantized)
+        self.assertEqual(
+            control_manager.decide_actions([20, 1, 20, 1, 20]),
+            CarCompiledControlManager(quantized.to_compiled()).decide_actions([20, 1, 20, 1, 20]),
+        )
+
+    def test_fitness_drift_report(self):
+        from physics_2d import SimulationConfig
+
+        networks = self.networks(6, 28)
+        report = fitness_drift(networks, config=SimulationConfig(max_steps=300))
+        self.assertEqual(report['networks'], 6)
+        self.assertEqual(report['float64']['stacked_bytes_per_network'], (85 + 17) * 8)
+        self.assertGreater(report['float64']['bytes_per_network'], report['float64']['stacked_bytes_per_network'])
+        for dtype in QUANTIZED_DTYPES:
+            self.assertGreaterEqual(report[dtype]['max_drift'], report[dtype]['mean_drift'])
+            self.assertLessEqual(report[dtype]['changed'], 6)
+            self.assertLessEqual(report[dtype]['rank_correlation'], 1.0)
+        self.assertLess(report['int8']['bytes_per_network'], report['float16']['bytes_per_network'])
+        self.assertLess(report['float16']['bytes_per_network'], report['object']['bytes_per_network'])
+
+    def test_rank_correlation(self):
+        self.assertEqual(rank_correlation([1, 2, 3], [10, 20, 30]), 1.0)
+        self.assertEqual(rank_correlation([1, 2, 3], [30, 20, 10]), -1.0)
+        self.assertEqual(rank_correlation([1], [2]), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
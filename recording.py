@@ -0,0 +1,186 @@
+import unittest
+import os
+import struct
+import tempfile
+import collections
+
+import numpy as np
+
+
+STREAM_MAGIC = b'NCS1'
+STREAM_HEADER = struct.Struct('<4sI')
+
+RecordedState = collections.namedtuple('RecordedState', ['x', 'y', 'angle'])
+
+
+def object_angle(physical_object):
+    return getattr(physical_object.force, 'angle', 0.0)
+
+
+class ListRecorder:
+    # every step of every object, what Simulation.states always held
+
+    def __init__(self):
+        self.states = []
+
+    def record(self, plane, step_number):
+        self.states.append(plane.dump_state())
+
+    def close(self):
+        pass
+
+
+class NullRecorder:
+
+    def __init__(self):
+        self.states = []
+
+    def record(self, plane, step_number):
+        pass
+
+    def close(self):
+        pass
+
+
+class EveryNthRecorder(ListRecorder):
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+
+    def record(self, plane, step_number):
+        if step_number % self.every == 0:
+            self.states.append(plane.dump_state())
+
+
+class RingBufferRecorder(ListRecorder):
+
+    def __init__(self, size):
+        self.states = collections.deque(maxlen=size)
+
+
+class StreamRecorder:
+    # float32 (x, y, angle) per object and step appended to a binary file,
+    # readable frame by frame with StateStream
+
+    def __init__(self, path):
+        self.path = path
+        self.stream = None
+        self.object_count = None
+
+    def record(self, plane, step_number):
+        if self.stream is None:
+            self.object_count = len(plane.physical_objects)
+            self.stream = open(self.path, 'wb')
+            self.stream.write(STREAM_HEADER.pack(STREAM_MAGIC, self.object_count))
+
+        frame = np.array([
+            (position.x, position.y, object_angle(physical_object))
+            for physical_object, position in plane.physical_objects
+        ], dtype='<f4')
+        self.stream.write(frame.tobytes())
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def __getstate__(self):
+        self.close()
+        return {'path': self.path, 'stream': None, 'object_count': self.object_count}
+
+    @property
+    def states(self):
+        self.close()
+        return StateStream(self.path)
+
+
+class StateStream:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as stream:
+            magic, self.object_count = STREAM_HEADER.unpack(stream.read(STREAM_HEADER.size))
+        if magic != STREAM_MAGIC:
+            raise ValueError("%s is not a recorded state stream" % path)
+        self.frame_size = self.object_count * 3 * 4
+
+    def __len__(self):
+        if self.frame_size == 0:
+            return 0
+        return (os.path.getsize(self.path) - STREAM_HEADER.size) // self.frame_size
+
+    def __getitem__(self, index):
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("frame %s out of range" % index)
+
+        with open(self.path, 'rb') as stream:
+            stream.seek(STREAM_HEADER.size + index * self.frame_size)
+            frame = np.frombuffer(stream.read(self.frame_size), dtype='<f4').reshape(-1, 3)
+        return [RecordedState(float(x), float(y), float(angle)) for x, y, angle in frame]
+
+    def __iter__(self):
+        for index in range(0, len(self)):
+            yield self[index]
+
+
+def is_state_stream(path):
+    with open(path, 'rb') as stream:
+        return stream.read(len(STREAM_MAGIC)) == STREAM_MAGIC
+
+
+class TestRecorders(unittest.TestCase):
+
+    def simulate(self, recorder, max_steps=30):
+        from physics_2d import PhysicalPlane, PhysicalObject, Simulation, GeometricVector2D, Vector2D
+
+        plane = PhysicalPlane()
+        thing = PhysicalObject(10)
+        thing.apply_force(GeometricVector2D(10, 30))
+        plane.add_physical_object(thing, Vector2D(1, 2))
+        sim = Simulation(plane, max_steps=max_steps, recorder=recorder)
+        sim.simulate()
+        return sim
+
+    def test_default_records_every_step(self):
+        sim = self.simulate(None)
+        self.assertEqual(len(sim.states), 30)
+
+    def test_off(self):
+        self.assertEqual(len(self.simulate(NullRecorder()).states), 0)
+
+    def test_every_nth(self):
+        full = self.simulate(ListRecorder()).states
+        sparse = self.simulate(EveryNthRecorder(10)).states
+        self.assertEqual(sparse, [full[0], full[10], full[20]])
+
+    def test_ring_buffer(self):
+        full = self.simulate(ListRecorder()).states
+        self.assertEqual(list(self.simulate(RingBufferRecorder(5)).states), full[-5:])
+
+    def test_stream(self):
+        import pickle
+
+        full = self.simulate(ListRecorder()).states
+        path = os.path.join(tempfile.mkdtemp(), 'run.states')
+        sim = self.simulate(StreamRecorder(path))
+
+        self.assertTrue(is_state_stream(path))
+        self.assertEqual(os.path.getsize(path), STREAM_HEADER.size + 30 * 12)
+        states = sim.states
+        self.assertEqual(len(states), 30)
+        for recorded, expected in zip(states, full):
+            self.assertAlmostEqual(recorded[0].x, expected[0].x, places=5)
+            self.assertAlmostEqual(recorded[0].y, expected[0].y, places=5)
+            self.assertEqual(recorded[0].angle, 30.0)
+        self.assertEqual(states[-1], states[29])
+
+        restored = pickle.loads(pickle.dumps(sim))
+        self.assertEqual(restored.states[3], states[3])
+
+
+if __name__ == '__main__':
+    unittest.main()
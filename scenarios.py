@@ -0,0 +1,282 @@
+import unittest
+import os
+import time
+import random
+import hashlib
+import itertools
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+
+from track import load_track, load_distance_field, image_hash
+from profiling import Profiler
+from evaluation import (
+    Evaluator, SharedPopulation, TRACK_PATH, START_POSITION,
+    as_population, chunk_sizes, drive, score_position,
+)
+
+
+class Scenario:
+    # one track, a start pose and the point the car should get close to,
+    # the defaults are what training always ran. The 'geodesic' metric
+    # scores how far the car still has to drive along the track, the
+    # 'manhattan' one how far it is in a straight line.
+
+    METRICS = ('manhattan', 'geodesic')
+
+    def __init__(self, track_path=TRACK_PATH, start=START_POSITION, heading=0.0, goal=(500, 500), weight=1.0,
+                 metric='manhattan'):
+        if metric not in self.METRICS:
+            raise ValueError("Unknown metric %s, expected one of %s" % (metric, self.METRICS))
+        self.track_path = track_path
+        self.start = tuple(start)
+        self.heading = heading
+        self.goal = tuple(goal)
+        self.weight = weight
+        self.metric = metric
+        self._distance_field = None
+
+    @property
+    def distance_field(self):
+        # built once per track and goal in the track cache, then mapped
+        if self._distance_field is None:
+            self._distance_field = load_distance_field(self.track_path, self.goal)
+        return self._distance_field
+
+    def score(self, position):
+        # smaller is better, score_position for the default goal
+        if self.metric == 'geodesic':
+            return self.distance_field.distance_at(position)
+        return (self.goal[0] - position.x) + (self.goal[1] - position.y)
+
+    def key(self):
+        return (image_hash(self.track_path), self.start, self.heading, self.goal, self.weight, self.metric)
+
+    def __repr__(self):
+        return "Scenario(%s, start=%s, heading=%s)" % (self.track_path, self.start, self.heading)
+
+
+class ScenarioSet:
+
+    AGGREGATES = ('mean', 'worst', 'best')
+
+    def __init__(self, scenarios, aggregate='mean'):
+        if aggregate not in self.AGGREGATES:
+            raise ValueError("Unknown aggregate %s, expected one of %s" % (aggregate, self.AGGREGATES))
+        if not scenarios:
+            raise ValueError("A scenario set needs at least one scenario")
+        self.scenarios = list(scenarios)
+        self.aggregate = aggregate
+
+    @classmethod
+    def grid(cls, track_paths=(TRACK_PATH,), starts=(START_POSITION,), headings=(0.0,), aggregate='mean',
+             metric='manhattan'):
+        return cls([
+            Scenario(track_path, start, heading, metric=metric)
+            for track_path, start, heading in itertools.product(track_paths, starts, headings)
+        ], aggregate)
+
+    def __len__(self):
+        return len(self.scenarios)
+
+    def track_paths(self):
+        return sorted(set(scenario.track_path for scenario in self.scenarios))
+
+    def key(self):
+        digest = hashlib.sha256(repr([scenario.key() for scenario in self.scenarios]).encode())
+        digest.update(self.aggregate.encode())
+        return digest.hexdigest()
+
+    def aggregate_scores(self, scores):
+        # scores is one row per network and one column per scenario
+        scores = np.asarray(scores, dtype=np.float64)
+        if self.aggregate == 'worst':
+            return scores.max(axis=1).tolist()
+        if self.aggregate == 'best':
+            return scores.min(axis=1).tolist()
+        weights = np.array([scenario.weight for scenario in self.scenarios])
+        return (scores @ weights / weights.sum()).tolist()
+
+
+_worker = {}
+
+
+def _initialize_scenario_worker(shared_population, scenario_set, config):
+    _worker['population'] = shared_population
+    _worker['scenarios'] = scenario_set
+    _worker['config'] = config
+    # tracks are memory mapped from the track cache, every worker holds
+    # each one once however many scenarios use it
+    _worker['tracks'] = dict((path, load_track(path)) for path in scenario_set.track_paths())
+
+
+def _score_job(job, stop_policies, profile=False):
+    index, scenario_index = job
+    scenario = _worker['scenarios'].scenarios[scenario_index]
+    profiler = Profiler() if profile else None
+    position, result = drive(
+        _worker['population'][index], _worker['tracks'][scenario.track_path],
+        scenario.start, scenario.heading, stop_policies, _worker['config'], profiler=profiler,
+    )
+    return (scenario.score(position), result.steps_saved, os.getpid(), profiler.to_dict() if profile else None)
+
+
+class ScenarioEvaluator(Evaluator):
+    # every (network, scenario) pair is one job. the pool hands out small
+    # chunks of jobs to whichever worker is free, so a worker stuck with
+    # long runs does not hold up the others
+
+    def __init__(self, scenario_set, max_workers=None, config=None, start_method=None):
+        self.scenario_set = scenario_set
+        self.max_workers = max_workers
+        self.config = config
+        self.start_method = start_method
+        self.shared_population = None
+        self.executor = None
+        self.last_scores = None
+
+    @property
+    def track_key(self):
+        # what the fitness cache keys on, all tracks and poses at once
+        return self.scenario_set.key()
+
+    def start(self, population):
+        self.close()
+        self.shared_population = SharedPopulation(population.layer_sizes, len(population))
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            self.max_workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_initialize_scenario_worker,
+            initargs=(self.shared_population, self.scenario_set, self.config),
+        )
+
+    def evaluate(self, networks, stop_policies=None):
+        population = as_population(networks)
+        shared = self.shared_population
+        if shared is None or shared.layer_sizes != population.layer_sizes or shared.capacity < len(population):
+            self.start(population)
+
+        started = time.perf_counter()
+        self.shared_population.store(population)
+        jobs = [
+            (index, scenario_index)
+            for index in range(0, len(population))
+            for scenario_index in range(0, len(self.scenario_set))
+        ]
+        chunksize = chunk_sizes(len(jobs), self.executor._max_workers)
+        results = list(self.executor.map(
+            _score_job, jobs, [stop_policies] * len(jobs), [self.profile] * len(jobs), chunksize=chunksize
+        ))
+
+        self.last_scores = np.array([score for score, steps_saved, worker, profile in results]).reshape(
+            len(population), len(self.scenario_set)
+        )
+        self.steps_saved = sum(steps_saved for score, steps_saved, worker, profile in results)
+        self.last_profile = self.merge_profiles(profile for score, steps_saved, worker, profile in results)
+        jobs_per_worker = {}
+        for score, steps_saved, worker, profile in results:
+            jobs_per_worker[worker] = jobs_per_worker.get(worker, 0) + 1
+        self.last_generation = {
+            'networks': len(population),
+            'jobs': len(jobs),
+            'seconds': time.perf_counter() - started,
+            'jobs_per_worker': sorted(jobs_per_worker.values()),
+        }
+        return self.scenario_set.aggregate_scores(self.last_scores)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.shared_population is not None:
+            self.shared_population.close()
+            self.shared_population = None
+
+
+class TestScenarioSet(unittest.TestCase):
+
+    def test_default_scenario_scores_like_training(self):
+        from physics_2d import Vector2D
+
+        position = Vector2D(12.5, 3.0)
+        self.assertEqual(Scenario().score(position), score_position(position))
+
+    def test_grid(self):
+        scenarios = ScenarioSet.grid(starts=[(2, 4), (3, 4)], headings=[0, 30, -30])
+        self.assertEqual(len(scenarios), 6)
+        self.assertEqual(scenarios.track_paths(), [TRACK_PATH])
+        self.assertEqual([scenario.heading for scenario in scenarios.scenarios[0:3]], [0, 30, -30])
+
+    def test_aggregates(self):
+        scores = [[1.0, 3.0], [2.0, 2.0]]
+        self.assertEqual(ScenarioSet([Scenario(), Scenario()]).aggregate_scores(scores), [2.0, 2.0])
+        self.assertEqual(ScenarioSet([Scenario(), Scenario()], 'worst').aggregate_scores(scores), [3.0, 2.0])
+        self.assertEqual(ScenarioSet([Scenario(), Scenario()], 'best').aggregate_scores(scores), [1.0, 2.0])
+        weighted = ScenarioSet([Scenario(weight=3.0), Scenario(weight=1.0)])
+        self.assertEqual(weighted.aggregate_scores(scores), [1.5, 2.0])
+        with self.assertRaises(ValueError):
+            ScenarioSet([Scenario()], 'median')
+
+    def test_geodesic_metric(self):
+        from physics_2d import Vector2D
+
+        scenario = Scenario(metric='geodesic')
+        field = load_distance_field(TRACK_PATH)
+        position = Vector2D(2, 4)
+        self.assertEqual(scenario.score(position), field.distance_at(position))
+        # further along the track is better even where it is not in a
+        # straight line to the goal
+        self.assertLess(scenario.score(Vector2D(45, 30)), scenario.score(position))
+        self.assertNotEqual(Scenario(metric='geodesic').key(), Scenario().key())
+        with self.assertRaises(ValueError):
+            Scenario(metric='euclidean')
+
+    def test_key_changes_with_scenarios(self):
+        self.assertEqual(ScenarioSet.grid().key(), ScenarioSet.grid().key())
+        self.assertNotEqual(ScenarioSet.grid().key(), ScenarioSet.grid(headings=[10]).key())
+        self.assertNotEqual(ScenarioSet.grid().key(), ScenarioSet.grid(aggregate='worst').key())
+
+
+class TestScenarioEvaluator(unittest.TestCase):
+
+    def test_matches_serial_drives(self):
+        from neural_net import Network
+        from evaluation import evaluate_population
+
+        random.seed(18)
+        networks = [Network(5, 3, 15, 2) for _ in range(0, 4)]
+        scenario_set = ScenarioSet.grid(starts=[(2, 4), (2.5, 4.5)], headings=[0, 20], aggregate='worst')
+        track = load_track(TRACK_PATH)
+        expected = [
+            [scenario.score(drive(network, track, scenario.start, scenario.heading)[0]) for scenario in scenario_set.scenarios]
+            for network in networks
+        ]
+
+        with ScenarioEvaluator(scenario_set, max_workers=2) as evaluator:
+            evaluator.profile = True
+            scores, report = evaluate_population(networks, evaluator)
+            self.assertEqual(evaluator.last_scores.tolist(), expected)
+            self.assertEqual(report['profile']['counts']['simulations'], 16)
+            self.assertEqual(scores, [max(row) for row in expected])
+            self.assertEqual(evaluator.last_generation['jobs'], 16)
+            self.assertEqual(sum(evaluator.last_generation['jobs_per_worker']), 16)
+
+            # a bigger population restarts the pool with room for it
+            scores, report = evaluate_population(networks + networks, evaluator)
+            self.assertEqual(scores, [max(row) for row in expected + expected])
+
+    def test_single_default_scenario_matches_training_score(self):
+        from neural_net import Network
+        from evaluation import evaluate_population
+
+        random.seed(19)
+        networks = [Network(5, 3, 15, 2) for _ in range(0, 3)]
+        expected, _ = evaluate_population(networks, 'serial')
+        with ScenarioEvaluator(ScenarioSet([Scenario()]), max_workers=1) as evaluator:
+            scores, report = evaluate_population(networks, evaluator)
+        self.assertEqual(scores, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,563 @@
+import unittest
+import random
+import math
+import os
+import json
+import pickle
+import hashlib
+import tempfile
+import collections
+
+import numpy as np
+
+
+SENSOR_ANGLES = np.array([0, 45, -45, 90, -90], dtype=np.float64)
+SENSOR_LENGTHS = np.arange(1, 21, dtype=np.float64)
+
+TRACK_CACHE_VERSION = 1
+DEFAULT_TRACK_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.track_cache')
+
+
+class Track:
+
+    def __init__(self, bits, width, height, track_granularity_m=0.1):
+        # one bit per cell, rows packed with numpy.packbits, row 0 is the
+        # bottom of the track image and set bits are walls. Everything
+        # outside of width x height is a wall.
+        self.bits = bits
+        self.width = width
+        self.height = height
+        self.row_bytes = bits.shape[1]
+        self.track_granularity_m = track_granularity_m
+        self.key = None
+        self.cache_path = None
+        self._bytes = memoryview(np.ascontiguousarray(bits).reshape(-1))
+
+    def __getstate__(self):
+        # tracks loaded from the cache pickle as their file name, so process
+        # pool workers map the same file instead of receiving a copy
+        state = dict(self.__dict__)
+        del state['_bytes']
+        if self.cache_path is not None:
+            del state['bits']
+        return state
+
+    def __setstate__(self, state):
+        if 'bits' not in state:
+            state['bits'] = np.load(state['cache_path'], mmap_mode='r')
+        self.__dict__.update(state)
+        self._bytes = memoryview(np.ascontiguousarray(self.bits).reshape(-1))
+
+    @classmethod
+    def from_grid(cls, grid, track_granularity_m=0.1):
+        grid = np.asarray(grid, dtype=np.uint8)
+        height, width = grid.shape
+        return cls(np.packbits(grid != 0, axis=1), width, height, track_granularity_m)
+
+    @classmethod
+    def from_track_data(cls, track_data, track_granularity_m=0.1):
+        if isinstance(track_data, Track):
+            return track_data
+        return cls.from_grid(track_data, track_granularity_m)
+
+    @classmethod
+    def from_image(cls, image_path, track_granularity_m=0.1):
+        from PIL import Image
+
+        pixels = np.asarray(Image.open(image_path).convert('RGBA'))
+        grid = (pixels != 255).any(axis=2)
+        return cls.from_grid(grid[::-1], track_granularity_m)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def grid(self):
+        return np.unpackbits(self.bits, axis=1, count=self.width)
+
+    def is_wall(self, cell_x, cell_y):
+        if 0 <= cell_x < self.width and 0 <= cell_y < self.height:
+            return (self._bytes[cell_y * self.row_bytes + (cell_x >> 3)] << (cell_x & 7)) & 128 != 0
+        return True
+
+    def walls(self, cells_x, cells_y):
+        cells_x = np.asarray(cells_x, dtype=np.int64)
+        cells_y = np.asarray(cells_y, dtype=np.int64)
+        inside = (cells_x >= 0) & (cells_y >= 0) & (cells_x < self.width) & (cells_y < self.height)
+
+        walls = np.ones(cells_x.shape, dtype=bool)
+        cells_x = cells_x[inside]
+        packed = self.bits[cells_y[inside], cells_x >> 3]
+        walls[inside] = (packed >> (7 - (cells_x & 7))) & 1 == 1
+        return walls
+
+    def is_wall_at(self, position):
+        return self.is_wall(
+            math.floor(position.x / self.track_granularity_m),
+            math.floor(position.y / self.track_granularity_m),
+        )
+
+    def walls_at(self, positions):
+        cells = np.floor(np.asarray(positions, dtype=np.float64) / self.track_granularity_m).astype(np.int64)
+        return self.walls(cells[..., 0], cells[..., 1])
+
+
+class SensorTable:
+
+    def __init__(self, distances, angle_resolution_degrees, track_granularity_m=0.1):
+        # distances[y, x, a] is the sensor reading from the centre of cell
+        # (x, y) towards angle a * angle_resolution_degrees
+        self.distances = distances
+        self.angle_resolution_degrees = angle_resolution_degrees
+        self.track_granularity_m = track_granularity_m
+        self.angle_count = distances.shape[2]
+        self.cache_path = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if self.cache_path is not None:
+            del state['distances']
+        return state
+
+    def __setstate__(self, state):
+        if 'distances' not in state:
+            state['distances'] = np.load(state['cache_path'], mmap_mode='r')
+        self.__dict__.update(state)
+
+    @classmethod
+    def from_track(cls, track, angle_resolution_degrees=5):
+        track = Track.from_track_data(track)
+        track_granularity_m = track.track_granularity_m
+        height, width = track.height, track.width
+        angle_count = int(round(360 / angle_resolution_degrees))
+        if not math.isclose(angle_count * angle_resolution_degrees, 360):
+            raise ValueError("Angle resolution has to divide 360 degrees, got %s" % angle_resolution_degrees)
+
+        centres_y, centres_x = np.mgrid[0:height, 0:width]
+        centres_x = (centres_x + 0.5) * track_granularity_m
+        centres_y = (centres_y + 0.5) * track_granularity_m
+
+        distances = np.empty((height, width, angle_count), dtype=np.uint8)
+        for angle_index in range(0, angle_count):
+            radians = math.radians(angle_index * angle_resolution_degrees)
+            reading = np.full((height, width), len(SENSOR_LENGTHS), dtype=np.uint8)
+            searching = np.ones((height, width), dtype=bool)
+            for length in SENSOR_LENGTHS:
+                cells_x = np.floor((math.sin(radians) * length + centres_x) / track_granularity_m)
+                cells_y = np.floor((math.cos(radians) * length + centres_y) / track_granularity_m)
+                hit = searching & track.walls(cells_x, cells_y)
+                reading[hit] = length
+                searching &= ~hit
+
+            distances[:, :, angle_index] = reading
+
+        return cls(distances, angle_resolution_degrees, track_granularity_m)
+
+    def angle_indices(self, angles):
+        return np.rint(np.asarray(angles) / self.angle_resolution_degrees).astype(np.int64) % self.angle_count
+
+    def lookup(self, positions, angles):
+        # readings for the five car sensors of many cars at once, cars
+        # outside of the table read 1 on every sensor
+        positions = np.asarray(positions, dtype=np.float64)
+        cells = np.floor(positions / self.track_granularity_m).astype(np.int64)
+        height, width = self.distances.shape[0:2]
+        inside = (cells[:, 1] >= 0) & (cells[:, 1] < height) & (cells[:, 0] >= 0) & (cells[:, 0] < width)
+
+        angle_indices = self.angle_indices(np.asarray(angles)[:, np.newaxis] + SENSOR_ANGLES)
+        readings = np.ones(angle_indices.shape)
+        readings[inside] = self.distances[
+            cells[inside, 1, np.newaxis],
+            cells[inside, 0, np.newaxis],
+            angle_indices[inside],
+        ]
+        return readings
+
+    def sensor_data(self, position, angle):
+        cell_x = math.floor(position.x / self.track_granularity_m)
+        cell_y = math.floor(position.y / self.track_granularity_m)
+        height, width = self.distances.shape[0:2]
+        if not (0 <= cell_y < height and 0 <= cell_x < width):
+            return [1.0] * len(SENSOR_ANGLES)
+
+        distances = self.distances[cell_y, cell_x]
+        return [
+            float(distances[int(round((angle + offset) / self.angle_resolution_degrees)) % self.angle_count])
+            for offset in (0, 45, -45, 90, -90)
+        ]
+
+
+class DistanceField:
+
+    def __init__(self, distances, goal_cell, track_granularity_m=0.1):
+        # distances[y, x] is how many meters a car in cell (x, y) still has
+        # to drive to the goal without crossing a wall. Wall cells hold the
+        # distance of the nearest open cell so a crashed car keeps the
+        # progress it made, open cells cut off from the goal hold more than
+        # any reachable cell.
+        self.distances = distances
+        self.goal_cell = tuple(goal_cell)
+        self.track_granularity_m = track_granularity_m
+        self.cache_path = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if self.cache_path is not None:
+            del state['distances']
+        return state
+
+    def __setstate__(self, state):
+        if 'distances' not in state:
+            state['distances'] = np.load(state['cache_path'], mmap_mode='r')
+        self.__dict__.update(state)
+
+    @staticmethod
+    def goal_cell_for(track, goal):
+        # the open cell closest to the goal, the goal itself may lie in a
+        # wall or outside of the track like the (500, 500) training aimed at
+        free_y, free_x = np.nonzero(track.grid() == 0)
+        goal_x = math.floor(goal[0] / track.track_granularity_m)
+        goal_y = math.floor(goal[1] / track.track_granularity_m)
+        closest = np.argmin(np.abs(free_x - goal_x) + np.abs(free_y - goal_y))
+        return (int(free_x[closest]), int(free_y[closest]))
+
+    @classmethod
+    def from_track(cls, track, goal=(500, 500)):
+        # breadth first search over the four neighbours of every open cell
+        track = Track.from_track_data(track)
+        width, height = track.width, track.height
+        open_cells = (track.grid() == 0).reshape(-1)
+        goal_x, goal_y = cls.goal_cell_for(track, goal)
+
+        steps = np.full(width * height, -1, dtype=np.int64)
+        start = goal_y * width + goal_x
+        steps[start] = 0
+        queue = collections.deque([start])
+        while queue:
+            cell = queue.popleft()
+            x = cell % width
+            for neighbour, inside in (
+                (cell - 1, x > 0), (cell + 1, x < width - 1),
+                (cell - width, cell >= width), (cell + width, cell < (height - 1) * width),
+            ):
+                if inside and open_cells[neighbour] and steps[neighbour] < 0:
+                    steps[neighbour] = steps[cell] + 1
+                    queue.append(neighbour)
+
+        unreachable = open_cells & (steps < 0)
+        steps[unreachable] = steps.max() + 1
+
+        # walls take the value of the open cell they were reached from
+        queue = collections.deque(np.nonzero(open_cells)[0].tolist())
+        while queue:
+            cell = queue.popleft()
+            x = cell % width
+            for neighbour, inside in (
+                (cell - 1, x > 0), (cell + 1, x < width - 1),
+                (cell - width, cell >= width), (cell + width, cell < (height - 1) * width),
+            ):
+                if inside and steps[neighbour] < 0:
+                    steps[neighbour] = steps[cell]
+                    queue.append(neighbour)
+
+        distances = (steps.reshape(height, width) * track.track_granularity_m).astype(np.float32)
+        return cls(distances, (goal_x, goal_y), track.track_granularity_m)
+
+    def distance_at(self, position):
+        # positions off the track count as the closest edge cell
+        height, width = self.distances.shape
+        cell_x = min(max(math.floor(position.x / self.track_granularity_m), 0), width - 1)
+        cell_y = min(max(math.floor(position.y / self.track_granularity_m), 0), height - 1)
+        return float(self.distances[cell_y, cell_x])
+
+    def distances_at(self, positions):
+        height, width = self.distances.shape
+        cells = np.floor(np.asarray(positions, dtype=np.float64) / self.track_granularity_m).astype(np.int64)
+        cells_x = np.clip(cells[..., 0], 0, width - 1)
+        cells_y = np.clip(cells[..., 1], 0, height - 1)
+        return self.distances[cells_y, cells_x].astype(np.float64)
+
+
+def image_hash(image_path):
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as image_file:
+        for chunk in iter(lambda: image_file.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TrackCache:
+
+    def __init__(self, cache_dir=DEFAULT_TRACK_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def path(self, key, suffix):
+        return os.path.join(self.cache_dir, '%s.v%s.%s' % (key, TRACK_CACHE_VERSION, suffix))
+
+    def save_array(self, array, path):
+        # written to a temporary file first so that concurrent workers never
+        # map a half written file
+        os.makedirs(self.cache_dir, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.npy')
+        with os.fdopen(descriptor, 'wb') as temporary_file:
+            np.save(temporary_file, array)
+        os.replace(temporary_path, path)
+
+    def load_track(self, image_path, track_granularity_m=0.1):
+        key = image_hash(image_path)
+        bits_path = self.path(key, 'track.npy')
+        meta_path = self.path(key, 'track.json')
+
+        if not (os.path.exists(bits_path) and os.path.exists(meta_path)):
+            track = Track.from_image(image_path)
+            self.save_array(track.bits, bits_path)
+            with open(meta_path + '.tmp%s' % os.getpid(), 'w') as meta_file:
+                json.dump({'width': track.width, 'height': track.height}, meta_file)
+            os.replace(meta_path + '.tmp%s' % os.getpid(), meta_path)
+
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+
+        track = Track(np.load(bits_path, mmap_mode='r'), meta['width'], meta['height'], track_granularity_m)
+        track.cache_path = bits_path
+        track.key = key
+        return track
+
+    def load_sensor_table(self, image_path, angle_resolution_degrees=5, track_granularity_m=0.1):
+        track = self.load_track(image_path, track_granularity_m)
+        # distances are in metres, so the table is only valid for the
+        # granularity it was measured with
+        table_path = self.path(track.key, 'sensors-%s-%sm.npy' % (angle_resolution_degrees, track_granularity_m))
+
+        if not os.path.exists(table_path):
+            table = SensorTable.from_track(track, angle_resolution_degrees)
+            self.save_array(table.distances, table_path)
+
+        table = SensorTable(np.load(table_path, mmap_mode='r'), angle_resolution_degrees, track_granularity_m)
+        table.cache_path = table_path
+        return table
+
+    def load_distance_field(self, image_path, goal=(500, 500), track_granularity_m=0.1):
+        track = self.load_track(image_path, track_granularity_m)
+        goal_x, goal_y = DistanceField.goal_cell_for(track, goal)
+        # the goal cell alone is ambiguous, the same cell is a different
+        # place and the distances a different scale at another granularity
+        field_path = self.path(track.key, 'distance-%s-%s-%sm.npy' % (goal_x, goal_y, track_granularity_m))
+
+        if not os.path.exists(field_path):
+            field = DistanceField.from_track(track, goal)
+            self.save_array(field.distances, field_path)
+
+        field = DistanceField(np.load(field_path, mmap_mode='r'), (goal_x, goal_y), track_granularity_m)
+        field.cache_path = field_path
+        return field
+
+
+def load_track(image_path, cache_dir=DEFAULT_TRACK_CACHE_DIR):
+    return TrackCache(cache_dir).load_track(image_path)
+
+
+def load_sensor_table(image_path, angle_resolution_degrees=5, cache_dir=DEFAULT_TRACK_CACHE_DIR):
+    return TrackCache(cache_dir).load_sensor_table(image_path, angle_resolution_degrees)
+
+
+def load_distance_field(image_path, goal=(500, 500), cache_dir=DEFAULT_TRACK_CACHE_DIR):
+    return TrackCache(cache_dir).load_distance_field(image_path, goal)
+
+
+class TestSensorTable(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.track = Track.from_image('tracks/1.png')
+        cls.table = SensorTable.from_track(cls.track, angle_resolution_degrees=5)
+
+    def test_accuracy_against_ray_marcher(self):
+        from physics_2d import Car, PhysicalPlaneWithTrack, Vector2D
+
+        random.seed(7)
+        plane = PhysicalPlaneWithTrack(self.track)
+        car = Car(10, 20, 200)
+        free_cells = np.argwhere(self.track.grid() == 0)
+
+        errors = []
+        for _ in range(0, 500):
+            cell_y, cell_x = free_cells[random.randrange(0, len(free_cells))]
+            position = Vector2D((cell_x + random.random()) * 0.1, (cell_y + random.random()) * 0.1)
+            car.force.angle = random.uniform(-360, 360)
+
+            expected = car.calculate_sensor_data(position, plane)
+            result = self.table.sensor_data(position, car.force.angle)
+            errors.extend(abs(a - b) for a, b in zip(expected, result))
+
+        # a cell and a few degrees of slack move a reading by at most one
+        # metre in the vast majority of cases
+        self.assertLess(np.mean(errors), 0.2)
+        self.assertGreater(np.mean(np.array(errors) <= 1), 0.97)
+
+    def test_lookup_matches_sensor_data(self):
+        from physics_2d import Vector2D
+
+        positions = np.array([[2.0, 4.0], [2.35, 3.9], [-1.0, -1.0], [80.0, 2.0]])
+        angles = np.array([0.0, 33.0, 10.0, 0.0])
+        readings = self.table.lookup(positions, angles)
+        for position, angle, reading in zip(positions, angles, readings):
+            self.assertEqual(list(reading), self.table.sensor_data(Vector2D(*position), angle))
+        self.assertEqual(list(readings[3]), [1.0] * 5)
+
+    def test_resolution_has_to_divide_full_turn(self):
+        with self.assertRaises(ValueError):
+            SensorTable.from_track(Track.from_grid([[0]]), angle_resolution_degrees=7)
+
+
+class TestTrack(unittest.TestCase):
+
+    def test_matches_track_data(self):
+        from physics_2d import load_track_data_from_image
+
+        track_data = load_track_data_from_image('tracks/1.png')
+        track = Track.from_image('tracks/1.png')
+        self.assertEqual(track.grid().tolist(), track_data)
+        self.assertEqual(Track.from_track_data(track_data).grid().tolist(), track_data)
+        self.assertLess(track.nbytes, 500 * 500 / 7)
+
+    def test_out_of_bounds_is_wall(self):
+        track = Track.from_grid([[0, 0, 0], [0, 1, 0]])
+        self.assertFalse(track.is_wall(0, 0))
+        self.assertTrue(track.is_wall(1, 1))
+        self.assertTrue(track.is_wall(-1, 0))
+        self.assertTrue(track.is_wall(0, -1))
+        self.assertTrue(track.is_wall(3, 0))
+        self.assertTrue(track.is_wall(0, 2))
+
+    def test_vectorized_queries_match_scalar(self):
+        random.seed(9)
+        track = Track.from_grid(np.array([[random.random() > 0.6 for _ in range(0, 13)] for _ in range(0, 7)]))
+        cells_x = np.array([random.randint(-3, 15) for _ in range(0, 200)])
+        cells_y = np.array([random.randint(-3, 9) for _ in range(0, 200)])
+        self.assertEqual(
+            track.walls(cells_x, cells_y).tolist(),
+            [track.is_wall(int(x), int(y)) for x, y in zip(cells_x, cells_y)]
+        )
+
+        positions = np.stack([cells_x * 0.1 + 0.05, cells_y * 0.1 + 0.05], axis=1)
+        self.assertEqual(track.walls_at(positions).tolist(), track.walls(cells_x, cells_y).tolist())
+
+
+class TestDistanceField(unittest.TestCase):
+
+    def setUp(self):
+        # a U shaped corridor, the goal at the end of the right arm is close
+        # to the start in a straight line but not along the track
+        self.track = Track.from_grid([
+            [0, 0, 0, 0, 0],
+            [0, 1, 1, 1, 0],
+            [0, 1, 1, 1, 0],
+            [0, 1, 0, 1, 0],
+        ], track_granularity_m=1.0)
+        self.field = DistanceField.from_track(self.track, goal=(4.5, 3.5))
+
+    def position(self, x, y):
+        from physics_2d import Vector2D
+        return Vector2D(x, y)
+
+    def test_follows_the_corridor(self):
+        self.assertEqual(self.field.goal_cell, (4, 3))
+        self.assertEqual(self.field.distance_at(self.position(4.5, 3.5)), 0.0)
+        self.assertEqual(self.field.distance_at(self.position(4.5, 0.5)), 3.0)
+        # four cells away in a straight line, ten along the corridor
+        self.assertEqual(self.field.distance_at(self.position(0.5, 3.5)), 10.0)
+
+    def test_walls_and_cut_off_cells(self):
+        # the wall next to the left arm keeps the progress of the arm
+        self.assertEqual(self.field.distance_at(self.position(1.5, 2.5)), 9.0)
+        # the pocket in the middle can not reach the goal at all
+        self.assertEqual(self.field.distance_at(self.position(2.5, 3.5)), 11.0)
+        # off the track is the closest edge cell
+        self.assertEqual(self.field.distance_at(self.position(-3.0, 3.5)), 10.0)
+
+    def test_vectorized_lookup(self):
+        positions = [[4.5, 3.5], [0.5, 3.5], [1.5, 2.5], [9.0, -1.0]]
+        self.assertEqual(
+            self.field.distances_at(positions).tolist(),
+            [self.field.distance_at(self.position(x, y)) for x, y in positions]
+        )
+
+    def test_goal_outside_of_the_track(self):
+        field = DistanceField.from_track(self.track)
+        self.assertEqual(field.goal_cell, (4, 3))
+
+
+class TestTrackCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = TrackCache(self.cache_dir)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.cache_dir)
+
+    def test_track_is_decoded_once_and_mapped(self):
+        first = self.cache.load_track('tracks/1.png')
+        files = sorted(os.listdir(self.cache_dir))
+        second = self.cache.load_track('tracks/1.png')
+
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), files)
+        self.assertIsInstance(second.bits, np.memmap)
+        self.assertEqual(second.grid().tolist(), Track.from_image('tracks/1.png').grid().tolist())
+        self.assertEqual(first.key, image_hash('tracks/1.png'))
+
+    def test_cached_track_pickles_as_file_name(self):
+        track = self.cache.load_track('tracks/1.png')
+        payload = pickle.dumps(track)
+        self.assertLess(len(payload), 1000)
+
+        restored = pickle.loads(payload)
+        self.assertIsInstance(restored.bits, np.memmap)
+        self.assertEqual(restored.is_wall(20, 40), track.is_wall(20, 40))
+        self.assertEqual(restored.is_wall(400, 400), track.is_wall(400, 400))
+
+        # tracks that are not cached carry their bits
+        in_memory = pickle.loads(pickle.dumps(Track.from_grid([[0, 1]])))
+        self.assertTrue(in_memory.is_wall(1, 0))
+
+    def test_sensor_table(self):
+        table = self.cache.load_sensor_table('tracks/1.png', angle_resolution_degrees=45)
+        expected = SensorTable.from_track(Track.from_image('tracks/1.png'), angle_resolution_degrees=45)
+        self.assertEqual(table.distances.tolist(), expected.distances.tolist())
+        self.assertLess(len(pickle.dumps(table)), 1000)
+
+        restored = pickle.loads(pickle.dumps(table))
+        self.assertEqual(restored.lookup([[2.0, 4.0]], [0.0]).tolist(), table.lookup([[2.0, 4.0]], [0.0]).tolist())
+
+    def test_sensor_table_per_granularity(self):
+        table = self.cache.load_sensor_table('tracks/1.png', angle_resolution_degrees=45)
+        coarse = self.cache.load_sensor_table('tracks/1.png', angle_resolution_degrees=45, track_granularity_m=0.2)
+        expected = SensorTable.from_track(Track.from_image('tracks/1.png', track_granularity_m=0.2), angle_resolution_degrees=45)
+        self.assertNotEqual(coarse.cache_path, table.cache_path)
+        self.assertEqual(coarse.distances.tolist(), expected.distances.tolist())
+        self.assertNotEqual(coarse.distances.tolist(), table.distances.tolist())
+
+    def test_distance_field(self):
+        field = self.cache.load_distance_field('tracks/1.png')
+        files = sorted(os.listdir(self.cache_dir))
+        self.assertEqual(self.cache.load_distance_field('tracks/1.png').distances.tolist(), field.distances.tolist())
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), files)
+
+        expected = DistanceField.from_track(Track.from_image('tracks/1.png'))
+        self.assertEqual(field.distances.tolist(), expected.distances.tolist())
+        self.assertLess(len(pickle.dumps(field)), 1000)
+
+    def test_distance_field_per_granularity(self):
+        # both goals fall in cell (200, 400)
+        field = self.cache.load_distance_field('tracks/1.png', goal=(20, 40))
+        coarse = self.cache.load_distance_field('tracks/1.png', goal=(40, 80), track_granularity_m=0.2)
+        expected = DistanceField.from_track(Track.from_image('tracks/1.png', track_granularity_m=0.2), goal=(40, 80))
+        self.assertEqual(coarse.goal_cell, field.goal_cell)
+        self.assertNotEqual(coarse.cache_path, field.cache_path)
+        self.assertEqual(coarse.distances.tolist(), expected.distances.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()